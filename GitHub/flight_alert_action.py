@@ -1,15 +1,24 @@
 import json
 import os
+import random
 import time
 import logging
+from datetime import datetime
 from typing import Dict
 import sys
-import smtplib
-from email.mime.text import MIMEText
-from email.header import Header
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import requests
 
+# 复用仓库根目录下的公共模块（工作流在 GitHub 目录下运行本脚本）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flight_detect import ChangeDetector, detect_calendar  # noqa: E402
+from flight_limiter import CircuitOpenError  # noqa: E402
+from flight_mailer import close_shared_mailers  # noqa: E402
+from flight_notifiers import build_notifiers  # noqa: E402
+from flight_transport import build_params, get_shared_transport  # noqa: E402
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -21,18 +30,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # 常量定义
-BASE_URL = "https://flights.ctrip.com/itinerary/api/12808/lowestPrice?"
-RETRY_DELAY = 5  # 重试等待时间（秒）
+RETRY_DELAY = 5  # 首次重试等待时间（秒），之后按指数退避
 REQUEST_TIMEOUT = 30  # 请求超时时间（秒）
 MAX_RETRIES = 3  # 最大重试次数
-HISTORY_FILE = "price_history.json"
-
-# 请求头，模拟浏览器以避免被拦截
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Referer": "https://flights.ctrip.com/online/list/oneway",
-    "Accept": "application/json, text/plain, */*",
-}
+HISTORY_FILE = "price_history.json"  # 价格快照
+JOURNAL_FILE = "price_history.journal"  # 快照之后的价格变化，每行一条
+COMPACT_THRESHOLD = 500  # 变化日志达到多少条后合并进快照
+HISTORY_KINDS = ("target_prices", "no_target_prices")
+ACTION_ROUTE = "action"  # 变化检测器中的航线标识，本脚本只监控一条航线
+DEFAULT_TIMEZONE = "Asia/Shanghai"  # 出发日期所在的时区，过期日期按该时区的今天判断
 
 # 机场代码到城市名称的映射
 AIRPORT_CITY_MAP = {
@@ -292,37 +298,20 @@ def get_readable_location(airport_code: str) -> str:
     return AIRPORT_CITY_MAP.get(airport_code, airport_code)
 
 
-def send_email(message: str, config: dict) -> bool:
-    sender = config.get("email_sender")
-    password = config.get("email_password")
-    receiver = config.get("email_receiver")
-    smtp_server = config.get("smtp_server")
-    smtp_port = config.get("smtp_port", 465)
-
-    if not all([sender, password, receiver, smtp_server]):
-        logger.warning("邮件配置不完整，跳过发送")
-        return False
-
+def send_notification(message: str, config: dict) -> bool:
+    """通过所有已配置的渠道（邮件、Pushplus、Webhook）并发发送通知"""
+    channels = build_notifiers(config)
     try:
-        msg = MIMEText(message, "plain", "utf-8")
-        msg["From"] = sender
-        msg["To"] = receiver
-        msg["Subject"] = Header("航班价格提醒", "utf-8")
-
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-        else:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-
-        server.login(sender, password)
-        server.sendmail(sender, [receiver], msg.as_string())
-        server.quit()
-        logger.info(f"邮件发送成功: {message}")
-        return True
-    except Exception as e:
-        logger.error(f"邮件发送失败: {e}")
+        if not len(channels):
+            logger.warning("通知配置不完整，跳过发送")
+            return False
+        if channels.send(message):
+            logger.info(f"通知发送成功: {message}")
+            return True
         return False
+    finally:
+        channels.close()
+        close_shared_mailers()
 
 
 def load_config_from_env() -> dict:
@@ -346,6 +335,10 @@ def load_config_from_env() -> dict:
             "email_receiver": os.environ.get("EMAIL_RECEIVER"),
             "smtp_server": os.environ.get("SMTP_SERVER", "smtp.qq.com"),
             "smtp_port": int(os.environ.get("SMTP_PORT", "465")),
+            "SCKEY": os.environ.get("PUSHPLUS_TOKEN"),
+            "webhookUrl": os.environ.get("WEBHOOK_URL"),
+            # 未设置的 Secret 在工作流中是空字符串
+            "timezone": os.environ.get("TIMEZONE") or DEFAULT_TIMEZONE,
         }
 
         logger.info("从环境变量加载配置成功")
@@ -356,60 +349,137 @@ def load_config_from_env() -> dict:
 
 
 def load_history() -> Dict[str, Dict[str, int]]:
-    """加载历史价格数据"""
+    """加载历史价格数据：读取快照后按顺序重放变化日志"""
+    history = {kind: {} for kind in HISTORY_KINDS}
     if os.path.exists(HISTORY_FILE):
         try:
             with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+                history.update(json.load(f))
         except Exception as e:
             logger.error(f"加载历史数据失败: {e}")
-    return {"target_prices": {}, "no_target_prices": {}}
+
+    if os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    _, kind, date, price = json.loads(line)
+                    history.setdefault(kind, {})[date] = price
+                except (ValueError, TypeError) as e:
+                    # 上次写入被中断时最后一行可能不完整
+                    logger.warning(f"跳过损坏的变化日志第 {line_no} 行: {e}")
+    return history
+
+
+def _journal_needs_newline() -> bool:
+    """日志末尾是否是被中断的不完整行"""
+    if not os.path.exists(JOURNAL_FILE) or os.path.getsize(JOURNAL_FILE) == 0:
+        return False
+    with open(JOURNAL_FILE, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
 
 
-def save_history(history: Dict[str, Dict[str, int]]):
-    """保存历史价格数据"""
+def _count_journal_entries() -> int:
+    if not os.path.exists(JOURNAL_FILE):
+        return 0
+    with open(JOURNAL_FILE, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _local_today(timezone: str) -> str:
+    """出发日期所在时区的今天（Actions 运行器的本地时间是 UTC）"""
+    try:
+        return datetime.now(ZoneInfo(timezone)).strftime("%Y%m%d")
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"未知的时区 {timezone}，按运行器本地时间判断过期日期")
+        return time.strftime("%Y%m%d")
+
+
+def compact_history(
+    history: Dict[str, Dict[str, int]], timezone: str = DEFAULT_TIMEZONE
+):
+    """把当前状态写成新快照并清空变化日志，同时删除已经过去的出发日期
+
+    先原子替换快照再清空日志；两步之间中断时，重放旧日志得到的结果不变。
+
+    Args:
+        history: 当前的价格状态
+        timezone: 出发日期所在的时区
+    """
+    today = _local_today(timezone)
+    snapshot = {
+        kind: {
+            date: price
+            for date, price in sorted(history.get(kind, {}).items())
+            if date >= today
+        }
+        for kind in HISTORY_KINDS
+    }
+    tmp_file = f"{HISTORY_FILE}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(tmp_file, HISTORY_FILE)
+    open(JOURNAL_FILE, "w", encoding="utf-8").close()
+
+    dropped = sum(
+        len(history.get(kind, {})) - len(snapshot[kind]) for kind in HISTORY_KINDS
+    )
+    logger.info(f"历史数据已合并为快照，删除 {dropped} 条过期日期")
+
+
+def save_history(
+    history: Dict[str, Dict[str, int]],
+    baseline: Dict[str, Dict[str, int]],
+    timezone: str = DEFAULT_TIMEZONE,
+):
+    """保存历史价格数据：只把相对 baseline 有变化的价格追加到变化日志
+
+    Args:
+        history: 本轮结束时的价格状态
+        baseline: 本轮开始时 load_history 得到的价格状态
+        timezone: 出发日期所在的时区，合并快照时用于删除过期日期
+    """
     try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
+        now = int(time.time())
+        lines = [
+            json.dumps([now, kind, date, price], separators=(",", ":")) + "\n"
+            for kind in HISTORY_KINDS
+            for date, price in history.get(kind, {}).items()
+            if price != baseline.get(kind, {}).get(date, 0)
+        ]
+        if not lines:
+            # 没有变化时不创建或修改日志文件，工作流也就没有需要提交的内容
+            return
+        logger.info(f"记录 {len(lines)} 条价格变化")
+        if _journal_needs_newline():
+            lines.insert(0, "\n")
+        with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+        if _count_journal_entries() >= COMPACT_THRESHOLD:
+            compact_history(history, timezone)
     except Exception as e:
         logger.error(f"保存历史数据失败: {e}")
 
 
 def fetch_flight_prices(config: dict, direct: bool = True) -> dict:
-    flight_way = config["flightWay"]
-    if flight_way.lower() == "oneway":
-        flight_way = "Oneway"
-    elif flight_way.lower() == "roundtrip":
-        flight_way = "Roundtrip"
-
-    params = {
-        "flightWay": flight_way,
-        "dcity": config["placeFrom"].upper(),
-        "acity": config["placeTo"].upper(),
-        "army": "false",
-        "classType": "ALL",
-        "quantity": "1",
-    }
-
-    if direct:
-        params["direct"] = "true"
+    params = build_params(config, direct)
+    transport = get_shared_transport(timeout=REQUEST_TIMEOUT)
 
     for attempt in range(MAX_RETRIES):
         try:
-            response = requests.get(
-                BASE_URL, params=params, headers=HEADERS, timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("status") == 2:
-                raise ValueError(f"API返回错误状态: {data.get('msg', '未知错误')}")
-
-            return data
+            return transport.get(params)
+        except CircuitOpenError as e:
+            # 接口已熔断，所有请求都会被拒绝，不再消耗重试次数
+            logger.error(f"获取{'直飞' if direct else '非直飞'}航班价格失败: {e}")
+            raise
         except (requests.exceptions.RequestException, ValueError) as e:
             if attempt < MAX_RETRIES - 1:
-                logger.warning(f"获取{'直飞' if direct else '非直飞'}航班价格失败 (尝试 {attempt + 1}/{MAX_RETRIES}): {e}. {RETRY_DELAY}秒后重试...")
-                time.sleep(RETRY_DELAY)
+                delay = random.uniform(RETRY_DELAY, RETRY_DELAY * 2 ** (attempt + 1))
+                logger.warning(f"获取{'直飞' if direct else '非直飞'}航班价格失败 (尝试 {attempt + 1}/{MAX_RETRIES}): {e}. {delay:.1f}秒后重试...")
+                time.sleep(delay)
             else:
                 logger.error(f"获取{'直飞' if direct else '非直飞'}航班价格最终失败: {e}")
                 raise
@@ -419,6 +489,7 @@ def main():
     try:
         config = load_config_from_env()
         history = load_history()
+        baseline = {kind: dict(history.get(kind, {})) for kind in HISTORY_KINDS}
 
         # 确保历史数据中有当前日期的键
         target_prices = history.get("target_prices", {})
@@ -457,62 +528,52 @@ def main():
 
         notification_messages = []
 
-        for date in config["dateToGo"]:
-            direct_price = direct_results.get(date)
-            non_direct_price = non_direct_results.get(date)
-
-            if direct_price is None and non_direct_price is None:
-                continue
-
-            formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
-
-            # 检查直飞价格
-            if direct_price:
-                last_price = target_prices.get(date, 0)
-                if last_price == 0:
-                    logger.info(f"首次记录 {formatted_date} 直飞价格: ¥{direct_price}")
-                    notification_messages.append(
-                        f"首次记录: {formatted_date} 直飞价格 ¥{direct_price}"
-                    )
-                    target_prices[date] = direct_price
-                elif abs(direct_price - last_price) >= config["priceStep"]:
-                    change_text = "上涨" if direct_price > last_price else "下降"
-                    diff = abs(direct_price - last_price)
-                    msg = f"{formatted_date} 直飞价格{change_text} ¥{diff} (¥{last_price} → ¥{direct_price})"
-                    logger.info(msg)
-                    notification_messages.append(msg)
-                    target_prices[date] = direct_price
-
-            # 检查非直飞价格
-            if non_direct_price:
-                last_price = no_target_prices.get(date, 0)
-                if last_price == 0:
-                    logger.info(
-                        f"首次记录 {formatted_date} 非直飞价格: ¥{non_direct_price}"
-                    )
-                    notification_messages.append(
-                        f"首次记录: {formatted_date} 非直飞价格 ¥{non_direct_price}"
-                    )
-                    no_target_prices[date] = non_direct_price
-                elif abs(non_direct_price - last_price) >= config["priceStep"]:
-                    change_text = "上涨" if non_direct_price > last_price else "下降"
-                    diff = abs(non_direct_price - last_price)
-                    msg = f"{formatted_date} 非直飞价格{change_text} ¥{diff} (¥{last_price} → ¥{non_direct_price})"
-                    logger.info(msg)
-                    notification_messages.append(msg)
-                    no_target_prices[date] = non_direct_price
+        # 与命令行版本共用 ChangeDetector 的判断规则，基准价格来自历史数据
+        detector = ChangeDetector()
+        for direct, targets in ((True, target_prices), (False, no_target_prices)):
+            for date, price in targets.items():
+                series = (ACTION_ROUTE, date, direct)
+                detector.watch(series, config["priceStep"])
+                detector.set_baseline(series, price)
+
+        for change in detect_calendar(
+            detector,
+            ACTION_ROUTE,
+            config["dateToGo"],
+            direct_results,
+            non_direct_results,
+            config["priceStep"],
+        ):
+            formatted_date = f"{change.date[:4]}-{change.date[4:6]}-{change.date[6:]}"
+            kind = "直飞" if change.direct else "非直飞"
+            if not change.baseline:
+                logger.info(f"首次记录 {formatted_date} {kind}价格: ¥{change.price}")
+                notification_messages.append(
+                    f"首次记录: {formatted_date} {kind}价格 ¥{change.price}"
+                )
+            else:
+                diff = abs(change.price - change.baseline)
+                change_text = "上涨" if change.price > change.baseline else "下降"
+                msg = (
+                    f"{formatted_date} {kind}价格{change_text} ¥{diff} "
+                    f"(¥{change.baseline} → ¥{change.price})"
+                )
+                logger.info(msg)
+                notification_messages.append(msg)
+            targets = target_prices if change.direct else no_target_prices
+            targets[change.date] = change.price
 
         # 发送通知
         if notification_messages:
             full_message = "\n".join(notification_messages)
-            send_email(full_message, config)
+            send_notification(full_message, config)
         else:
             logger.info("价格无显著变化，不发送通知")
 
         # 保存历史数据
         history["target_prices"] = target_prices
         history["no_target_prices"] = no_target_prices
-        save_history(history)
+        save_history(history, baseline, config["timezone"])
 
     except Exception as e:
         logger.error(f"程序运行出错: {e}", exc_info=True)
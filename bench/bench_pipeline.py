@@ -0,0 +1,323 @@
+"""价格对比流程的离线性能基准
+
+用合成的低价日历和监控规模（默认 1、100、10000 条航线 × 365 个日期）测量
+flight_alert.py 的 解析 → 对比 → 生成通知 流程，不访问网络：
+- parse：解码接口返回的 JSON 文本并用 parse_price_calendar 取出价格日历；
+- compare：按监控编号收集价格并用 ChangeDetector 批量对比（第二轮查询，部分价格变化）；
+- format：为变化的格子生成提醒并拼成汇总通知；
+- cycle：FlightMonitor.run_cycle 完整的一轮（抓取替换为合成数据）。
+
+结果以 JSON 写入 --output，并与 --baseline 中保存的基准对比，
+任何阶段变慢超过 --tolerance 时列出并以退出码 1 结束。基准是绝对耗时，
+只在同一台机器上有意义：每台机器用 --update-baseline 记录自己的基准（不提交到仓库），
+基准的平台或 Python 版本与本次不同时跳过对比。
+
+用法：
+    python bench/bench_pipeline.py
+    python bench/bench_pipeline.py --sizes 1,100 --dates 30 --repeat 5
+    python bench/bench_pipeline.py --update-baseline
+"""
+
+import argparse
+import array
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+
+# 在导入 flight_alert 之前配置日志，只输出警告，逐条价格日志不计入耗时
+logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flight_alert import (  # noqa: E402
+    FlightMonitor,
+    _make_alert,
+    get_route_key,
+    parse_price_calendar,
+)
+from flight_detect import np  # noqa: E402
+from flight_mailer import build_digest  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_SIZES = "1,100,10000"
+DEFAULT_DATES = 365
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25  # 比基准慢超过该比例视为退化
+NOISE_FLOOR = 0.002  # 差距小于该秒数时不视为退化
+PRICE_STEP = 50
+CHANGE_RATE = 0.05  # 第二轮查询中价格变化超过 priceStep 的格子比例
+START_DATE = date(2099, 1, 1)  # 合成日期从这里开始，保证都在未来
+
+Payloads = Dict[Tuple[str, bool], str]
+
+
+def build_config(routes: int, dates: int) -> dict:
+    """生成合成的监控配置"""
+    return {
+        "dateToGo": [
+            (START_DATE + timedelta(days=i)).strftime("%Y%m%d") for i in range(dates)
+        ],
+        "flightWay": "Oneway",
+        "sleepTime": 600,
+        "priceStep": PRICE_STEP,
+        "routes": [
+            {"placeFrom": f"A{i:05d}", "placeTo": f"B{i:05d}"} for i in range(routes)
+        ],
+    }
+
+
+def build_payloads(
+    config: dict, rng: random.Random, previous: Dict[Tuple[str, bool], List[int]]
+) -> Tuple[Payloads, Dict[Tuple[str, bool], List[int]]]:
+    """生成一轮查询的接口返回文本
+
+    Args:
+        config: build_config 生成的配置
+        rng: 随机数生成器
+        previous: 上一轮各 (航线, 是否直飞) 的价格，为空时生成首轮价格
+
+    Returns:
+        Tuple[Payloads, dict]: (接口返回的 JSON 文本, 本轮价格)
+    """
+    payloads: Payloads = {}
+    prices: Dict[Tuple[str, bool], List[int]] = {}
+    for route in config["routes"]:
+        route_key = get_route_key({**route, "flightWay": config["flightWay"]})
+        for direct in (True, False):
+            last = previous.get((route_key, direct))
+            if last is None:
+                current = [rng.randint(400, 2000) for _ in config["dateToGo"]]
+            else:
+                current = [
+                    price + rng.choice((-2, 2)) * PRICE_STEP
+                    if rng.random() < CHANGE_RATE
+                    else price + rng.randint(-PRICE_STEP // 2, PRICE_STEP // 2)
+                    for price in last
+                ]
+            prices[(route_key, direct)] = current
+            calendar = dict(zip(config["dateToGo"], current))
+            payloads[(route_key, direct)] = json.dumps(
+                {"status": 0, "data": {"oneWayPrice": [calendar]}}
+            )
+    return payloads, prices
+
+
+def stage_parse(payloads: Payloads) -> Dict[Tuple[str, bool], Dict[str, int]]:
+    """解码并解析所有接口返回"""
+    return {
+        key: parse_price_calendar(json.loads(text)) for key, text in payloads.items()
+    }
+
+
+def gather(
+    monitor: FlightMonitor, calendars: Dict[Tuple[str, bool], Dict[str, int]]
+) -> Tuple[List[int], List[int]]:
+    """按 run_cycle 的方式收集监控编号和价格"""
+    watch_ids: List[int] = []
+    prices: List[int] = []
+    for route_key, cells in monitor._watch_ids.items():
+        direct_results = calendars[(route_key, True)]
+        non_direct_results = calendars[(route_key, False)]
+        for date_str, direct_id, non_direct_id in cells:
+            watch_ids.extend((direct_id, non_direct_id))
+            prices.extend(
+                (
+                    direct_results.get(date_str) or 0,
+                    non_direct_results.get(date_str) or 0,
+                )
+            )
+    return watch_ids, prices
+
+
+def best_of(
+    repeat: int, setup: Callable[[], object], run: Callable[[object], object]
+) -> Tuple[float, object]:
+    """重复执行取最短耗时，每次执行前调用 setup 准备状态（不计时）
+
+    Returns:
+        Tuple[float, object]: (最短耗时秒数, 最后一次的结果)
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = run(state)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_size(routes: int, dates: int, repeat: int, seed: int) -> dict:
+    """测量一种监控规模
+
+    Returns:
+        dict: 各阶段的最短耗时（秒）以及格子数、提醒数
+    """
+    rng = random.Random(seed)
+    config = build_config(routes, dates)
+    monitor = FlightMonitor(config)
+    try:
+        first_payloads, first_prices = build_payloads(config, rng, {})
+        payloads, _ = build_payloads(config, rng, first_prices)
+        # 首轮价格只用于恢复状态，保存为紧凑数组，释放其余中间数据
+        first_cycle = tuple(
+            array.array("q", values)
+            for values in gather(monitor, stage_parse(first_payloads))
+        )
+        del first_payloads, first_prices
+
+        results: Dict[str, float] = {}
+        results["parse"], calendars = best_of(
+            repeat, lambda: None, lambda _: stage_parse(payloads)
+        )
+        detector = monitor.detector
+
+        def restore() -> None:
+            # 基准价格只在变化超过阈值时刷新，重新对比首轮价格即可恢复首轮之后的状态
+            detector.detect(*first_cycle)
+
+        results["compare"], changes = best_of(
+            repeat, restore, lambda _: detector.detect(*gather(monitor, calendars))
+        )
+
+        def format_alerts(_) -> str:
+            messages = []
+            for change in changes:
+                route_key, date_str, direct = detector.series(change.watch_id)
+                alert = _make_alert(
+                    route_key, date_str, direct, change.price, change.baseline
+                )
+                messages.append(f"[{route_key}] {alert.message}")
+            return build_digest(messages)
+
+        results["format"], _ = best_of(repeat, lambda: None, format_alerts)
+        del calendars, changes
+
+        # 完整的一轮：抓取替换为解码合成数据，与接口返回后的处理一致
+        routes = list(monitor.routes.values())
+        monitor.engine.fetch_all = lambda due: (
+            {key: json.loads(text) for key, text in payloads.items()},
+            {},
+        )
+        results["cycle"], (alerts, _) = best_of(
+            repeat, restore, lambda _: monitor.run_cycle(routes)
+        )
+        results["cells"] = len(detector)
+        results["alerts"] = len(alerts)
+    finally:
+        monitor.close()
+    return results
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """与基准对比，返回退化的阶段说明"""
+    regressions = []
+    for size, stages in current["results"].items():
+        reference = baseline.get("results", {}).get(size)
+        if not reference:
+            continue
+        for stage in ("parse", "compare", "format", "cycle"):
+            if stage not in stages or stage not in reference:
+                continue
+            now, before = stages[stage], reference[stage]
+            if now > before * (1 + tolerance) and now - before > NOISE_FLOOR:
+                regressions.append(
+                    f"{size} 条航线 {stage}: {before * 1000:.1f}ms → "
+                    f"{now * 1000:.1f}ms (+{(now / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="价格对比流程的离线性能基准")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="航线数，逗号分隔")
+    parser.add_argument(
+        "--dates", type=int, default=DEFAULT_DATES, help="每条航线的日期数"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="每个阶段重复次数"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基准文件")
+    parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的变慢比例"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="把本次结果保存为新的基准"
+    )
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__ if np is not None else None,
+            "platform": platform.platform(),
+            "dates": args.dates,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "change_rate": CHANGE_RATE,
+        },
+        "results": {},
+    }
+    for size in (int(value) for value in args.sizes.split(",")):
+        stages = bench_size(size, args.dates, args.repeat, args.seed)
+        report["results"][str(size)] = stages
+        print(
+            f"{size:>6} 条航线 × {args.dates} 天 ({stages['cells']} 格, "
+            f"{stages['alerts']} 条提醒): "
+            + ", ".join(
+                f"{stage} {stages[stage] * 1000:.1f}ms"
+                for stage in ("parse", "compare", "format", "cycle")
+            )
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基准已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"基准文件不存在: {args.baseline}，使用 --update-baseline 创建")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("dates") != args.dates:
+        print("基准的日期数与本次不同，跳过对比")
+        return 0
+    for field in ("platform", "python"):
+        recorded = baseline.get("meta", {}).get(field)
+        if recorded != report["meta"][field]:
+            print(
+                f"基准记录于其他环境（{field}: {recorded}），跳过对比；"
+                "使用 --update-baseline 记录本机的基准"
+            )
+            return 0
+    regressions = compare_with_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print("性能退化:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("与基准相比没有退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
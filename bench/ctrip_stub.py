@@ -0,0 +1,334 @@
+"""本地的携程 lowestPrice 模拟接口
+
+提供与 BASE_URL 相同路径的 HTTP 接口，按 dcity、acity、direct、flightWay 参数
+返回 data.oneWayPrice 价格日历，用于在不访问 flights.ctrip.com 的情况下测试监控的
+吞吐和行为：
+- 每个 (出发地, 目的地, 航程类型, 是否直飞) 有独立的价格随机游走，每次请求时
+  一部分日期的价格按比例随机涨跌；指定时钟时改为每经过 step_seconds 秒游走一步，
+  价格变化与查询频率无关；
+- 可以设置响应延迟、HTTP 500 错误率、status == 2（请求过于频繁）的比例，
+  以及返回离谱价格的比例；
+- GET /stats 返回各类响应的计数。
+
+用法：
+    python bench/ctrip_stub.py --port 8808 --latency 0.05 --error-rate 0.01
+然后在 config.json 中设置
+    "baseUrl": "http://127.0.0.1:8808/itinerary/api/12808/lowestPrice?"
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+API_PATH = "/itinerary/api/12808/lowestPrice"
+DEFAULT_DAYS = 365  # 日历覆盖的天数
+DEFAULT_CHANGE_RATE = 0.02  # 随机游走每一步中价格变化的日期比例
+DEFAULT_VOLATILITY = 0.1  # 每次变化的幅度（相对当前价格的标准差）
+DEFAULT_STEP_SECONDS = 600  # 指定时钟时随机游走每一步的时长（秒）
+MIN_PRICE = 150
+MAX_PRICE = 8000
+
+SeriesKey = Tuple[str, str, str, bool]  # (出发地, 目的地, 航程类型, 是否直飞)
+
+
+class StubMarket:
+    """模拟各航线价格日历的随机游走（线程安全）"""
+
+    def __init__(
+        self,
+        days: int = DEFAULT_DAYS,
+        change_rate: float = DEFAULT_CHANGE_RATE,
+        volatility: float = DEFAULT_VOLATILITY,
+        glitch_rate: float = 0.0,
+        start: Optional[date] = None,
+        seed: int = 0,
+        clock: Optional[Callable[[], float]] = None,
+        step_seconds: float = DEFAULT_STEP_SECONDS,
+    ):
+        """
+        Args:
+            days: 日历覆盖的天数
+            change_rate: 随机游走每一步中价格变化的日期比例
+            volatility: 每次变化的幅度（相对当前价格的标准差）
+            glitch_rate: 每个日期返回离谱价格（¥1 或十倍价格）的概率
+            start: 日历的第一天，默认今天
+            seed: 随机数种子
+            clock: 时钟函数，None 表示每次请求游走一步
+            step_seconds: 指定时钟时随机游走每一步的时长（秒）
+        """
+        self.days = days
+        self.change_rate = change_rate
+        self.volatility = volatility
+        self.glitch_rate = glitch_rate
+        start = start or date.today()
+        self.dates = [
+            (start + timedelta(days=i)).strftime("%Y%m%d") for i in range(days)
+        ]
+        self.seed = seed
+        self.clock = clock
+        self.step_seconds = step_seconds
+        self._series: Dict[SeriesKey, List[int]] = {}
+        self._advanced: Dict[SeriesKey, float] = {}  # 各航线已经游走到的时间
+        self._lock = threading.Lock()
+
+    def _initial(self, key: SeriesKey) -> List[int]:
+        # 同一航线的初始价格只取决于种子和航线，重启后保持一致
+        rng = random.Random(zlib.crc32(repr((self.seed, key[:3])).encode()))
+        base = rng.randint(400, 2000)
+        if not key[3]:
+            base = int(base * 0.8)  # 非直飞通常更便宜
+        return [max(MIN_PRICE, int(base * rng.uniform(0.7, 1.4))) for _ in self.dates]
+
+    def _step(self, prices: List[int], rng: random.Random) -> None:
+        changes = min(
+            self.days,
+            max(0, round(rng.gauss(1, 0.5) * self.change_rate * self.days)),
+        )
+        for index in rng.sample(range(self.days), changes):
+            step = rng.gauss(0, self.volatility) * prices[index]
+            price = min(MAX_PRICE, max(MIN_PRICE, prices[index] + step))
+            prices[index] = int(price)
+
+    def calendar(self, key: SeriesKey, rng: random.Random) -> Dict[str, int]:
+        """推进随机游走并返回 {日期: 价格}"""
+        with self._lock:
+            prices = self._series.get(key)
+            if prices is None:
+                prices = self._series[key] = self._initial(key)
+            steps = 1
+            if self.clock is not None:
+                now = self.clock()
+                last = self._advanced.setdefault(key, now)
+                steps = int((now - last) // self.step_seconds)
+                self._advanced[key] = last + steps * self.step_seconds
+            for _ in range(steps):
+                self._step(prices, rng)
+            snapshot = list(prices)
+        if self.glitch_rate:
+            for index in range(self.days):
+                if rng.random() < self.glitch_rate:
+                    snapshot[index] = rng.choice((1, snapshot[index] * 10))
+        return dict(zip(self.dates, snapshot))
+
+
+class StubServer(ThreadingHTTPServer):
+    """模拟接口服务器"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        market: StubMarket,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        status2_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            address: 监听地址 (host, port)，端口为 0 时自动选择
+            market: 价格模拟
+            latency: 平均响应延迟（秒）
+            jitter: 延迟的随机波动（秒，均匀分布）
+            error_rate: 返回 HTTP 500 的比例
+            status2_rate: 返回 status == 2 的比例
+            seed: 随机数种子
+        """
+        super().__init__(address, StubHandler)
+        self.market = market
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.status2_rate = status2_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.counts = {"ok": 0, "error": 0, "status2": 0, "bad_request": 0}
+        self.counts_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """可直接作为 baseUrl 使用的接口地址"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}?"
+
+    def count(self, outcome: str) -> None:
+        with self.counts_lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.counts_lock:
+            return dict(self.counts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接，与真实接口一致
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写入，避免延迟确认的等待
+    server: StubServer
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _reply(self, code: int, body: dict) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self) -> None:
+        # 监控在查询前用 HEAD 预热连接
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        server = self.server
+        parts = urlsplit(self.path)
+        if parts.path == "/stats":
+            self._reply(200, server.stats())
+            return
+        if parts.path != API_PATH:
+            server.count("bad_request")
+            self._reply(404, {"status": 1, "msg": "not found"})
+            return
+
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if not params.get("dcity") or not params.get("acity"):
+            server.count("bad_request")
+            self._reply(200, {"status": 1, "msg": "缺少 dcity 或 acity", "data": None})
+            return
+
+        with server.rng_lock:
+            delay = server.latency + server.rng.uniform(0, server.jitter)
+            roll = server.rng.random()
+            rng = random.Random(server.rng.getrandbits(64))
+        if delay > 0:
+            time.sleep(delay)
+
+        if roll < server.error_rate:
+            server.count("error")
+            self._reply(500, {"status": 500, "msg": "Internal Server Error"})
+            return
+        if roll < server.error_rate + server.status2_rate:
+            server.count("status2")
+            self._reply(200, {"status": 2, "msg": "请求过于频繁", "data": None})
+            return
+
+        flight_way = params.get("flightWay", "Oneway")
+        direct = params.get("direct", "false").lower() == "true"
+        key = (params["dcity"].upper(), params["acity"].upper(), flight_way, direct)
+        data = {
+            "oneWayPrice": [server.market.calendar(key, rng)],
+            "backWayPrice": None,
+            "singleToRoundPrice": None,
+        }
+        if flight_way.lower() == "roundtrip":
+            back_key = (key[1], key[0], flight_way, direct)
+            data["backWayPrice"] = [server.market.calendar(back_key, rng)]
+        server.count("ok")
+        self._reply(200, {"data": data, "status": 0, "msg": "success"})
+
+
+def start_server(
+    host: str = "127.0.0.1", port: int = 0, **kwargs
+) -> Tuple[StubServer, threading.Thread]:
+    """在后台线程中启动模拟接口
+
+    Args:
+        host: 监听地址
+        port: 端口，0 表示自动选择
+        **kwargs: StubMarket 和 StubServer 的参数
+
+    Returns:
+        Tuple[StubServer, threading.Thread]: (服务器, 服务线程)，用 server.shutdown() 停止
+    """
+    market_args = {
+        name: kwargs.pop(name)
+        for name in (
+            "days",
+            "change_rate",
+            "volatility",
+            "glitch_rate",
+            "start",
+            "clock",
+            "step_seconds",
+        )
+        if name in kwargs
+    }
+    market = StubMarket(seed=kwargs.get("seed", 0), **market_args)
+    server = StubServer((host, port), market, **kwargs)
+    thread = threading.Thread(
+        target=server.serve_forever, name="ctrip-stub", daemon=True
+    )
+    thread.start()
+    return server, thread
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟接口的命令行参数，供压测脚本复用"""
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="日历天数")
+    parser.add_argument("--latency", type=float, default=0.0, help="平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="HTTP 500 比例")
+    parser.add_argument(
+        "--status2-rate", type=float, default=0.0, help="status == 2 的比例"
+    )
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=DEFAULT_CHANGE_RATE,
+        help="随机游走每一步中价格变化的日期比例",
+    )
+    parser.add_argument(
+        "--volatility", type=float, default=DEFAULT_VOLATILITY, help="价格变化幅度"
+    )
+    parser.add_argument(
+        "--glitch-rate", type=float, default=0.0, help="返回离谱价格的概率"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+
+
+def server_kwargs(args: argparse.Namespace) -> dict:
+    """从命令行参数生成 start_server 的参数"""
+    return {
+        "days": args.days,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "status2_rate": args.status2_rate,
+        "change_rate": args.change_rate,
+        "volatility": args.volatility,
+        "glitch_rate": args.glitch_rate,
+        "seed": args.seed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地的携程 lowestPrice 模拟接口")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8808, help="监听端口")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, thread = start_server(args.host, args.port, **server_kwargs(args))
+    print(f"模拟接口已启动: {server.base_url}")
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"已停止，响应统计: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""端到端压测：让命令行监控通过 baseUrl 查询本地模拟接口
+
+启动 ctrip_stub 模拟接口（或使用 --base-url 指定已经运行的模拟接口），
+用数千条合成航线配置 FlightMonitor，连续执行若干轮 run_cycle，报告：
+- 每轮耗时、请求数和吞吐（请求/秒）；
+- 单次请求耗时的 p50/p90/p99/最大值（客户端测量，包含限流等待）；
+- 失败请求按异常类型的计数，以及模拟接口的响应统计；
+- 各类提醒的数量。
+
+用法：
+    python bench/load_harness.py --routes 2000 --dates 30 --cycles 3 --workers 32
+    python bench/load_harness.py --routes 500 --latency 0.05 --error-rate 0.02 \\
+        --status2-rate 0.01 --output load.json
+
+自动启动的模拟接口与监控在同一进程中运行，会分走一部分 CPU；需要更准确的耗时
+时，先单独运行 python bench/ctrip_stub.py，再用 --base-url 指向它。
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List
+
+# 在导入 flight_alert 之前配置日志，只输出警告
+logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from ctrip_stub import add_arguments, server_kwargs, start_server  # noqa: E402
+from flight_alert import FlightMonitor  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+def build_config(base_url: str, args: argparse.Namespace) -> dict:
+    """生成指向模拟接口的监控配置"""
+    first = date.today() + timedelta(days=1)
+    return {
+        "baseUrl": base_url,
+        "dateToGo": [
+            (first + timedelta(days=i)).strftime("%Y%m%d") for i in range(args.dates)
+        ],
+        "flightWay": "Oneway",
+        "sleepTime": 600,
+        "priceStep": args.price_step,
+        "maxWorkers": args.workers,
+        "poolSize": args.workers,
+        "rateLimit": args.rate,
+        "rateBurst": max(1, int(args.rate)),
+        "cacheTtl": 0,
+        "cacheStaleTtl": 0,
+        "cacheMaxEntries": args.routes * 2,
+        "routes": [
+            {"placeFrom": f"S{i:04d}", "placeTo": f"T{i:04d}"}
+            for i in range(args.routes)
+        ],
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """已排序列表的 q 分位（最近秩）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run(args: argparse.Namespace) -> dict:
+    """执行压测并返回报告"""
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, _ = start_server(**server_kwargs(args))
+        base_url = server.base_url
+    print(f"模拟接口: {base_url}")
+
+    monitor = FlightMonitor(build_config(base_url, args))
+    routes = list(monitor.routes.values())
+
+    # 在共享传输层上记录每次请求的耗时和失败原因
+    latencies: List[float] = []
+    failures: Counter = Counter()
+    lock = threading.Lock()
+    original_get = monitor.transport.get
+
+    def timed_get(params: Dict[str, str], timeout=None) -> dict:
+        start = time.perf_counter()
+        try:
+            return original_get(params, timeout)
+        except Exception as e:
+            with lock:
+                failures[type(e).__name__] += 1
+            raise
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    monitor.transport.get = timed_get
+
+    cycles = []
+    alert_kinds: Counter = Counter()
+    try:
+        for index in range(args.cycles):
+            requests_before = len(latencies)
+            start = time.perf_counter()
+            alerts, ok_routes = monitor.run_cycle(routes)
+            elapsed = time.perf_counter() - start
+            requests = len(latencies) - requests_before
+            kinds = Counter(alert.kind for alert in alerts)
+            alert_kinds.update(kinds)
+            cycles.append(
+                {
+                    "cycle": index + 1,
+                    "seconds": elapsed,
+                    "requests": requests,
+                    "throughput": requests / elapsed if elapsed else 0.0,
+                    "ok_routes": len(ok_routes),
+                    "alerts": dict(kinds),
+                }
+            )
+            print(
+                f"第 {index + 1} 轮: {elapsed:.2f}s, {requests} 次请求 "
+                f"({requests / elapsed:.0f} 次/秒), 成功航线 "
+                f"{len(ok_routes)}/{len(routes)}, 提醒 {sum(kinds.values())} 条"
+            )
+    finally:
+        monitor.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    ordered = sorted(latencies)
+    total_seconds = sum(cycle["seconds"] for cycle in cycles)
+    report = {
+        "routes": len(routes),
+        "dates": args.dates,
+        "workers": args.workers,
+        "cycles": cycles,
+        "requests": len(latencies),
+        "throughput": len(latencies) / total_seconds if total_seconds else 0.0,
+        "latency": {
+            **{f"p{q}": percentile(ordered, q) for q in PERCENTILES},
+            "max": ordered[-1] if ordered else 0.0,
+        },
+        "failures": dict(failures),
+        "alerts": dict(alert_kinds),
+        "server": server.stats() if server is not None else None,
+    }
+    latency = report["latency"]
+    print(
+        f"合计 {report['requests']} 次请求，平均 {report['throughput']:.0f} 次/秒；"
+        + "耗时 "
+        + ", ".join(f"{name} {value * 1000:.1f}ms" for name, value in latency.items())
+    )
+    print(f"失败: {report['failures'] or '无'}；提醒: {report['alerts']}")
+    if report["server"] is not None:
+        print(f"模拟接口响应: {report['server']}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用本地模拟接口压测命令行监控")
+    parser.add_argument("--routes", type=int, default=1000, help="航线数")
+    parser.add_argument("--dates", type=int, default=30, help="每条航线的日期数")
+    parser.add_argument("--cycles", type=int, default=3, help="查询轮数")
+    parser.add_argument("--workers", type=int, default=32, help="并发请求数")
+    parser.add_argument("--price-step", type=int, default=50, help="priceStep")
+    parser.add_argument(
+        "--rate", type=float, default=1e6, help="每秒请求上限（默认不限流）"
+    )
+    parser.add_argument(
+        "--base-url", default=None, help="已运行的模拟接口地址，不指定时自动启动"
+    )
+    parser.add_argument("--output", default=None, help="把报告写入 JSON 文件")
+    parser.add_argument(
+        "--verbose", action="store_true", help="输出监控的错误日志（默认只看汇总）"
+    )
+    add_arguments(parser)
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""虚拟时钟模拟：几秒内跑完几十天的监控循环
+
+用 flight_clock.VirtualClock 替换 FlightMonitor 的时钟和等待函数，启动按同一时钟
+游走价格的 ctrip_stub 模拟接口，然后调用 monitor.run(until=...) 执行真实的调度、
+重试、自适应频率、提醒合并等逻辑。等待不真正发生，只推进虚拟时间；HTTP 请求仍然
+真实发往本地模拟接口。
+
+抓取只用一个线程，模拟接口和熔断抖动使用固定种子，相同参数的两次运行得到相同的
+事件序列，报告中的 digest 可以用来检查改动是否影响了行为。报告包括：
+- 模拟天数、真实耗时和加速倍数；
+- 查询轮数、请求数、各类提醒数量和通知次数；
+- 模拟接口的响应统计。
+
+用法：
+    python bench/simulate.py --sim-days 30 --routes 3
+    python bench/simulate.py --adaptive --coalesce-window 1800 --error-rate 0.05 \\
+        --output sim.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import List
+
+# 在导入 flight_alert 之前配置日志，只输出警告
+logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from ctrip_stub import (  # noqa: E402
+    DEFAULT_STEP_SECONDS,
+    add_arguments,
+    server_kwargs,
+    start_server,
+)
+from flight_alert import FlightMonitor  # noqa: E402
+from flight_clock import VirtualClock  # noqa: E402
+from flight_limiter import configure_endpoint, get_breaker  # noqa: E402
+
+DAY = 86400
+
+
+def build_config(base_url: str, start: date, args: argparse.Namespace) -> dict:
+    """生成指向模拟接口的监控配置，出发日期都在模拟结束之后"""
+    first = start + timedelta(days=args.sim_days + 1)
+    config = {
+        "baseUrl": base_url,
+        "dateToGo": [
+            (first + timedelta(days=i)).strftime("%Y%m%d") for i in range(args.dates)
+        ],
+        "flightWay": "Oneway",
+        "sleepTime": args.sleep_time,
+        "priceStep": args.price_step,
+        "maxWorkers": 1,  # 单线程抓取，保证请求顺序确定
+        "cacheTtl": 0,  # 缓存的后台刷新在线程池中进行，会打乱顺序
+        "cacheStaleTtl": 0,
+        "routes": [
+            {"placeFrom": f"S{i:03d}", "placeTo": f"T{i:03d}"}
+            for i in range(args.routes)
+        ],
+    }
+    if args.adaptive:
+        config["adaptive"] = True
+    if args.coalesce_window is not None:
+        config["coalesceWindow"] = args.coalesce_window
+    return config
+
+
+def run(args: argparse.Namespace) -> dict:
+    """执行模拟并返回报告"""
+    start_day = datetime.strptime(args.start, "%Y%m%d").date()
+    start = time.mktime(start_day.timetuple())
+    end = start + args.sim_days * DAY
+    clock = VirtualClock(start)
+
+    server, _ = start_server(
+        start=start_day,
+        clock=clock.time,
+        step_seconds=args.step_seconds,
+        **server_kwargs(args),
+    )
+    config = build_config(server.base_url, start_day, args)
+    monitor = FlightMonitor(config, clock=clock.time, sleep=clock.sleep)
+    # 熔断退避的抖动默认不固定种子，这里按相同参数重新配置
+    configure_endpoint(
+        server.base_url, clock=clock.time, sleep=clock.sleep, rng=random.Random(0)
+    )
+    monitor.breaker = get_breaker(server.base_url)
+
+    # 按虚拟时间记录每轮查询和每次通知
+    events: List[list] = []
+    alert_kinds: Counter = Counter()
+    original_run_cycle = monitor.run_cycle
+    original_notify = monitor._notify
+
+    def run_cycle(routes):
+        alerts, ok_routes = original_run_cycle(routes)
+        alert_kinds.update(alert.kind for alert in alerts)
+        events.append(
+            [
+                "cycle",
+                round(clock.time() - start, 3),
+                sorted(route["placeFrom"] for route in routes),
+                sorted(ok_routes),
+                [[alert.route, alert.kind, alert.message] for alert in alerts],
+            ]
+        )
+        return alerts, ok_routes
+
+    def notify(alerts):
+        events.append(["notify", round(clock.time() - start, 3), len(alerts)])
+        original_notify(alerts)
+
+    monitor.run_cycle = run_cycle
+    monitor._notify = notify
+    # 模拟不发送真实通知
+    monitor.notifier.submit = lambda message: True
+
+    wall_start = time.perf_counter()
+    try:
+        monitor.run(until=end)
+    finally:
+        monitor.close()
+        server.shutdown()
+        server.server_close()
+    wall_seconds = time.perf_counter() - wall_start
+
+    simulated = (clock.time() - start) / DAY
+    server_stats = server.stats()
+    digest = hashlib.sha256(
+        json.dumps(events, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    report = {
+        "start": args.start,
+        "simulated_days": simulated,
+        "wall_seconds": wall_seconds,
+        "speedup": simulated * DAY / wall_seconds if wall_seconds else 0.0,
+        "routes": args.routes,
+        "dates": args.dates,
+        "cycles": sum(1 for event in events if event[0] == "cycle"),
+        "requests": sum(server_stats.values()),
+        "alerts": dict(alert_kinds),
+        "notifications": sum(1 for event in events if event[0] == "notify"),
+        "server": server_stats,
+        "digest": digest,
+    }
+    print(
+        f"模拟 {simulated:.1f} 天，真实耗时 {wall_seconds:.2f}s"
+        f"（{report['speedup']:.0f} 倍速）"
+    )
+    print(
+        f"{report['cycles']} 轮查询，{report['requests']} 次请求，"
+        f"{report['notifications']} 次通知；提醒: {report['alerts']}"
+    )
+    print(f"模拟接口响应: {server_stats}")
+    print(f"事件序列 digest: {digest}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用虚拟时钟模拟长时间运行的监控")
+    parser.add_argument("--sim-days", type=int, default=30, help="模拟的天数")
+    parser.add_argument(
+        "--start",
+        default=date.today().strftime("%Y%m%d"),
+        help="模拟开始的日期 YYYYMMDD（默认今天，固定后结果可重现）",
+    )
+    parser.add_argument("--routes", type=int, default=3, help="航线数")
+    parser.add_argument("--dates", type=int, default=14, help="每条航线的日期数")
+    parser.add_argument("--sleep-time", type=int, default=600, help="sleepTime")
+    parser.add_argument("--price-step", type=int, default=50, help="priceStep")
+    parser.add_argument(
+        "--step-seconds",
+        type=float,
+        default=DEFAULT_STEP_SECONDS,
+        help="模拟接口的价格每隔多少秒游走一步",
+    )
+    parser.add_argument("--adaptive", action="store_true", help="启用自适应查询频率")
+    parser.add_argument(
+        "--coalesce-window", type=int, default=None, help="coalesceWindow（秒）"
+    )
+    parser.add_argument("--output", default=None, help="把报告写入 JSON 文件")
+    parser.add_argument(
+        "--verbose", action="store_true", help="输出监控的错误日志（默认只看汇总）"
+    )
+    add_arguments(parser)
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,88 @@
+import argparse
 import json
 import os
 import time
 import logging
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import sys
-import smtplib
-from email.mime.text import MIMEText
-from email.header import Header
 
 import requests
 
+from flight_archive import DEFAULT_MAX_WRITERS, PriceArchive
+from flight_budget import BudgetAllocator
+from flight_cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_STALE_TTL,
+    DEFAULT_TTL,
+    PriceCache,
+    is_stale,
+)
+from flight_cadence import DEFAULT_HORIZON_DAYS, CadencePolicy, active_dates
+from flight_clock import VirtualClock
+from flight_coalesce import DEFAULT_WINDOW, AlertCoalescer
+from flight_detect import ChangeDetector
+from flight_dispatch import DEFAULT_CAPACITY, DEFAULT_WORKERS, NotificationQueue
+from flight_engine import (
+    DEFAULT_MAX_WORKERS,
+    FetchEngine,
+    build_routes,
+    get_route_key,
+)
+from flight_events import PriceAlert
+from flight_limiter import (
+    DEFAULT_BASE_DELAY,
+    DEFAULT_BURST,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_MAX_DELAY,
+    DEFAULT_RATE,
+    configure_endpoint,
+    get_breaker,
+)
+from flight_mailer import (
+    build_digest,
+    close_shared_mailers,
+    get_shared_mailer,
+    parse_recipients,
+)
+from flight_metrics import (
+    DEFAULT_HOST as DEFAULT_METRICS_HOST,
+    MetricsRegistry,
+    MetricsServer,
+    StageTimer,
+    component_metrics,
+)
+from flight_notifiers import build_notifiers
+from flight_outbox import Outbox
+from flight_outlier import (
+    DEFAULT_MIN_DEVIATION,
+    DEFAULT_THRESHOLD,
+    DEFAULT_WINDOW as DEFAULT_OUTLIER_WINDOW,
+    OutlierFilter,
+)
+from flight_replay import (
+    COMPRESSIONS,
+    DEFAULT_COMPRESSION,
+    DEFAULT_SPEED,
+    ResponseRecorder,
+    ResponseReplayer,
+)
+from flight_retention import (
+    DEFAULT_HOURLY_DAYS,
+    DEFAULT_RAW_DAYS,
+    RetentionManager,
+)
+from flight_scheduler import WatchScheduler
+from flight_stats import StatsRules, rules_from_config
+from flight_store import Observation, PriceStore
+from flight_subscriptions import SubscriptionIndex
+from flight_transport import (
+    BASE_URL,
+    DEFAULT_POOL_SIZE,
+    WARMUP_LEAD,
+    build_params,
+    get_shared_transport,
+)
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -22,17 +95,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # 常量定义
-BASE_URL = "https://flights.ctrip.com/itinerary/api/12808/lowestPrice?"
-PUSHPLUS_URL = "https://www.pushplus.plus/send"
 RETRY_DELAY = 30  # 重试等待时间（秒）
-REQUEST_TIMEOUT = 10  # 请求超时时间（秒）
-
-# 请求头，模拟浏览器以避免被拦截
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Referer": "https://flights.ctrip.com/online/list/oneway",
-    "Accept": "application/json, text/plain, */*",
-}
+BUDGET_REALLOCATE_INTERVAL = 600  # 请求预算重新分配的间隔（秒）
+OUTBOX_FLUSH = "outbox-flush"  # 通知队列中表示 "发送发件箱中到期提醒" 的消息
+# 回放时默认去掉的配置：通知渠道和持久化，回放不发出真实通知、不写入正式数据
+REPLAY_NOTIFY_KEYS = (
+    "email_sender",
+    "email_password",
+    "email_receiver",
+    "smtp_server",
+    "SCKEY",
+    "webhookUrl",
+)
+REPLAY_PERSIST_KEYS = ("historyDb", "outboxDb", "archiveDir")
 
 # 机场代码到城市名称的映射
 AIRPORT_CITY_MAP = {
@@ -314,31 +389,14 @@ def send_email(message: str, config: dict) -> bool:
     Returns:
         bool: 发送是否成功
     """
-    sender = config.get("email_sender")
-    password = config.get("email_password")
-    receiver = config.get("email_receiver")
-    smtp_server = config.get("smtp_server")
-    smtp_port = config.get("smtp_port", 465)
-
-    if not all([sender, password, receiver, smtp_server]):
+    mailer = get_shared_mailer(config)
+    recipients = parse_recipients(config.get("email_receiver"))
+    if mailer is None or not recipients:
         logger.warning("邮件配置不完整，跳过发送")
         return False
 
     try:
-        msg = MIMEText(message, "plain", "utf-8")
-        msg["From"] = sender
-        msg["To"] = receiver
-        msg["Subject"] = Header("航班价格提醒", "utf-8")
-
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-        else:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-
-        server.login(sender, password)
-        server.sendmail(sender, [receiver], msg.as_string())
-        server.quit()
+        mailer.send(message, recipients)
         logger.info(f"邮件发送成功: {message}")
         return True
     except Exception as e:
@@ -346,6 +404,31 @@ def send_email(message: str, config: dict) -> bool:
         return False
 
 
+def _validate_dates(dates) -> None:
+    """验证日期列表
+
+    Args:
+        dates: 日期列表
+
+    Raises:
+        ValueError: 日期列表为空或日期格式错误
+    """
+    # 验证日期列表不为空
+    if not dates or not isinstance(dates, list):
+        raise ValueError("dateToGo 必须是一个非空列表")
+
+    # 验证日期格式和有效性
+    from datetime import datetime
+
+    for date in dates:
+        if not isinstance(date, str) or len(date) != 8 or not date.isdigit():
+            raise ValueError(f"日期格式错误: {date}，应为8位数字 (YYYYMMDD)")
+        try:
+            datetime.strptime(date, "%Y%m%d")
+        except ValueError:
+            raise ValueError(f"无效日期: {date}")
+
+
 def load_config() -> dict:
     """加载配置文件
 
@@ -360,15 +443,15 @@ def load_config() -> dict:
         with open(config_path, "r", encoding="utf-8") as f:
             config = json.load(f)
 
-        # 验证必要的配置项
+        # 验证必要的配置项（配置了 routes 时航线字段可放在每条航线里）
         required_fields = [
             "dateToGo",
-            "placeFrom",
-            "placeTo",
             "flightWay",
             "sleepTime",
             "priceStep",
         ]
+        if "routes" not in config:
+            required_fields += ["placeFrom", "placeTo"]
         for field in required_fields:
             if field not in config:
                 raise ValueError(f"配置文件缺少必要字段: {field}")
@@ -385,26 +468,54 @@ def load_config() -> dict:
                 if field not in config:
                     logger.warning(f"邮件配置缺少字段: {field}，将无法发送邮件")
 
-        # 验证日期列表不为空
-        if not config["dateToGo"] or not isinstance(config["dateToGo"], list):
-            raise ValueError("dateToGo 必须是一个非空列表")
-
-        # 验证日期格式和有效性
-        from datetime import datetime
-
-        for date in config["dateToGo"]:
-            if not isinstance(date, str) or len(date) != 8 or not date.isdigit():
-                raise ValueError(f"日期格式错误: {date}，应为8位数字 (YYYYMMDD)")
-            try:
-                datetime.strptime(date, "%Y%m%d")
-            except ValueError:
-                raise ValueError(f"无效日期: {date}")
+        _validate_dates(config["dateToGo"])
+
+        # 验证航线列表
+        if "routes" in config:
+            if not config["routes"] or not isinstance(config["routes"], list):
+                raise ValueError("routes 必须是一个非空列表")
+            for route in config["routes"]:
+                if not isinstance(route, dict):
+                    raise ValueError(f"航线配置格式错误: {route}")
+                for field in ["placeFrom", "placeTo"]:
+                    if field not in route:
+                        raise ValueError(f"航线配置缺少必要字段: {field}")
+                if "dateToGo" in route:
+                    _validate_dates(route["dateToGo"])
+                if "sleepTime" in route and (
+                    not isinstance(route["sleepTime"], int) or route["sleepTime"] <= 0
+                ):
+                    raise ValueError("航线的 sleepTime 必须是正整数")
 
         # 验证数值类型
         if not isinstance(config["sleepTime"], int) or config["sleepTime"] <= 0:
             raise ValueError("sleepTime 必须是正整数")
         if not isinstance(config["priceStep"], int) or config["priceStep"] <= 0:
             raise ValueError("priceStep 必须是正整数")
+        max_workers = config.get("maxWorkers", DEFAULT_MAX_WORKERS)
+        if not isinstance(max_workers, int) or max_workers <= 0:
+            raise ValueError("maxWorkers 必须是正整数")
+        requests_per_hour = config.get("requestsPerHour")
+        if requests_per_hour is not None and (
+            not isinstance(requests_per_hour, int) or requests_per_hour < 2
+        ):
+            raise ValueError("requestsPerHour 必须是不小于2的整数")
+
+        # 验证目标价格订阅
+        for item in config.get("subscriptions", []):
+            if not isinstance(item, dict):
+                raise ValueError(f"订阅配置格式错误: {item}")
+            _validate_dates([item.get("date")])
+            if "below" not in item and "above" not in item:
+                raise ValueError(f"订阅配置缺少 below 或 above: {item}")
+            for field in ("below", "above"):
+                if field in item and (
+                    not isinstance(item[field], int) or item[field] <= 0
+                ):
+                    raise ValueError(f"订阅的 {field} 必须是正整数")
+            for field in ("placeFrom", "placeTo"):
+                if field not in item and field not in config:
+                    raise ValueError(f"订阅配置缺少必要字段: {field}")
 
         logger.info(f"配置加载成功: {config_path}")
         return config
@@ -429,246 +540,997 @@ def fetch_flight_prices(config: dict, direct: bool = True) -> dict:
     Raises:
         requests.exceptions.RequestException: 网络请求失败
     """
-    # 规范化航程类型参数
-    flight_way = config["flightWay"]
-    if flight_way.lower() == "oneway":
-        flight_way = "Oneway"
-    elif flight_way.lower() == "roundtrip":
-        flight_way = "Roundtrip"
-
-    params = {
-        "flightWay": flight_way,
-        "dcity": config["placeFrom"].upper(),
-        "acity": config["placeTo"].upper(),
-        "army": "false",
-        "classType": "ALL",
-        "quantity": "1",
-    }
-
-    if direct:
-        params["direct"] = "true"
+    params = build_params(config, direct)
 
     try:
-        response = requests.get(
-            BASE_URL, params=params, headers=HEADERS, timeout=REQUEST_TIMEOUT
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("status") == 2:
-            raise ValueError(f"API返回错误状态: {data.get('msg', '未知错误')}")
-
-        return data
+        return get_shared_transport(config.get("baseUrl", BASE_URL)).get(params)
     except requests.exceptions.RequestException as e:
         logger.error(f"获取{'直飞' if direct else '非直飞'}航班价格失败: {e}")
         raise
 
 
-def process_price_changes(
-    date: str,
-    direct_price: int,
-    non_direct_price: int,
-    target_prices: Dict[str, int],
-    no_target_prices: Dict[str, int],
-    config: dict,
-) -> None:
-    """处理价格变化并发送通知
+def parse_price_calendar(data: dict) -> Dict[str, int]:
+    """从接口返回数据中解析出 {日期: 价格} 日历
 
     Args:
-        date: 日期
-        direct_price: 直飞价格
-        non_direct_price: 非直飞价格
-        target_prices: 直飞目标价格字典
-        no_target_prices: 非直飞目标价格字典
-        config: 配置信息
+        data: fetch_flight_prices 返回的数据
+
+    Returns:
+        Dict[str, int]: 日期到最低价格的映射，无数据时返回空字典
     """
+    results_list = (data.get("data") or {}).get("oneWayPrice", [])
+    if isinstance(results_list, list) and results_list:
+        return results_list[0] or {}
+    return {}
+
+
+def format_price_line(
+    date: str, direct_price: Optional[int], non_direct_price: Optional[int]
+) -> str:
+    """生成一个日期当前价格的日志文本，如 '2026-01-17 - 直飞: ¥500, 非直飞: 无'"""
     formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
-    logger.info(
-        f"{formatted_date} - 直飞: ¥{direct_price}, 非直飞: ¥{non_direct_price}"
+    d_p_str = f"¥{direct_price}" if direct_price else "无"
+    nd_p_str = f"¥{non_direct_price}" if non_direct_price else "无"
+    return f"{formatted_date} - 直飞: {d_p_str}, 非直飞: {nd_p_str}"
+
+
+def format_alert_message(date: str, direct: bool, price: int, baseline: int) -> str:
+    """生成价格提醒的通知文本
+
+    Args:
+        date: 出发日期
+        direct: 是否直飞
+        price: 当前价格
+        baseline: 基准价格，0 表示首次获取
+
+    Returns:
+        str: 通知文本
+    """
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    kind = "直飞" if direct else "非直飞"
+    if baseline == 0:
+        return f"首次提醒: {formatted_date} 的{kind}价格 ¥{price}"
+    change = price - baseline
+    change_text = "上涨" if change > 0 else "下降"
+    return f"{formatted_date} {kind}价格{change_text} ¥{abs(change)}, 当前价格: ¥{price}"
+
+
+def format_target_message(
+    date: str, direct: bool, price: int, target: int, below: bool, names: List[str]
+) -> str:
+    """生成目标价格提醒的通知文本
+
+    Args:
+        date: 出发日期
+        direct: 是否直飞
+        price: 当前价格
+        target: 目标价格
+        below: 是否为 "低于目标价格" 的订阅
+        names: 订阅者名称
+
+    Returns:
+        str: 通知文本
+    """
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    kind = "直飞" if direct else "非直飞"
+    direction = "降到" if below else "涨到"
+    bound = "以下" if below else "以上"
+    message = (
+        f"{formatted_date} {kind}价格 ¥{price}，已{direction}目标价格 ¥{target} {bound}"
     )
+    names = [name for name in names if name]
+    if names:
+        message += f"（订阅: {'、'.join(names)}）"
+    return message
 
-    if target_prices[date] == 0:
-        # 第一次获取价格
-        logger.info(f"首次获取 {formatted_date} 的票价")
-        send_email(
-            f"首次提醒: {formatted_date} 的直飞价格 ¥{direct_price}, 非直飞价格 ¥{non_direct_price}",
-            config,
+
+def format_rule_message(
+    date: str, direct: bool, price: int, kind: str, reference: int, rules: StatsRules
+) -> str:
+    """生成统计类提醒的通知文本
+
+    Args:
+        date: 出发日期
+        direct: 是否直飞
+        price: 当前价格
+        kind: 规则类型："low"、"percentile" 或 "ewma"
+        reference: 参考价格
+        rules: 规则设置
+
+    Returns:
+        str: 通知文本
+    """
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    prefix = f"{formatted_date} {'直飞' if direct else '非直飞'}价格 ¥{price}"
+    if kind == "low":
+        return f"{prefix}，创历史新低（此前最低 ¥{reference}）"
+    if kind == "percentile":
+        return (
+            f"{prefix}，低于最近 {rules.percentile_days:g} 天的 "
+            f"{rules.percentile:g}% 分位价格 ¥{reference}"
         )
-        target_prices[date] = direct_price
-        no_target_prices[date] = non_direct_price
+    discount = round((1 - price / reference) * 100)
+    return f"{prefix}，比 {rules.ewma_days:g} 天均价 ¥{reference} 低 {discount}%"
+
+
+def _make_alert(
+    route_key: str, date: str, direct: bool, price: int, baseline: int
+) -> PriceAlert:
+    """记录日志并生成一条价格提醒
+
+    Args:
+        route_key: 航线标识
+        date: 出发日期
+        direct: 是否直飞
+        price: 当前价格
+        baseline: 基准价格，0 表示首次获取
+
+    Returns:
+        PriceAlert: 价格提醒
+    """
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    kind = "直飞" if direct else "非直飞"
+    if baseline == 0:
+        logger.info(f"首次获取 {formatted_date} 的{kind}票价")
     else:
-        # 检查直飞价格变化
-        direct_change = direct_price - target_prices[date]
-        if abs(direct_change) >= config["priceStep"]:
-            change_text = "上涨" if direct_change > 0 else "下降"
-            logger.info(
-                f"{formatted_date} 直飞价格{change_text} ¥{abs(direct_change)} "
-                f"(¥{target_prices[date]} → ¥{direct_price})"
+        change = price - baseline
+        change_text = "上涨" if change > 0 else "下降"
+        logger.info(
+            f"{formatted_date} {kind}价格{change_text} ¥{abs(change)} (¥{baseline} → ¥{price})"
+        )
+    message = format_alert_message(date, direct, price, baseline)
+    return PriceAlert(route_key, date, direct, price, baseline, message)
+
+
+def get_route_label(route: dict) -> str:
+    """生成航线的可读名称，如 '上海(虹桥国际机场)(SHA) → 黔江(JIQ)'"""
+    place_from = route["placeFrom"].upper()
+    place_to = route["placeTo"].upper()
+    return (
+        f"{get_readable_location(place_from)}({place_from}) → "
+        f"{get_readable_location(place_to)}({place_to})"
+    )
+
+
+class FlightMonitor:
+    """命令行版本的监控主体：调度各航线、并发抓取、对比价格并发送通知"""
+
+    def __init__(
+        self,
+        config: dict,
+        recorder: Optional[ResponseRecorder] = None,
+        replayer: Optional[ResponseReplayer] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            config: load_config 返回的配置信息
+            recorder: 录制每次接口响应，为 None 时不录制
+            replayer: 用录制的响应代替接口请求，为 None 时访问真实接口
+            clock: 时钟函数，调度、缓存、预算、合并等所有组件共用
+            sleep: 等待函数，可以替换为 flight_clock.VirtualClock 模拟运行
+        """
+        self.config = config
+        self.clock = clock
+        self.sleep = sleep
+        self.recorder = recorder
+        self.replayer = replayer
+        self.routes: Dict[str, dict] = {
+            get_route_key(route): route for route in build_routes(config)
+        }
+
+        # 目标价格按 (航线, 日期, 是否直飞) 编号保存，每轮批量对比
+        self.detector = ChangeDetector()
+        self._watch_ids: Dict[str, List[Tuple[str, int, int]]] = {}
+        for route_key, route in self.routes.items():
+            self._watch_ids[route_key] = [
+                (
+                    date,
+                    self.detector.watch((route_key, date, True), route["priceStep"]),
+                    self.detector.watch((route_key, date, False), route["priceStep"]),
+                )
+                for date in route["dateToGo"]
+            ]
+
+        # 异常值过滤：接口返回的离谱价格等下一次查询确认后才参与对比
+        self.outliers: Optional[OutlierFilter] = None
+        outlier_config = config.get("outlierFilter")
+        if outlier_config:
+            if not isinstance(outlier_config, dict):
+                outlier_config = {}
+            self.outliers = OutlierFilter(
+                window=outlier_config.get("window", DEFAULT_OUTLIER_WINDOW),
+                threshold=outlier_config.get("threshold", DEFAULT_THRESHOLD),
+                min_deviation=outlier_config.get(
+                    "minDeviation", DEFAULT_MIN_DEVIATION
+                ),
             )
-            send_email(
-                f"{formatted_date} 直飞价格{change_text} ¥{abs(direct_change)}, "
-                f"当前价格: ¥{direct_price}",
-                config,
+            logger.info("已启用价格异常值过滤")
+
+        # 统计类提醒：历史新低、低于分位数、低于 EWMA
+        self.rules: Optional[StatsRules] = None
+        rules = config.get("alertRules")
+        if rules:
+            self.rules = rules_from_config(rules)
+            logger.info(f"已启用统计提醒规则: {rules}")
+
+        # 目标价格订阅：与 priceStep 在同一轮对比中检查
+        self.subscriptions = SubscriptionIndex()
+        for item in config.get("subscriptions", []):
+            self._subscribe(item)
+        if len(self.subscriptions):
+            logger.info(f"已加载 {len(self.subscriptions)} 个目标价格订阅")
+
+        # 所有航线共用同一个限流器和熔断器；baseUrl 可以指向本地模拟接口
+        # 限流和熔断只关心时间差，默认使用单调时钟；注入时钟时与监控循环共用
+        base_url = config.get("baseUrl", BASE_URL)
+        timing = {}
+        if clock is not time.time or sleep is not time.sleep:
+            timing = {"clock": clock, "sleep": sleep}
+        configure_endpoint(
+            base_url,
+            rate=config.get("rateLimit", DEFAULT_RATE),
+            burst=config.get("rateBurst", DEFAULT_BURST),
+            failure_threshold=config.get(
+                "breakerThreshold", DEFAULT_FAILURE_THRESHOLD
+            ),
+            base_delay=config.get("breakerBaseDelay", DEFAULT_BASE_DELAY),
+            max_delay=config.get("breakerMaxDelay", DEFAULT_MAX_DELAY),
+            **timing,
+        )
+        self.breaker = get_breaker(base_url)
+
+        # 共享连接池的大小不小于并发请求数，避免连接被反复创建
+        max_workers = config.get("maxWorkers", DEFAULT_MAX_WORKERS)
+        self.transport = get_shared_transport(
+            base_url,
+            pool_size=config.get("poolSize", max(max_workers, DEFAULT_POOL_SIZE)),
+            keep_alive=config.get("keepAlive", True),
+        )
+        self.warm_connections = min(
+            len(self.routes) * 2, max_workers, self.transport.pool_size
+        )
+
+        # 缓存位于 fetch_flight_prices 之前，接口失败时继续使用最后一次成功的数据
+        fetch = fetch_flight_prices
+        cache_options = {
+            "ttl": config.get("cacheTtl", DEFAULT_TTL),
+            "stale_ttl": config.get("cacheStaleTtl", DEFAULT_STALE_TTL),
+            "disk_dir": config.get("cacheDir"),
+        }
+        if replayer is not None:
+            # 回放时每次都取录制的响应，只保留失败时使用旧数据的行为
+            fetch = replayer.fetch
+            cache_options = {"ttl": 0, "stale_ttl": 0, "disk_dir": None}
+        if recorder is not None:
+            # 录制缓存之下的真实请求，命中缓存的查询不产生记录
+            fetch = recorder.wrap(fetch)
+        # 运行指标：在缓存之下记录每次真实请求的耗时和结果
+        self.metrics: Optional[MetricsRegistry] = None
+        if config.get("metricsPort") is not None:
+            self.metrics = MetricsRegistry(clock=clock)
+            fetch = self.metrics.wrap(fetch)
+        self.cache = PriceCache(
+            fetch,
+            max_entries=config.get("cacheMaxEntries", DEFAULT_MAX_ENTRIES),
+            clock=clock,
+            **cache_options,
+        )
+        self.engine = FetchEngine(self.cache.fetch, max_workers=max_workers)
+
+        # 按绝对截止时间调度各航线，每条航线可以有自己的查询间隔
+        self.scheduler = WatchScheduler(
+            jitter=config.get("scheduleJitter", 0.0), clock=clock
+        )
+        for route_key, route in self.routes.items():
+            self.scheduler.add(route_key, route["sleepTime"])
+
+        min_interval = config.get(
+            "adaptiveMinInterval", max(60, config["sleepTime"] // 5)
+        )
+        max_interval = config.get("adaptiveMaxInterval", config["sleepTime"] * 6)
+
+        self.cadence: Optional[CadencePolicy] = None
+        self._cadence_intervals: Dict[str, float] = {}
+        if config.get("adaptive"):
+            self.cadence = CadencePolicy(
+                min_interval=min_interval,
+                max_interval=max_interval,
+                horizon_days=config.get("adaptiveHorizonDays", DEFAULT_HORIZON_DAYS),
+            )
+            logger.info("已启用自适应查询节奏")
+
+        # 全局请求预算：在调度器和抓取之间决定哪些到期航线本轮可以查询
+        self.budget: Optional[BudgetAllocator] = None
+        self._budget_intervals: Dict[str, float] = {}
+        self._next_allocation = 0.0
+        if config.get("requestsPerHour"):
+            self.budget = BudgetAllocator(
+                config["requestsPerHour"],
+                min_interval=min_interval,
+                max_interval=max_interval,
+                clock=clock,
+            )
+            for route_key in self.routes:
+                self.budget.add_route(route_key)
+            logger.info(f"已启用请求预算: 每小时 {config['requestsPerHour']} 次")
+
+        # 价格历史：每轮查询的所有观察在一个事务内写入
+        self.store: Optional[PriceStore] = None
+        if config.get("historyDb"):
+            self.store = PriceStore(config["historyDb"])
+            logger.info(f"价格历史将保存到: {config['historyDb']}")
+
+        # 分级保留：每轮查询后逐批把过期明细汇总为小时/日数据，未配置天数时使用默认值
+        self.retention: Optional[RetentionManager] = None
+        if self.store is not None:
+            self.retention = RetentionManager(
+                self.store,
+                raw_days=config.get("retentionRawDays", DEFAULT_RAW_DAYS),
+                hourly_days=config.get("retentionHourlyDays", DEFAULT_HOURLY_DAYS),
+                clock=clock,
             )
-            target_prices[date] = direct_price
 
-        # 检查非直飞价格变化
-        non_direct_change = non_direct_price - no_target_prices[date]
-        if abs(non_direct_change) >= config["priceStep"]:
-            change_text = "上涨" if non_direct_change > 0 else "下降"
+        # 列式归档：供图表、回测等只读分析直接映射扫描
+        self.archive: Optional[PriceArchive] = None
+        if config.get("archiveDir"):
+            # 每轮写入所有监控中的序列，写入端数量不小于序列数，避免每轮重新映射
+            self.archive = PriceArchive(
+                config["archiveDir"],
+                max_writers=max(DEFAULT_MAX_WRITERS, len(self.detector)),
+            )
+            logger.info(f"价格归档目录: {config['archiveDir']}")
+
+        # 发件箱：提醒先持久化再发送，重启后恢复目标价格并补发未送达的提醒
+        self.outbox: Optional[Outbox] = None
+        if config.get("outboxDb"):
+            self.outbox = Outbox(config["outboxDb"], clock=clock)
+            restored = 0
+            for series, price in self.outbox.baselines().items():
+                if self.detector.set_baseline(series, price):
+                    restored += 1
             logger.info(
-                f"{formatted_date} 非直飞价格{change_text} ¥{abs(non_direct_change)} "
-                f"(¥{no_target_prices[date]} → ¥{non_direct_price})"
+                f"发件箱: {config['outboxDb']}，恢复 {restored} 个目标价格，"
+                f"待发送提醒 {self.outbox.pending_count()} 条"
             )
-            send_email(
-                f"{formatted_date} 非直飞价格{change_text} ¥{abs(non_direct_change)}, "
-                f"当前价格: ¥{non_direct_price}",
-                config,
+
+        # 提醒合并：窗口内同一日期的多次变化合并为一条，抑制来回抖动
+        self.coalescer: Optional[AlertCoalescer] = None
+        if config.get("coalesceWindow") or config.get("maxAlertsPerHour"):
+            self.coalescer = AlertCoalescer(
+                format_alert_message,
+                window=config.get("coalesceWindow", DEFAULT_WINDOW),
+                max_per_hour=config.get("maxAlertsPerHour"),
+                clock=clock,
             )
-            no_target_prices[date] = non_direct_price
 
+        # 通知渠道：邮件、Pushplus、Webhook 并发发送
+        self.channels = build_notifiers(config)
+        if not len(self.channels):
+            logger.warning("未配置任何通知渠道，价格变化只记录在日志中")
+        else:
+            names = ", ".join(notifier.name for notifier in self.channels.notifiers)
+            logger.info(f"通知渠道: {names}")
+
+        # 通知由独立线程发送，查询循环不等待邮件服务器
+        self.notifier = NotificationQueue(
+            self._deliver_outbox if self.outbox is not None else self.channels.send,
+            capacity=config.get("notifyQueueSize", DEFAULT_CAPACITY),
+            workers=config.get("notifyWorkers", DEFAULT_WORKERS),
+        )
 
-if __name__ == "__main__":
-    try:
-        # 读取配置文件
-        config = load_config()
-        logger.info("航班价格监控程序启动")
+        # 指标接口：各组件的 stats() 在抓取 /metrics 时才读取
+        self.metrics_server: Optional[MetricsServer] = None
+        if self.metrics is not None:
+            self.metrics.add_collector(
+                lambda: component_metrics(
+                    notifier=self.notifier,
+                    channels=self.channels,
+                    coalescer=self.coalescer,
+                    outliers=self.outliers,
+                    budget=self.budget,
+                    breaker=self.breaker,
+                    outbox=self.outbox,
+                )
+            )
+            try:
+                self.metrics_server = MetricsServer(
+                    self.metrics,
+                    host=config.get("metricsHost", DEFAULT_METRICS_HOST),
+                    port=config["metricsPort"],
+                )
+                logger.info(f"运行指标: {self.metrics_server.url}")
+            except OSError as e:
+                logger.error(f"启动指标接口失败，继续监控: {e}")
+
+    def run_cycle(self, routes: List[dict]) -> Tuple[List[PriceAlert], List[str]]:
+        """执行一轮查询：并发抓取给定航线并对比价格
+
+        Args:
+            routes: 本轮到期的航线配置列表
+
+        Returns:
+            Tuple[List[PriceAlert], List[str]]: (本轮价格提醒, 成功获取价格的航线标识)
+        """
+        timer = StageTimer()
+        if self.recorder is not None:
+            self.recorder.start_cycle([get_route_key(route) for route in routes])
+        results, errors = self.engine.fetch_all(routes)
+        timer.mark("fetch")
+        for (route_key, direct), e in errors.items():
+            logger.error(
+                f"{route_key} 获取{'直飞' if direct else '非直飞'}航班价格失败: {e}"
+            )
 
-        # 显示监控路线，使用可读的城市名称
-        place_from = config["placeFrom"]
-        place_to = config["placeTo"]
-        from_display = get_readable_location(place_from)
-        to_display = get_readable_location(place_to)
-        logger.info(
-            f"监控路线: {from_display}({place_from}) → {to_display}({place_to})"
-        )
-        logger.info(f"监控日期: {', '.join(config['dateToGo'])}")
+        ok_routes = []
+        watch_ids: List[int] = []
+        prices: List[int] = []
+        observations: List[Observation] = []
+        fetched_at = self.clock()
+        for route in routes:
+            route_key = get_route_key(route)
+            direct_data = results.get((route_key, True))
+            non_direct_data = results.get((route_key, False))
+            if direct_data is None or non_direct_data is None:
+                continue
+            if is_stale(direct_data) or is_stale(non_direct_data):
+                # 旧数据已经在获取时对比和记录过，只显示不对比、不记录，否则会被当成
+                # 新的观察；缓存已在后台刷新，按失败航线稍后重试时取到新数据
+                logger.warning(f"{route_key} 只有缓存的旧数据，仅显示，稍后重试")
+                stale_direct = parse_price_calendar(direct_data)
+                stale_non_direct = parse_price_calendar(non_direct_data)
+                for date in route["dateToGo"]:
+                    direct_price = stale_direct.get(date)
+                    non_direct_price = stale_non_direct.get(date)
+                    if direct_price is not None or non_direct_price is not None:
+                        line = format_price_line(date, direct_price, non_direct_price)
+                        logger.info(f"{line}（缓存）")
+                continue
+
+            # 解析返回的数据
+            direct_results = parse_price_calendar(direct_data)
+            non_direct_results = parse_price_calendar(non_direct_data)
+            if not direct_results and not non_direct_results:
+                logger.warning(f"{route_key} 未找到任何有效的价格数据")
+                continue
+            ok_routes.append(route_key)
+
+            if self.store is not None or self.archive is not None:
+                for date in route["dateToGo"]:
+                    for direct, series_prices in (
+                        (True, direct_results),
+                        (False, non_direct_results),
+                    ):
+                        if series_prices.get(date):
+                            observations.append(
+                                (
+                                    route_key,
+                                    date,
+                                    direct,
+                                    series_prices[date],
+                                    fetched_at,
+                                )
+                            )
+
+            if self.cadence is not None:
+                for date in route["dateToGo"]:
+                    self.cadence.observe(
+                        (route_key, date, True), direct_results.get(date), fetched_at
+                    )
+                    self.cadence.observe(
+                        (route_key, date, False),
+                        non_direct_results.get(date),
+                        fetched_at,
+                    )
 
-        # 初始化目标价格字典
-        target_prices: Dict[str, int] = {date: 0 for date in config["dateToGo"]}
-        no_target_prices: Dict[str, int] = {date: 0 for date in config["dateToGo"]}
+            for date, direct_id, non_direct_id in self._watch_ids[route_key]:
+                direct_price = direct_results.get(date)
+                non_direct_price = non_direct_results.get(date)
+                if direct_price is None and non_direct_price is None:
+                    logger.warning(f"未找到日期 {date} 的价格信息")
+                    continue
 
-        while True:
-            try:
-                # 获取直飞和非直飞的机票信息
-                direct_data = fetch_flight_prices(config, direct=True)
-                non_direct_data = fetch_flight_prices(config, direct=False)
+                # 打印当前价格
+                logger.info(format_price_line(date, direct_price, non_direct_price))
+
+                watch_ids.extend((direct_id, non_direct_id))
+                prices.extend((direct_price or 0, non_direct_price or 0))
 
-                # DEBUG: 打印API响应结构以调试
-                logger.info(
-                    f"Direct Response: {json.dumps(direct_data, ensure_ascii=False)[:1000]}"
+        timer.mark("parse")
+
+        if self.outliers is not None:
+            # 可疑价格本轮不参与对比，等待下一次查询确认
+            raw_prices = prices
+            prices, held = self.outliers.filter(watch_ids, raw_prices)
+            for position in held:
+                route_key, date, direct = self.detector.series(watch_ids[position])
+                logger.warning(
+                    f"{route_key} {date} {'直飞' if direct else '非直飞'}价格 "
+                    f"¥{raw_prices[position]} 偏离近期价格，等待下一次查询确认"
                 )
 
-                # 解析返回的数据
-                if not direct_data.get("data") and not non_direct_data.get("data"):
-                    logger.warning("API返回数据为空，可能是航线或日期无效")
-                    time.sleep(RETRY_DELAY)
-                    continue
+        # 所有航线的价格一次性与目标价格对比
+        cycle_alerts: List[PriceAlert] = []
+        changes: Dict[str, int] = dict.fromkeys(ok_routes, 0)
+        for change in self.detector.detect(watch_ids, prices):
+            route_key, date, direct = self.detector.series(change.watch_id)
+            cycle_alerts.append(
+                _make_alert(route_key, date, direct, change.price, change.baseline)
+            )
+            if change.baseline:
+                changes[route_key] += 1
+
+        for position, subscriptions in self.subscriptions.evaluate(watch_ids, prices):
+            route_key, date, direct = self.detector.series(watch_ids[position])
+            price = prices[position]
+            # 同一目标价格的多个订阅合并为一条提醒
+            names: Dict[Tuple[int, bool], List[str]] = {}
+            for subscription in subscriptions:
+                names.setdefault(
+                    (subscription.target, subscription.below), []
+                ).append(subscription.name)
+            for (target, below), subscribers in names.items():
+                message = format_target_message(
+                    date, direct, price, target, below, subscribers
+                )
+                logger.info(message)
+                cycle_alerts.append(
+                    PriceAlert(
+                        route_key, date, direct, price, target, message, "target"
+                    )
+                )
 
-                direct_results_list = direct_data.get("data", {}).get("oneWayPrice", [])
-                non_direct_results_list = non_direct_data.get("data", {}).get(
-                    "oneWayPrice", []
+        if self.rules is not None:
+            for hit in self.rules.observe(watch_ids, prices, fetched_at):
+                route_key, date, direct = self.detector.series(watch_ids[hit.position])
+                price = prices[hit.position]
+                message = format_rule_message(
+                    date, direct, price, hit.kind, hit.reference, self.rules
+                )
+                logger.info(message)
+                cycle_alerts.append(
+                    PriceAlert(
+                        route_key,
+                        date,
+                        direct,
+                        price,
+                        hit.reference,
+                        message,
+                        hit.kind,
+                    )
                 )
 
-                direct_results = (
-                    direct_results_list[0]
-                    if (isinstance(direct_results_list, list) and direct_results_list)
-                    else {}
+        timer.mark("compare")
+
+        if self.budget is not None:
+            # 只统计基准价格被刷新的变化，不包括首次获取
+            for route_key, count in changes.items():
+                self.budget.record_poll(route_key, count)
+
+        if observations:
+            if self.store is not None:
+                self.store.record_cycle(observations)
+            if self.archive is not None:
+                self.archive.append_many(observations)
+
+        if self.retention is not None:
+            try:
+                self.retention.step()
+            except Exception as e:
+                logger.error(f"整理历史数据失败: {e}")
+        timer.mark("store")
+
+        if self.metrics is not None:
+            self.metrics.observe_cycle(
+                timer, ok_routes, (alert.kind for alert in cycle_alerts), fetched_at
+            )
+        return cycle_alerts, ok_routes
+
+    def _subscribe(self, item: dict) -> None:
+        """按配置添加目标价格订阅，航线和日期必须在监控中
+
+        Args:
+            item: 订阅配置，包含 date 以及 below 和/或 above，可选 placeFrom、
+                  placeTo、flightWay（默认沿用全局配置）、direct（默认直飞和非直飞都订阅）、name
+        """
+        route = {
+            field: item.get(field, self.config.get(field))
+            for field in ("placeFrom", "placeTo", "flightWay")
+        }
+        route_key = get_route_key(route)
+        directs = (item["direct"],) if "direct" in item else (True, False)
+        for direct in directs:
+            watch_id = self.detector.watch_id((route_key, item["date"], direct))
+            if watch_id is None:
+                logger.warning(
+                    f"订阅的航线或日期未在监控中，已忽略: {route_key} {item['date']}"
                 )
-                non_direct_results = (
-                    non_direct_results_list[0]
-                    if (
-                        isinstance(non_direct_results_list, list)
-                        and non_direct_results_list
+                return
+            for field, below in (("below", True), ("above", False)):
+                if field in item:
+                    self.subscriptions.subscribe(
+                        watch_id, item[field], below=below, name=item.get("name", "")
                     )
-                    else {}
+
+    def _coalesce(self, alerts: List[PriceAlert]) -> List[PriceAlert]:
+        """把新提醒放入合并器，返回窗口已经结束、需要发送的提醒"""
+        if self.coalescer is None:
+            return alerts
+        by_route: Dict[str, List[PriceAlert]] = {}
+        for alert in alerts:
+            by_route.setdefault(alert.route, []).append(alert)
+        for route_key, route_alerts in by_route.items():
+            self.coalescer.add(route_alerts, self.routes[route_key]["priceStep"])
+        return self.coalescer.flush()
+
+    def _notify(self, alerts: List[PriceAlert]) -> None:
+        """把本轮提醒交给发送线程；启用发件箱时先持久化"""
+        if len(self.routes) > 1:
+            # 多条航线时在每条消息前标明航线
+            alerts = [
+                alert._replace(
+                    message=f"[{get_route_label(self.routes[alert.route])}] "
+                    f"{alert.message}"
                 )
+                for alert in alerts
+            ]
+        if self.outbox is None:
+            self.notifier.submit(build_digest([alert.message for alert in alerts]))
+            return
+        self.outbox.enqueue(alerts)
+        self.notifier.submit(OUTBOX_FLUSH)
+
+    def _deliver_outbox(self, _: str = OUTBOX_FLUSH) -> bool:
+        """发送线程中调用：把发件箱中到期的提醒合并为一封摘要发送"""
+        entries = self.outbox.claim()
+        if not entries:
+            return True
+        entry_ids = [entry_id for entry_id, _ in entries]
+        message = build_digest([alert.message for _, alert in entries])
+        if self.channels.send(message):
+            self.outbox.ack(entry_ids)
+            return True
+        self.outbox.fail(entry_ids, "所有通知渠道均发送失败")
+        return False
 
-                if not direct_results and not non_direct_results:
-                    logger.warning("未找到任何有效的价格数据")
-                    time.sleep(RETRY_DELAY)
+    def _outbox_wait(self) -> Optional[float]:
+        """发件箱中有到期的提醒时触发发送，返回距离下一条到期的秒数"""
+        if self.outbox is None:
+            return None
+        wait = self.outbox.seconds_until_due()
+        if wait == 0:
+            self.notifier.submit(OUTBOX_FLUSH)
+            wait = self.outbox.seconds_until_due()
+        return wait
+
+    def _adjust_cadence(self, route_key: str) -> None:
+        """根据自适应策略重新计算航线的查询间隔，并停止查询已经过去的日期"""
+        route = self.routes[route_key]
+        now = self.clock()
+        dates = active_dates(route["dateToGo"], now)
+        passed = set(route["dateToGo"]) - set(dates)
+        for date in passed:
+            logger.info(f"{route_key} 日期 {date} 已过去，停止查询")
+            self.cadence.forget(route_key, date)
+        route["dateToGo"] = dates
+        if passed:
+            self._forget_dates(route_key, passed)
+
+        interval = self.cadence.route_interval(route_key, dates, now)
+        if interval is None:
+            logger.info(f"{route_key} 所有日期均已过去，停止查询该航线")
+            self.scheduler.remove(route_key)
+            if self.budget is not None:
+                self.budget.remove_route(route_key)
+            return
+        self._cadence_intervals[route_key] = interval
+        self._apply_interval(route_key)
+
+    def _apply_interval(self, route_key: str) -> None:
+        """综合自适应节奏和请求预算，设置航线的查询间隔"""
+        if route_key not in self.scheduler:
+            return
+        interval = self._cadence_intervals.get(
+            route_key, self.routes[route_key]["sleepTime"]
+        )
+        if route_key in self._budget_intervals:
+            interval = max(interval, self._budget_intervals[route_key])
+        self.scheduler.set_interval(route_key, interval)
+        logger.debug(f"{route_key} 查询间隔: {interval:.0f} 秒")
+
+    def _forget_dates(self, route_key: str, dates: Set[str]) -> None:
+        """停止对比已经过去的日期，释放它们在检测器等组件中的格子"""
+        kept = []
+        for date, direct_id, non_direct_id in self._watch_ids[route_key]:
+            if date not in dates:
+                kept.append((date, direct_id, non_direct_id))
+                continue
+            for direct in (True, False):
+                watch_id = self.detector.forget((route_key, date, direct))
+                if watch_id is None:
                     continue
+                self.subscriptions.forget(watch_id)
+                if self.outliers is not None:
+                    self.outliers.forget(watch_id)
+                if self.rules is not None:
+                    self.rules.forget(watch_id)
+        self._watch_ids[route_key] = kept
+
+    def _reallocate_budget(self) -> None:
+        """定期按最新的变化速率重新分配请求预算，并记录预算使用情况"""
+        now = self.clock()
+        if now < self._next_allocation:
+            return
+        self._next_allocation = now + BUDGET_REALLOCATE_INTERVAL
+
+        self._budget_intervals = self.budget.allocate()
+        for route_key in self._budget_intervals:
+            self._apply_interval(route_key)
+
+        report = self.budget.report()
+        logger.info(
+            f"请求预算: 最近一小时已用 {report['used']}/{report['limit']}，"
+            f"累计推迟 {report['deferred']} 次查询"
+        )
+        for route_key, stats in report["routes"].items():
+            logger.info(
+                f"{route_key} 预算: 每小时 {stats['allocated_per_hour']} 次，"
+                f"已查询 {stats['polls']} 次，发现变化 {stats['changes']} 次"
+            )
 
-                # 收集本轮所有通知消息
-                notification_messages = []
+    def _acquire_budget(self, due_keys: List[str]) -> List[str]:
+        """按预期收益为到期航线申请预算，额度不足的航线推迟到有额度时再查询"""
+        granted = []
+        for route_key in self.budget.prioritize(due_keys):
+            if self.budget.try_acquire(route_key):
+                granted.append(route_key)
+            else:
+                delay = self.budget.seconds_until_available() or RETRY_DELAY
+                logger.info(f"{route_key} 超出请求预算，推迟 {delay:.0f} 秒")
+                self.scheduler.retry_in(route_key, delay)
+        return granted
+
+    def run(self, until: Optional[float] = None) -> None:
+        """监控主循环
+
+        Args:
+            until: 时钟到达该时间戳时返回，None 表示一直运行
+        """
+        while True:
+            if not len(self.scheduler):
+                logger.info("所有监控日期均已过去，程序退出")
+                return
+            if until is not None and self.clock() >= until:
+                return
+
+            if self.budget is not None:
+                self._reallocate_budget()
+            outbox_wait = self._outbox_wait()
+            if self.coalescer is not None:
+                # 合并窗口结束的提醒即使没有新的查询也要发出
+                coalesced = self.coalescer.flush()
+                if coalesced:
+                    self._notify(coalesced)
+
+            due_keys = self.scheduler.pop_due()
+            if due_keys and self.budget is not None:
+                due_keys = self._acquire_budget(due_keys)
+            if not due_keys:
+                # 等待下次查询，并在下一轮开始前预热连接
+                wait = self.scheduler.seconds_until_next()
+                if outbox_wait:
+                    # 发件箱重试到期时提前醒来
+                    wait = min(wait, outbox_wait)
+                if self.coalescer is not None:
+                    flush_wait = self.coalescer.seconds_until_flush()
+                    if flush_wait is not None:
+                        wait = min(wait, flush_wait)
+                if until is not None:
+                    wait = min(wait, max(0.0, until - self.clock()))
+                if self.sleep is time.sleep:
+                    # 预热定时器按真实时间触发，模拟运行时没有意义
+                    self.transport.schedule_warm_up(
+                        wait - WARMUP_LEAD, connections=self.warm_connections
+                    )
+                logger.info(f"本轮查询完毕，等待 {wait:.0f} 秒后继续")
+                self.sleep(wait)
+                continue
+
+            self._poll(due_keys)
+
+    def _poll(self, due_keys: List[str]) -> None:
+        """查询到期航线，安排失败航线的重试并发送提醒"""
+        due_routes = [self.routes[key] for key in due_keys]
+        try:
+            alerts, ok_routes = self.run_cycle(due_routes)
+
+            # 根据价格变化频率和距出发天数调整各航线的查询间隔
+            if self.cadence is not None:
+                for route_key in ok_routes:
+                    self._adjust_cadence(route_key)
+
+            # 失败的航线单独重试，不影响其他航线的节奏；熔断时等到熔断结束
+            retry_delay = self.breaker.retry_after() or RETRY_DELAY
+            for route_key in set(due_keys) - set(ok_routes):
+                logger.info(f"{route_key} 将在 {retry_delay:.0f} 秒后重试")
+                self.scheduler.retry_in(route_key, retry_delay)
+
+            # 如果有提醒，所有航线合并为一条摘要通知
+            notify_started = time.perf_counter()
+            alerts = self._coalesce(alerts)
+            if alerts:
+                self._notify(alerts)
+            if self.metrics is not None:
+                self.metrics.observe_stages(
+                    {"notify": time.perf_counter() - notify_started}
+                )
 
-                # 处理每个日期的价格
-                for date in config["dateToGo"]:
-                    direct_price = direct_results.get(date)
-                    non_direct_price = non_direct_results.get(date)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            retry_delay = self.breaker.retry_after() or RETRY_DELAY
+            logger.error(f"查询过程中出错: {e}")
+            logger.info(f"等待 {retry_delay:.0f} 秒后重试")
+            for route_key in due_keys:
+                self.scheduler.retry_in(route_key, retry_delay)
+
+    def replay(self) -> None:
+        """按录制的轮次回放：每轮查询录制时的航线，响应来自录制文件
+
+        注入了时钟（通常是从录制开始时间起步的 VirtualClock）时，每轮开始前把时钟
+        推进到该轮录制时的时间，合并窗口、统计、节奏和发件箱看到的时间与录制时相同。
+        """
+        cycles = 0
+        unknown = set()
+        virtual = self.clock is not time.time
+        for route_keys in self.replayer.cycles():
+            if virtual:
+                self.sleep(max(0.0, self.replayer.cycle_time - self.clock()))
+            due_keys = []
+            for route_key in route_keys:
+                if route_key in self.routes:
+                    due_keys.append(route_key)
+                elif route_key not in unknown:
+                    unknown.add(route_key)
+                    logger.warning(f"录制中的航线不在当前配置中，已跳过: {route_key}")
+            cycles += 1
+            if self.coalescer is not None:
+                coalesced = self.coalescer.flush()
+                if coalesced:
+                    self._notify(coalesced)
+            if due_keys:
+                self._poll(due_keys)
+        logger.info(f"回放完毕，共 {cycles} 轮查询")
+
+    def close(self) -> None:
+        """释放线程池和连接，等待队列中的通知发送完毕"""
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.engine.close()
+        self.cache.close()
+        self.transport.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            logger.info(f"录制统计: {self.recorder.stats()}")
+        if self.replayer is not None:
+            logger.info(f"回放统计: {self.replayer.stats()}")
+        if self.store is not None:
+            self.store.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.notifier.close()
+        logger.info(f"通知队列统计: {self.notifier.stats()}")
+        logger.info(f"通知渠道统计: {self.channels.stats()}")
+        if self.coalescer is not None:
+            logger.info(f"提醒合并统计: {self.coalescer.stats()}")
+        if self.outliers is not None:
+            logger.info(f"异常值过滤统计: {self.outliers.stats()}")
+        self.channels.close()
+        if self.outbox is not None:
+            self.outbox.close()
+        close_shared_mailers()
+
+
+def replay_config(config: dict, notify: bool = False, persist: bool = False) -> dict:
+    """回放使用的配置：默认不发送通知、不写入历史数据库、发件箱和归档
 
-                    if direct_price is None and non_direct_price is None:
-                        logger.warning(f"未找到日期 {date} 的价格信息")
-                        continue
+    Args:
+        config: load_config 返回的配置信息
+        notify: 是否保留通知渠道
+        persist: 是否保留 historyDb、outboxDb 和 archiveDir
 
-                    # 打印当前价格
-                    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
-                    d_p_str = f"¥{direct_price}" if direct_price else "无"
-                    nd_p_str = f"¥{non_direct_price}" if non_direct_price else "无"
-                    logger.info(
-                        f"{formatted_date} - 直飞: {d_p_str}, 非直飞: {nd_p_str}"
-                    )
+    Returns:
+        dict: 去掉相应配置项后的新配置
+    """
+    dropped = set()
+    if not notify:
+        dropped.update(REPLAY_NOTIFY_KEYS)
+    if not persist:
+        dropped.update(REPLAY_PERSIST_KEYS)
+    removed = sorted(key for key in dropped if config.get(key))
+    if removed:
+        logger.info(f"回放模式已停用: {', '.join(removed)}")
+    return {key: value for key, value in config.items() if key not in dropped}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="航班价格监控")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="DIR", help="把每次接口响应录制到目录")
+    mode.add_argument(
+        "--replay", metavar="DIR", help="用目录中录制的响应代替接口请求，回放完毕后退出"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=sorted(COMPRESSIONS),
+        default=DEFAULT_COMPRESSION,
+        help="录制文件的压缩格式",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=DEFAULT_SPEED,
+        help="回放倍速，0 表示轮次之间不等待",
+    )
+    parser.add_argument(
+        "--replay-notify",
+        action="store_true",
+        help="回放时也通过配置的邮件、Pushplus、Webhook 发送通知",
+    )
+    parser.add_argument(
+        "--replay-persist",
+        action="store_true",
+        help="回放时也写入配置的 historyDb、outboxDb 和 archiveDir",
+    )
+    return parser.parse_args(argv)
 
-                    # 监控直飞价格
-                    if direct_price:
-                        if target_prices[date] == 0:
-                            logger.info(f"首次获取 {formatted_date} 的直飞票价")
-                            notification_messages.append(
-                                f"首次提醒: {formatted_date} 的直飞价格 ¥{direct_price}"
-                            )
-                            target_prices[date] = direct_price
-                        else:
-                            direct_change = direct_price - target_prices[date]
-                            if abs(direct_change) >= config["priceStep"]:
-                                change_text = "上涨" if direct_change > 0 else "下降"
-                                logger.info(
-                                    f"{formatted_date} 直飞价格{change_text} ¥{abs(direct_change)} (¥{target_prices[date]} → ¥{direct_price})"
-                                )
-                                notification_messages.append(
-                                    f"{formatted_date} 直飞价格{change_text} ¥{abs(direct_change)}, 当前价格: ¥{direct_price}"
-                                )
-                                target_prices[date] = direct_price
-
-                    # 监控非直飞价格
-                    if non_direct_price:
-                        if no_target_prices[date] == 0:
-                            logger.info(f"首次获取 {formatted_date} 的非直飞票价")
-                            notification_messages.append(
-                                f"首次提醒: {formatted_date} 的非直飞价格 ¥{non_direct_price}"
-                            )
-                            no_target_prices[date] = non_direct_price
-                        else:
-                            non_direct_change = (
-                                non_direct_price - no_target_prices[date]
-                            )
-                            if abs(non_direct_change) >= config["priceStep"]:
-                                change_text = (
-                                    "上涨" if non_direct_change > 0 else "下降"
-                                )
-                                logger.info(
-                                    f"{formatted_date} 非直飞价格{change_text} ¥{abs(non_direct_change)} (¥{no_target_prices[date]} → ¥{non_direct_price})"
-                                )
-                                notification_messages.append(
-                                    f"{formatted_date} 非直飞价格{change_text} ¥{abs(non_direct_change)}, 当前价格: ¥{non_direct_price}"
-                                )
-                                no_target_prices[date] = non_direct_price
 
-                # 如果有消息，统一发送邮件
-                if notification_messages:
-                    full_message = "\n".join(notification_messages)
-                    send_email(full_message, config)
+def main() -> None:
+    args = parse_args()
+    try:
+        # 读取配置文件
+        config = load_config()
+        logger.info("航班价格监控程序启动")
+
+        recorder = replayer = None
+        timing = {}
+        if args.record:
+            recorder = ResponseRecorder(args.record, compression=args.compression)
+            logger.info(f"接口响应将录制到: {args.record}")
+        if args.replay:
+            replayer = ResponseReplayer(args.replay, speed=args.replay_speed)
+            logger.info(f"回放录制: {args.replay}（{args.replay_speed:g} 倍速）")
+            # 监控按录制的时间运行，结果与回放倍速和实际耗时无关
+            start = replayer.start_time()
+            clock = VirtualClock(time.time() if start is None else start)
+            timing = {"clock": clock.time, "sleep": clock.sleep}
+            config = replay_config(
+                config, notify=args.replay_notify, persist=args.replay_persist
+            )
 
-                # 等待下次查询
-                logger.info(f'本轮查询完毕，等待 {config["sleepTime"]} 秒后继续')
-                time.sleep(config["sleepTime"])
+        monitor = FlightMonitor(
+            config, recorder=recorder, replayer=replayer, **timing
+        )
 
-            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
-                logger.error(f"查询过程中出错: {e}")
-                logger.info(f"等待 {RETRY_DELAY} 秒后重试")
-                time.sleep(RETRY_DELAY)
+        # 显示监控路线，使用可读的城市名称
+        for route in monitor.routes.values():
+            logger.info(f"监控路线: {get_route_label(route)}")
+            logger.info(f"监控日期: {', '.join(route['dateToGo'])}")
+
+        try:
+            if replayer is not None:
+                monitor.replay()
+            else:
+                monitor.run()
+        finally:
+            monitor.close()
 
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
     except Exception as e:
         logger.error(f"程序运行出错: {e}", exc_info=True)
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
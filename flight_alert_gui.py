@@ -1,4 +1,5 @@
 import json
+import math
 import os
 import time
 import threading
@@ -8,26 +9,20 @@ import requests
 from datetime import datetime
 import sys
 import logging
-from typing import Dict
+from typing import Callable, Dict
 from PIL import Image, ImageTk
-import smtplib
-from email.mime.text import MIMEText
-from email.header import Header
+
+from flight_detect import ChangeDetector, detect_calendar
+from flight_dispatch import NotificationQueue
+from flight_notifiers import NotifierGroup, build_notifiers
+from flight_scheduler import WatchScheduler
+from flight_transport import WARMUP_LEAD, build_params, get_shared_transport
 
 # 常量定义
-BASE_URL = "https://flights.ctrip.com/itinerary/api/12808/lowestPrice?"
-PUSHPLUS_URL = "https://www.pushplus.plus/send"
 RETRY_DELAY = 30
-REQUEST_TIMEOUT = 10
 DEFAULT_SLEEP_TIME = 600
 DEFAULT_PRICE_STEP = 50
-
-# 请求头，模拟浏览器以避免被拦截
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Referer": "https://flights.ctrip.com/online/list/oneway",
-    "Accept": "application/json, text/plain, */*",
-}
+SCHEDULE_KEY = "gui"  # 调度器中 GUI 监控项的标识
 
 # 机场代码到城市名称的映射
 AIRPORT_CITY_MAP = {
@@ -302,8 +297,21 @@ def get_readable_location(airport_code: str) -> str:
 
 
 class FlightAlertApp:
-    def __init__(self, root):
+    def __init__(
+        self,
+        root,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            root: Tk 根窗口
+            clock: 时钟函数，调度和倒计时共用
+            sleep: 等待函数，可以替换为 flight_clock.VirtualClock 模拟运行
+        """
         self.root = root
+        self.clock = clock
+        self.sleep = sleep
         self.root.title("航班价格监控")
         self.root.geometry("900x650")
         self.root.minsize(900, 650)
@@ -336,11 +344,18 @@ class FlightAlertApp:
         self.smtp_server_var = tk.StringVar(value="smtp.qq.com")
         self.smtp_port_var = tk.StringVar(value="465")
 
+        # 其他通知渠道
+        self.pushplus_token_var = tk.StringVar()
+        self.webhook_url_var = tk.StringVar()
+
         # 监控状态
         self.running = False
         self.monitor_thread = None
-        self.target_prices = {}
-        self.no_target_prices = {}
+        self.scheduler = WatchScheduler(clock=clock)
+        # 通知由独立线程发送，慢速的 SMTP 服务器不会拖慢价格检查
+        self.channels = NotifierGroup([])
+        self.notifier = NotificationQueue(self._send_notification, name="gui-notify")
+        self.detector = ChangeDetector()
 
         # 创建UI
         self._create_ui()
@@ -568,7 +583,7 @@ class FlightAlertApp:
         )
 
         # 邮件配置区域
-        email_frame = ttk.LabelFrame(parent, text="邮件通知配置", padding=10)
+        email_frame = ttk.LabelFrame(parent, text="通知配置", padding=10)
         email_frame.pack(fill=tk.X, padx=30, pady=10)
 
         email_frame.columnconfigure(1, weight=1)
@@ -614,10 +629,29 @@ class FlightAlertApp:
             row=2, column=1, sticky=tk.W, padx=5, pady=5
         )
 
+        # PushPlus令牌
+        ttk.Label(email_frame, text="PushPlus令牌:").grid(
+            row=2, column=2, sticky=tk.W, pady=5
+        )
+        ttk.Entry(email_frame, textvariable=self.pushplus_token_var, show="*").grid(
+            row=2, column=3, sticky=tk.EW, padx=5, pady=5
+        )
+
+        # Webhook地址
+        ttk.Label(email_frame, text="Webhook地址:").grid(
+            row=3, column=0, sticky=tk.W, pady=5
+        )
+        ttk.Entry(email_frame, textvariable=self.webhook_url_var).grid(
+            row=3, column=1, columnspan=3, sticky=tk.EW, padx=5, pady=5
+        )
+
         # 提示文本
         tip_frame = ttk.Frame(parent)
         tip_frame.pack(fill=tk.X, padx=30, pady=5)
-        tip_text = "提示: 推荐使用QQ邮箱或163邮箱，需要开启SMTP服务并获取授权码"
+        tip_text = (
+            "提示: 推荐使用QQ邮箱或163邮箱，需要开启SMTP服务并获取授权码；"
+            "填写的各个通知渠道会同时发送"
+        )
         ttk.Label(
             tip_frame, text=tip_text, foreground="#666666", font=("微软雅黑", 9)
         ).pack(anchor=tk.W)
@@ -791,6 +825,8 @@ class FlightAlertApp:
                 "email_receiver": self.email_receiver_var.get().strip(),
                 "smtp_server": self.smtp_server_var.get().strip(),
                 "smtp_port": smtp_port,
+                "SCKEY": self.pushplus_token_var.get().strip(),
+                "webhookUrl": self.webhook_url_var.get().strip(),
             }
 
             # 获取配置路径
@@ -833,6 +869,8 @@ class FlightAlertApp:
             self.email_receiver_var.set(config.get("email_receiver", ""))
             self.smtp_server_var.set(config.get("smtp_server", "smtp.qq.com"))
             self.smtp_port_var.set(str(config.get("smtp_port", "465")))
+            self.pushplus_token_var.set(config.get("SCKEY", ""))
+            self.webhook_url_var.set(config.get("webhookUrl", ""))
 
             self._log(f"配置加载成功: {config_path}")
         except Exception as e:
@@ -859,6 +897,8 @@ class FlightAlertApp:
                 "email_receiver": self.email_receiver_var.get().strip(),
                 "smtp_server": self.smtp_server_var.get().strip(),
                 "smtp_port": int(self.smtp_port_var.get()),
+                "SCKEY": self.pushplus_token_var.get().strip(),
+                "webhookUrl": self.webhook_url_var.get().strip(),
             }
 
             if not dates or "" in dates:
@@ -879,9 +919,15 @@ class FlightAlertApp:
                 **email_config,
             }
 
-            # 初始化目标价格
-            self.target_prices = {date: 0 for date in self.config["dateToGo"]}
-            self.no_target_prices = {date: 0 for date in self.config["dateToGo"]}
+            # 按当前配置重建通知渠道
+            self.channels.close()
+            self.channels = build_notifiers(self.config)
+
+            # 重新开始监控时清空目标价格
+            self.detector = ChangeDetector()
+
+            # 按绝对截止时间调度，查询和发邮件的耗时不会累积到间隔里
+            self.scheduler.add(SCHEDULE_KEY, sleep_time)
 
             # 更新UI
             self.running = True
@@ -917,83 +963,51 @@ class FlightAlertApp:
     def _monitor_prices(self):
         """监控价格主循环"""
         while self.running:
+            # 等待下一次到期的检查
+            wait = self.scheduler.seconds_until_next()
+            if wait:
+                self._wait_with_check(wait)
+                continue
+            self.scheduler.pop_due()
+
             try:
                 # 更新状态
                 self._update_status(
                     f"正在检查价格 ({datetime.now().strftime('%H:%M:%S')})"
                 )
 
-                # 规范化航程类型参数
-                flight_way = self.config["flightWay"]
-                if flight_way.lower() == "oneway":
-                    flight_way = "Oneway"
-                elif flight_way.lower() == "roundtrip":
-                    flight_way = "Roundtrip"
-
                 # 构建请求参数
-                params_base = {
-                    "flightWay": flight_way,
-                    "dcity": self.config["placeFrom"].upper(),
-                    "acity": self.config["placeTo"].upper(),
-                    "army": "false",
-                    "classType": "ALL",
-                    "quantity": "1",
-                }
+                transport = get_shared_transport()
+                params_direct = build_params(self.config, direct=True)
+                params_base = build_params(self.config, direct=False)
 
                 # 获取直飞航班价格
                 self._log("正在请求直飞航班数据...")
-                params_direct = {**params_base, "direct": "true"}
 
                 try:
-                    direct_response = requests.get(
-                        BASE_URL,
-                        params=params_direct,
-                        headers=HEADERS,
-                        timeout=REQUEST_TIMEOUT,
-                    )
-                    direct_response.raise_for_status()
-                    direct_data = direct_response.json()
-
-                    if direct_data.get("status") == 2:
-                        raise ValueError(
-                            f"API返回错误: {direct_data.get('msg', '未知错误')}"
-                        )
-
+                    direct_data = transport.get(params_direct)
                 except (requests.exceptions.RequestException, ValueError) as e:
                     self._log(f"获取直飞航班数据失败: {e}，将在{RETRY_DELAY}秒后重试")
                     self._update_prices_display("获取直飞航班数据失败")
-                    self._wait_with_check(RETRY_DELAY)
+                    self.scheduler.retry_in(SCHEDULE_KEY, RETRY_DELAY)
                     continue
 
                 # 获取非转机航班价格
                 self._log("正在请求非直飞航班数据...")
 
                 try:
-                    non_direct_response = requests.get(
-                        BASE_URL,
-                        params=params_base,
-                        headers=HEADERS,
-                        timeout=REQUEST_TIMEOUT,
-                    )
-                    non_direct_response.raise_for_status()
-                    non_direct_data = non_direct_response.json()
-
-                    if non_direct_data.get("status") == 2:
-                        raise ValueError(
-                            f"API返回错误: {non_direct_data.get('msg', '未知错误')}"
-                        )
-
+                    non_direct_data = transport.get(params_base)
                 except (requests.exceptions.RequestException, ValueError) as e:
                     self._log(f"获取非直飞航班数据失败: {e}，将在{RETRY_DELAY}秒后重试")
                     self._update_prices_display("获取非直飞航班数据失败")
-                    self._wait_with_check(RETRY_DELAY)
+                    self.scheduler.retry_in(SCHEDULE_KEY, RETRY_DELAY)
                     continue
 
                 # 解析响应
                 if not direct_data.get("data") and not non_direct_data.get("data"):
                     self._log("API返回数据为空，可能是航线或日期无效")
                     self._update_prices_display("API返回数据为空")
-                    self._wait_with_check(RETRY_DELAY)
+                    self.scheduler.retry_in(SCHEDULE_KEY, RETRY_DELAY)
                     continue
 
                 direct_results_list = direct_data.get("data", {}).get("oneWayPrice", [])
@@ -1018,7 +1032,7 @@ class FlightAlertApp:
                 if not direct_results and not non_direct_results:
                     self._log("未找到任何有效的价格数据")
                     self._update_prices_display("未找到任何有效的价格数据")
-                    self._wait_with_check(RETRY_DELAY)
+                    self.scheduler.retry_in(SCHEDULE_KEY, RETRY_DELAY)
                     continue
 
                 # 更新价格显示
@@ -1048,119 +1062,84 @@ class FlightAlertApp:
                         f"日期 {formatted_date}: 直飞 {d_p_str}, 非直飞 {nd_p_str}"
                     )
 
-                    if direct_price:
-                        if self.target_prices[date] == 0:
-                            # 首次获取价格
-                            self._log(
-                                f"首次获取 {formatted_date} 的直飞价格，正在发送通知"
-                            )
-                            notification_messages.append(
-                                f"首次提醒: {formatted_date} 的直飞价格 ¥{direct_price}"
-                            )
-                            self.target_prices[date] = direct_price
-                        else:
-                            # 检查直飞价格变化
-                            direct_change = direct_price - self.target_prices[date]
-                            if abs(direct_change) >= self.config["priceStep"]:
-                                change_text = "上涨" if direct_change > 0 else "下降"
-                                self._log(
-                                    f"{formatted_date} 的直飞价格{change_text} ¥{abs(direct_change)} (从 ¥{self.target_prices[date]} 变为 ¥{direct_price})"
-                                )
-                                notification_messages.append(
-                                    f"{formatted_date} 的直飞价格{change_text} ¥{abs(direct_change)}，当前价格: ¥{direct_price}"
-                                )
-                                self.target_prices[date] = direct_price
-
-                    if non_direct_price:
-                        if self.no_target_prices[date] == 0:
-                            # 首次获取价格
-                            self._log(
-                                f"首次获取 {formatted_date} 的非直飞价格，正在发送通知"
-                            )
-                            notification_messages.append(
-                                f"首次提醒: {formatted_date} 的非直飞价格 ¥{non_direct_price}"
-                            )
-                            self.no_target_prices[date] = non_direct_price
-                        else:
-                            # 检查非直飞价格变化
-                            non_direct_change = (
-                                non_direct_price - self.no_target_prices[date]
-                            )
-                            if abs(non_direct_change) >= self.config["priceStep"]:
-                                change_text = (
-                                    "上涨" if non_direct_change > 0 else "下降"
-                                )
-                                self._log(
-                                    f"{formatted_date} 的非直飞价格{change_text} ¥{abs(non_direct_change)} (从 ¥{self.no_target_prices[date]} 变为 ¥{non_direct_price})"
-                                )
-                                notification_messages.append(
-                                    f"{formatted_date} 的非直飞价格{change_text} ¥{abs(non_direct_change)}，当前价格: ¥{non_direct_price}"
-                                )
-                                self.no_target_prices[date] = non_direct_price
+                # 与命令行版本共用 ChangeDetector 的判断规则
+                for change in detect_calendar(
+                    self.detector,
+                    SCHEDULE_KEY,
+                    self.config["dateToGo"],
+                    direct_results,
+                    non_direct_results,
+                    self.config["priceStep"],
+                ):
+                    formatted_date = (
+                        f"{change.date[:4]}-{change.date[4:6]}-{change.date[6:]}"
+                    )
+                    kind = "直飞" if change.direct else "非直飞"
+                    if not change.baseline:
+                        # 首次获取价格
+                        self._log(f"首次获取 {formatted_date} 的{kind}价格，正在发送通知")
+                        notification_messages.append(
+                            f"首次提醒: {formatted_date} 的{kind}价格 ¥{change.price}"
+                        )
+                        continue
+                    diff = change.price - change.baseline
+                    change_text = "上涨" if diff > 0 else "下降"
+                    self._log(
+                        f"{formatted_date} 的{kind}价格{change_text} ¥{abs(diff)} "
+                        f"(从 ¥{change.baseline} 变为 ¥{change.price})"
+                    )
+                    notification_messages.append(
+                        f"{formatted_date} 的{kind}价格{change_text} ¥{abs(diff)}，"
+                        f"当前价格: ¥{change.price}"
+                    )
 
                 # 如果有消息，统一发送邮件
                 if notification_messages:
                     full_message = "\n".join(notification_messages)
-                    self._send_email(full_message)
+                    if not self.notifier.submit(full_message):
+                        self._log("通知队列已满，本次提醒未发送")
 
                 # 更新价格显示
                 self._update_prices_display(prices_text)
 
-                # 等待下次检查
-                self._update_status(f"下次检查将在 {self.config['sleepTime']} 秒后进行")
-                self._wait_with_check(self.config["sleepTime"])
+                # 在下一轮开始前预热连接
+                transport.schedule_warm_up(
+                    self.scheduler.seconds_until_next() - WARMUP_LEAD, connections=2
+                )
 
             except Exception as e:
                 self._log(f"监控过程中出错: {str(e)}")
                 logger.exception("监控过程异常")
                 self._update_status(f"错误: {str(e)}")
-                self._wait_with_check(RETRY_DELAY)
+                self.scheduler.retry_in(SCHEDULE_KEY, RETRY_DELAY)
 
-    def _wait_with_check(self, seconds: int) -> None:
+    def _wait_with_check(self, seconds: float) -> None:
         """等待指定秒数，同时检查运行状态并显示倒计时
 
+        按绝对截止时间计算剩余秒数，倒计时本身不会引入漂移。
+
         Args:
             seconds: 等待秒数
         """
-        for i in range(seconds):
-            if not self.running:
+        deadline = self.clock() + seconds
+        while self.running:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
                 return
-            remaining = seconds - i
-            self._update_status(f"下次检查将在 {remaining} 秒后进行")
-            time.sleep(1)
-
-    def _send_email(self, message: str) -> bool:
-        """发送邮件通知"""
-        sender = self.config.get("email_sender")
-        password = self.config.get("email_password")
-        receiver = self.config.get("email_receiver")
-        smtp_server = self.config.get("smtp_server")
-        smtp_port = self.config.get("smtp_port", 465)
-
-        if not all([sender, password, receiver, smtp_server]):
-            self._log("邮件配置不完整，跳过发送")
+            self._update_status(f"下次检查将在 {math.ceil(remaining)} 秒后进行")
+            self.sleep(min(1, remaining))
+
+    def _send_notification(self, message: str) -> bool:
+        """通过所有已配置的渠道发送通知（邮件连接和 HTTP 连接在多次发送之间复用）"""
+        if not len(self.channels):
+            self._log("通知配置不完整，跳过发送")
             return False
 
-        try:
-            msg = MIMEText(message, "plain", "utf-8")
-            msg["From"] = sender
-            msg["To"] = receiver
-            msg["Subject"] = Header("航班价格提醒", "utf-8")
-
-            if smtp_port == 465:
-                server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-            else:
-                server = smtplib.SMTP(smtp_server, smtp_port)
-                server.starttls()
-
-            server.login(sender, password)
-            server.sendmail(sender, [receiver], msg.as_string())
-            server.quit()
-            self._log(f"邮件发送成功: {message}")
+        if self.channels.send(message):
+            self._log(f"通知发送成功: {message}")
             return True
-        except Exception as e:
-            self._log(f"邮件发送失败: {e}")
-            return False
+        self._log("通知发送失败，详见日志")
+        return False
 
     def _log(self, message):
         """添加带时间戳的日志消息"""
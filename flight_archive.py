@@ -0,0 +1,451 @@
+"""列式内存映射价格归档
+
+每个 (航线, 日期, 是否直飞) 序列一个文件，价格相同的连续观察合并为一个 run（游程编码），
+时间戳以文件头中的基准时间为参照存储为 32 位偏移（差分编码），四列均为定长数组：
+
+    头部  magic(4s) version(H) reserved(H) base_ts(q) runs(I) capacity(I)
+    starts[capacity]  uint32  每个 run 第一次观察的时间偏移（秒）
+    ends[capacity]    uint32  每个 run 最后一次观察的时间偏移（秒）
+    prices[capacity]  int32   run 的价格
+    counts[capacity]  uint32  run 包含的观察次数
+
+读取端用只读 mmap 打开文件，各列以 memoryview 直接映射到文件内容，扫描时不需要复制；
+安装了 NumPy 时可以用 as_numpy() 得到零拷贝的数组视图。
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不检查文件描述符上限
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FPA1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHqII")
+RUNS_OFFSET = 16  # 头部中 runs 字段的偏移
+COLUMN_WIDTH = 4  # 每列元素的字节数
+COLUMN_FORMATS = ("I", "I", "i", "I")  # starts, ends, prices, counts
+INITIAL_CAPACITY = 64
+DEFAULT_MAX_WRITERS = 256  # 同时保持打开的写入端数量上限（每个占一个文件描述符和映射）
+FD_HEADROOM = 64  # 为数据库、网络连接等保留的文件描述符数
+HISTORY_KINDS = {"target_prices": True, "no_target_prices": False}  # 类型 → 是否直飞
+SUFFIX = ".col"
+
+SeriesKey = Tuple[str, str, bool]
+
+
+def _series_filename(route: str, date: str, direct: bool) -> str:
+    safe_route = re.sub(r"[^A-Za-z0-9_-]", "_", route)
+    return f"{safe_route}_{date}_{'d' if direct else 'n'}{SUFFIX}"
+
+
+def _writer_limit(requested: int) -> int:
+    """受进程文件描述符上限约束的写入端数量"""
+    if resource is None:
+        return requested
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - FD_HEADROOM))
+
+
+def _parse_filename(filename: str) -> Optional[SeriesKey]:
+    match = re.fullmatch(r"(.+)_(\d{8})_([dn])" + re.escape(SUFFIX), filename)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3) == "d"
+
+
+class SeriesReader:
+    """只读打开一个序列文件，各列为零拷贝的 memoryview"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 序列文件路径
+
+        Raises:
+            ValueError: 文件格式错误
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.base_ts, self.runs, self.capacity = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"不是有效的价格归档文件: {path}")
+
+        view = memoryview(self._mm)
+        self._views = []
+        for index, fmt in enumerate(COLUMN_FORMATS):
+            offset = HEADER.size + index * COLUMN_WIDTH * self.capacity
+            self._views.append(
+                view[offset : offset + COLUMN_WIDTH * self.runs].cast(fmt)
+            )
+        view.release()
+
+    @property
+    def starts(self) -> memoryview:
+        """每个 run 第一次观察的时间偏移（相对 base_ts，秒）"""
+        return self._views[0]
+
+    @property
+    def ends(self) -> memoryview:
+        """每个 run 最后一次观察的时间偏移（相对 base_ts，秒）"""
+        return self._views[1]
+
+    @property
+    def prices(self) -> memoryview:
+        """每个 run 的价格"""
+        return self._views[2]
+
+    @property
+    def counts(self) -> memoryview:
+        """每个 run 包含的观察次数"""
+        return self._views[3]
+
+    def __len__(self) -> int:
+        return self.runs
+
+    def observation_count(self) -> int:
+        """序列包含的原始观察次数"""
+        return sum(self.counts)
+
+    def runs_iter(self) -> Iterator[Tuple[int, int, int, int]]:
+        """按时间顺序遍历 (开始时间戳, 结束时间戳, 价格, 观察次数)"""
+        base = self.base_ts
+        for start, end, price, count in zip(*self._views):
+            yield base + start, base + end, price, count
+
+    def as_numpy(self):
+        """以 NumPy 数组返回 (starts, ends, prices, counts)，不复制数据
+
+        返回的数组引用映射内存，调用 close() 之前需要先释放。
+
+        Raises:
+            ImportError: 未安装 NumPy
+        """
+        if np is None:
+            raise ImportError("as_numpy 需要安装 numpy")
+        dtypes = (np.uint32, np.uint32, np.int32, np.uint32)
+        return tuple(
+            np.frombuffer(view, dtype=dtype) for view, dtype in zip(self._views, dtypes)
+        )
+
+    def close(self) -> None:
+        """释放映射，之前取得的列视图随之失效"""
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mm.close()
+
+    def __enter__(self) -> "SeriesReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _SeriesWriter:
+    """以读写 mmap 打开的序列文件，只在末尾追加"""
+
+    def __init__(self, path: str, base_ts: int):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, base_ts, INITIAL_CAPACITY, [b""] * len(COLUMN_FORMATS))
+        self._open()
+
+    @staticmethod
+    def _create(path: str, base_ts: int, capacity: int, columns: List[bytes]) -> None:
+        """写出一个新文件（先写临时文件再替换，已打开的读取端不受影响）"""
+        runs = len(columns[0]) // COLUMN_WIDTH
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, base_ts, runs, capacity))
+            for column in columns:
+                f.write(column)
+                f.write(b"\0" * (COLUMN_WIDTH * capacity - len(column)))
+        os.replace(tmp_path, path)
+
+    def _open(self) -> None:
+        with open(self.path, "r+b") as f:
+            self._mm = mmap.mmap(f.fileno(), 0)
+        magic, version, _, self.base_ts, self.runs, self.capacity = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"不是有效的价格归档文件: {self.path}")
+
+    def _offset(self, column: int, index: int) -> int:
+        return HEADER.size + (column * self.capacity + index) * COLUMN_WIDTH
+
+    def _get(self, column: int, index: int) -> int:
+        return struct.unpack_from(
+            "<" + COLUMN_FORMATS[column], self._mm, self._offset(column, index)
+        )[0]
+
+    def _set(self, column: int, index: int, value: int) -> None:
+        struct.pack_into(
+            "<" + COLUMN_FORMATS[column], self._mm, self._offset(column, index), value
+        )
+
+    def _grow(self) -> None:
+        """容量翻倍：按新的列宽重写文件并重新映射"""
+        columns = [
+            bytes(self._mm[self._offset(c, 0) : self._offset(c, self.runs)])
+            for c in range(len(COLUMN_FORMATS))
+        ]
+        self._mm.close()
+        self._create(self.path, self.base_ts, self.capacity * 2, columns)
+        self._open()
+
+    def append(self, ts: int, price: int) -> bool:
+        """追加一次观察
+
+        Args:
+            ts: 观察时间戳（秒）
+            price: 价格
+
+        Returns:
+            bool: 是否写入（早于最后一次观察的数据会被忽略）
+        """
+        offset = ts - self.base_ts
+        if offset < 0 or offset > 0xFFFFFFFF:
+            logger.warning(f"时间戳超出归档范围，已忽略: {self.path} @ {ts}")
+            return False
+
+        last = self.runs - 1
+        if last >= 0:
+            if offset < self._get(1, last):
+                logger.warning(f"观察时间早于已归档数据，已忽略: {self.path} @ {ts}")
+                return False
+            if self._get(2, last) == price:
+                self._set(1, last, offset)
+                self._set(3, last, self._get(3, last) + 1)
+                return True
+
+        if self.runs == self.capacity:
+            self._grow()
+        index = self.runs
+        self._set(0, index, offset)
+        self._set(1, index, offset)
+        self._set(2, index, price)
+        self._set(3, index, 1)
+        self.runs += 1
+        struct.pack_into("<I", self._mm, RUNS_OFFSET, self.runs)
+        return True
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        self._mm.flush()
+        self._mm.close()
+
+
+class PriceArchive:
+    """一个目录下所有序列文件组成的价格归档"""
+
+    def __init__(self, directory: str, max_writers: int = DEFAULT_MAX_WRITERS):
+        """
+        Args:
+            directory: 归档目录，不存在时自动创建
+            max_writers: 同时保持打开的写入端数量上限，超出时关闭最久未写入的序列；
+                         应不小于每轮写入的序列数，否则每轮都要重新打开和映射文件。
+                         超过进程的文件描述符上限时自动降低
+
+        Raises:
+            ValueError: max_writers 不是正整数
+        """
+        if max_writers <= 0:
+            raise ValueError("max_writers 必须是正整数")
+        self.directory = directory
+        self.max_writers = _writer_limit(max_writers)
+        if self.max_writers < max_writers:
+            logger.warning(
+                f"文件描述符上限不足以同时打开 {max_writers} 个归档序列，"
+                f"最多保持 {self.max_writers} 个，超出的序列每次写入时重新打开"
+            )
+        os.makedirs(directory, exist_ok=True)
+        self._writers: "OrderedDict[SeriesKey, _SeriesWriter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: SeriesKey) -> str:
+        return os.path.join(self.directory, _series_filename(*key))
+
+    def append(
+        self, route: str, date: str, direct: bool, price: int, fetched_at: float
+    ) -> bool:
+        """追加一次观察
+
+        Args:
+            route: 航线标识
+            date: 出发日期
+            direct: 是否直飞
+            price: 价格
+            fetched_at: 抓取时间戳
+
+        Returns:
+            bool: 是否写入
+        """
+        ts = int(fetched_at)
+        key = (route, date, direct)
+        with self._lock:
+            return self._writer(key, ts).append(ts, price)
+
+    def _writer(self, key: SeriesKey, ts: int) -> _SeriesWriter:
+        """取得序列的写入端并按 LRU 关闭多余的写入端，调用方需持有锁
+
+        已过期日期的序列不再有写入，会随着新序列的打开被依次关闭。
+        """
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = _SeriesWriter(self._path(key), ts)
+        self._writers.move_to_end(key)
+        while len(self._writers) > self.max_writers:
+            _, evicted = self._writers.popitem(last=False)
+            evicted.close()
+        return writer
+
+    def append_many(
+        self, observations: Iterable[Tuple[str, str, bool, int, float]]
+    ) -> int:
+        """批量追加观察，格式与 flight_store.Observation 相同
+
+        Returns:
+            int: 写入的观察数
+        """
+        written = sum(
+            self.append(route, date, direct, price, fetched_at)
+            for route, date, direct, price, fetched_at in observations
+            if price
+        )
+        self.flush()
+        return written
+
+    def keys(self) -> List[SeriesKey]:
+        """归档中所有序列的 (航线, 日期, 是否直飞)"""
+        keys = []
+        for filename in sorted(os.listdir(self.directory)):
+            key = _parse_filename(filename)
+            if key is not None:
+                keys.append(key)
+        return keys
+
+    def open_series(self, route: str, date: str, direct: bool) -> Optional[SeriesReader]:
+        """以只读方式打开一个序列，不存在时返回 None"""
+        path = self._path((route, date, direct))
+        if not os.path.exists(path):
+            return None
+        with self._lock:
+            writer = self._writers.get((route, date, direct))
+            if writer is not None:
+                writer.flush()
+        return SeriesReader(path)
+
+    def import_history_json(
+        self, path: str, route: str, fetched_at: Optional[float] = None
+    ) -> int:
+        """导入 GitHub/price_history.json 格式的价格快照及其变化日志
+
+        同目录下的 price_history.journal（与 JSON 同名、扩展名为 .journal）记录了
+        快照之后的价格变化，每条按日志中的时间写入。
+
+        Args:
+            path: JSON 文件路径
+            route: 该文件对应的航线标识
+            fetched_at: 快照时间，默认使用文件的修改时间与第一条变化中较早的一个
+
+        Returns:
+            int: 写入的观察数
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        journal = self._read_journal(os.path.splitext(path)[0] + ".journal")
+        if fetched_at is None:
+            fetched_at = os.path.getmtime(path)
+            if journal:
+                # 检出的快照文件修改时间可能晚于日志中的变化，快照总是在这些变化之前
+                fetched_at = min(fetched_at, journal[0][0])
+        written = self.import_target_prices(
+            {route: history.get("target_prices", {})},
+            {route: history.get("no_target_prices", {})},
+            fetched_at,
+        )
+        return written + self.append_many(
+            (route, date, direct, price, ts) for ts, direct, date, price in journal
+        )
+
+    @staticmethod
+    def _read_journal(path: str) -> List[Tuple[float, bool, str, int]]:
+        """读取变化日志，返回 (时间, 是否直飞, 日期, 价格)，日志不存在时返回空列表"""
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    ts, kind, date, price = json.loads(line)
+                    entries.append((ts, HISTORY_KINDS[kind], date, price))
+                except (ValueError, TypeError, KeyError) as e:
+                    # 写入被中断时最后一行可能不完整
+                    logger.warning(f"跳过损坏的变化日志第 {line_no} 行: {path}: {e}")
+        return entries
+
+    def import_target_prices(
+        self,
+        target_prices: Dict[str, Dict[str, int]],
+        no_target_prices: Dict[str, Dict[str, int]],
+        fetched_at: Optional[float] = None,
+    ) -> int:
+        """导入内存中按航线分组的目标价格（价格为 0 的日期视为尚无数据）
+
+        Args:
+            target_prices: 按航线标识分组的直飞目标价格
+            no_target_prices: 按航线标识分组的非直飞目标价格
+            fetched_at: 快照时间，默认当前时间
+
+        Returns:
+            int: 写入的观察数
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        observations = [
+            (route, date, direct, price, fetched_at)
+            for direct, grouped in ((True, target_prices), (False, no_target_prices))
+            for route, prices in grouped.items()
+            for date, price in prices.items()
+        ]
+        return self.append_many(observations)
+
+    def flush(self) -> None:
+        with self._lock:
+            for writer in self._writers.values():
+                writer.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
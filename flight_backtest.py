@@ -0,0 +1,578 @@
+"""提醒规则回测
+
+把保存的价格历史按时间顺序重放给提醒逻辑，评估不同 priceStep 和统计规则的效果：
+- priceStep：使用与命令行监控相同的 ChangeDetector，
+  多个 priceStep 注册为同一个检测器中的不同格子，同一时刻的所有价格一次批量对比；
+- 统计规则：使用 StatsRules，参数格式与 config.json 中的 alertRules 相同。
+
+对每个策略报告：
+- 提醒数：不含首次获取，以及平均每个序列每天的提醒数；
+- 降价捕获：价格从最近的高点下降超过 --drop-percent 记为一次降价，从开始下降到
+  价格回升并再次下降之前有下降方向的提醒即视为捕获；
+- 提醒延迟：从价格降到阈值以下到第一次提醒的时间（提醒早于跌破阈值时记为 0）。
+
+价格历史可以来自：
+- historyDb：PriceStore 中的明细观察（已被汇总为小时/日数据的部分不参与回测）；
+- archiveDir：列式归档，价格相同的连续观察只取第一次；
+- GitHub/price_history.json：从 git 历史中读取每次提交的快照和变化日志。这里只保存
+  当时触发提醒的价格，适合评估比当时更大的 priceStep。
+
+不同航线互不影响，按航线分组后在多个进程中并行回测。
+
+用法：
+    python flight_backtest.py --history-db prices.db --steps 30,50,100,200
+    python flight_backtest.py --archive-dir archive --rules '{"allTimeLow": true}'
+    python flight_backtest.py --git-history GitHub/price_history.json --steps 50,100,200
+"""
+
+import argparse
+import array
+import bisect
+import json
+import logging
+import os
+import posixpath
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+from flight_archive import PriceArchive
+from flight_detect import ChangeDetector
+from flight_stats import rules_from_config
+from flight_store import Observation, PriceStore
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+DEFAULT_STEPS = (30, 50, 80, 100, 150, 200)
+DEFAULT_DROP_PERCENT = 10.0  # 价格从高点下降超过该百分比视为一次降价
+HISTORY_JSON = os.path.join("GitHub", "price_history.json")
+JOURNAL_NAME = "price_history.journal"
+HISTORY_KINDS = {"target_prices": True, "no_target_prices": False}
+RULES_STRATEGY = "alertRules"
+
+
+class PriceSeries(NamedTuple):
+    """一个 (日期, 是否直飞) 的价格历史"""
+
+    date: str
+    direct: bool
+    timestamps: array.array  # 观察时间，'d'
+    prices: array.array  # 价格，'q'
+
+
+RouteHistory = Dict[str, List[PriceSeries]]
+
+
+def step_strategy(step: int) -> str:
+    """priceStep 策略的名称"""
+    return f"priceStep={step}"
+
+
+def build_series(observations: Iterable[Observation]) -> RouteHistory:
+    """把观察记录整理为按航线分组、按时间排序的价格序列
+
+    同一序列同一时间的多条观察只保留最后一条，价格为 0 的观察被忽略。
+    """
+    grouped: Dict[Tuple[str, str, bool], Dict[float, int]] = {}
+    for route, date, direct, price, fetched_at in observations:
+        if price:
+            grouped.setdefault((route, date, direct), {})[fetched_at] = price
+    history: RouteHistory = {}
+    for (route, date, direct), points in sorted(grouped.items()):
+        ordered = sorted(points.items())
+        history.setdefault(route, []).append(
+            PriceSeries(
+                date,
+                direct,
+                array.array("d", (ts for ts, _ in ordered)),
+                array.array("q", (price for _, price in ordered)),
+            )
+        )
+    return history
+
+
+def load_store(path: str, routes: Optional[Sequence[str]] = None) -> RouteHistory:
+    """从 PriceStore 数据库读取明细观察
+
+    Args:
+        path: historyDb 数据库文件路径
+        routes: 只读取这些航线，None 表示全部
+
+    Raises:
+        FileNotFoundError: 数据库文件不存在
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"价格历史数据库不存在: {path}")
+    store = PriceStore(path)
+    try:
+        history: RouteHistory = {}
+        for route in routes or store.routes():
+            history.update(build_series(store.route_observations(route)))
+        return history
+    finally:
+        store.close()
+
+
+def load_archive(
+    directory: str, routes: Optional[Sequence[str]] = None
+) -> RouteHistory:
+    """从列式归档读取价格，每个价格相同的 run 取第一次观察
+
+    Args:
+        directory: archiveDir 归档目录
+        routes: 只读取这些航线（归档文件名中的航线标识），None 表示全部
+
+    Raises:
+        FileNotFoundError: 归档目录不存在
+    """
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"价格归档目录不存在: {directory}")
+    archive = PriceArchive(directory)
+    observations: List[Observation] = []
+    try:
+        for route, date, direct in archive.keys():
+            if routes and route not in routes:
+                continue
+            reader = archive.open_series(route, date, direct)
+            if reader is None:
+                continue
+            with reader:
+                observations.extend(
+                    (route, date, direct, price, float(start))
+                    for start, _, price, _ in reader.runs_iter()
+                )
+    finally:
+        archive.close()
+    return build_series(observations)
+
+
+def _git(args: List[str], cwd: str) -> Optional[str]:
+    result = subprocess.run(
+        ["git", *args], cwd=cwd, capture_output=True, text=True, encoding="utf-8"
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def load_git_history(path: str = HISTORY_JSON, route: str = "github") -> RouteHistory:
+    """从 git 历史中读取 price_history.json 快照和同目录的变化日志
+
+    快照中的价格以提交时间为观察时间，变化日志中的价格使用日志自带的时间。
+
+    Args:
+        path: price_history.json 的路径（位于 git 仓库中）
+        route: 回测结果中使用的航线标识
+
+    Raises:
+        ValueError: 文件不在 git 仓库中
+    """
+    path = os.path.abspath(path)
+    top = _git(["rev-parse", "--show-toplevel"], os.path.dirname(path))
+    if top is None:
+        raise ValueError(f"{path} 不在 git 仓库中")
+    top = top.strip()
+    snapshot_path = os.path.relpath(path, top).replace(os.sep, "/")
+    journal_path = posixpath.join(posixpath.dirname(snapshot_path), JOURNAL_NAME)
+    log = _git(
+        ["log", "--reverse", "--format=%H %ct", "--", snapshot_path, journal_path],
+        top,
+    )
+
+    observations: List[Observation] = []
+    commits = 0
+    for line in (log or "").splitlines():
+        commit, committed_at = line.split()
+        commits += 1
+        snapshot = _git(["show", f"{commit}:{snapshot_path}"], top)
+        if snapshot:
+            try:
+                history = json.loads(snapshot)
+            except ValueError as e:
+                logger.warning(f"跳过无法解析的快照 {commit[:8]}: {e}")
+                history = {}
+            for kind, direct in HISTORY_KINDS.items():
+                for date, price in history.get(kind, {}).items():
+                    observations.append(
+                        (route, date, direct, price, float(committed_at))
+                    )
+        journal = _git(["show", f"{commit}:{journal_path}"], top)
+        for entry in (journal or "").splitlines():
+            try:
+                logged_at, kind, date, price = json.loads(entry)
+            except (ValueError, TypeError):
+                continue  # 被中断的写入留下的不完整行
+            if kind in HISTORY_KINDS:
+                observations.append(
+                    (route, date, HISTORY_KINDS[kind], price, float(logged_at))
+                )
+    logger.info(f"从 {commits} 次提交中读取 {len(observations)} 条价格记录")
+    return build_series(observations)
+
+
+def find_drops(
+    timestamps: Sequence[float], prices: Sequence[int], drop_ratio: float
+) -> List[Tuple[float, float]]:
+    """找出价格序列中的降价
+
+    价格从最近的高点下降超过 drop_ratio 记为一次降价，之后以当前价格为新的高点。
+
+    Returns:
+        List[Tuple[float, float]]: 每次降价的 (开始下降的时间, 降到阈值以下的时间)
+    """
+    drops = []
+    peak = 0
+    onset = None
+    for ts, price in zip(timestamps, prices):
+        if price >= peak:
+            peak = price
+            onset = None
+            continue
+        if onset is None:
+            onset = ts
+        if price <= peak * (1 - drop_ratio):
+            drops.append((onset, ts))
+            peak = price
+            onset = None
+    return drops
+
+
+def _events(
+    series: List[PriceSeries],
+) -> Iterator[Tuple[float, Sequence[int], Sequence[int]]]:
+    """按时间顺序遍历所有序列的观察，同一时刻的观察合并为一批
+
+    Yields:
+        Tuple: (时间, 序列编号, 价格)
+    """
+    if np is not None:
+        sizes = [len(item.prices) for item in series]
+        timestamps = np.concatenate(
+            [np.frombuffer(item.timestamps, dtype=np.float64) for item in series]
+        )
+        prices = np.concatenate(
+            [np.frombuffer(item.prices, dtype=np.int64) for item in series]
+        )
+        indexes = np.repeat(np.arange(len(series), dtype=np.intp), sizes)
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, prices, indexes = timestamps[order], prices[order], indexes[order]
+        bounds = np.flatnonzero(np.diff(timestamps)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(timestamps)]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield float(timestamps[start]), indexes[start:end], prices[start:end]
+        return
+
+    points = sorted(
+        (ts, index, price)
+        for index, item in enumerate(series)
+        for ts, price in zip(item.timestamps, item.prices)
+    )
+    for ts, group in groupby(points, key=lambda point: point[0]):
+        group = list(group)
+        yield ts, [point[1] for point in group], [point[2] for point in group]
+
+
+def _new_metrics() -> dict:
+    return {
+        "series": 0,
+        "series_days": 0.0,
+        "first": 0,
+        "alerts": 0,
+        "down_alerts": 0,
+        "drops": 0,
+        "caught": 0,
+        "latencies": [],
+    }
+
+
+def backtest_routes(
+    history: RouteHistory,
+    steps: Sequence[int],
+    rules: Optional[dict] = None,
+    drop_percent: float = DEFAULT_DROP_PERCENT,
+) -> Dict[str, Dict[str, dict]]:
+    """在当前进程中回测一组航线
+
+    Args:
+        history: 按航线分组的价格序列
+        steps: 要评估的 priceStep
+        rules: alertRules 格式的统计规则，None 表示不评估
+        drop_percent: 降价的判定百分比
+
+    Returns:
+        Dict[str, Dict[str, dict]]: 策略名称 → 航线 → 指标
+    """
+    series: List[PriceSeries] = []
+    series_routes: List[str] = []
+    for route, items in history.items():
+        for item in items:
+            if len(item.prices):
+                series.append(item)
+                series_routes.append(route)
+
+    strategies = [step_strategy(step) for step in steps]
+    if rules is not None:
+        strategies.append(RULES_STRATEGY)
+    results = {
+        strategy: {route: _new_metrics() for route in history}
+        for strategy in strategies
+    }
+    if rules is not None:
+        for metrics in results[RULES_STRATEGY].values():
+            metrics["kinds"] = {}
+    if not series:
+        return results
+
+    # 每个序列的每个 priceStep 是检测器中的一个格子，编号为 序列编号 * 步数 + 步序号
+    width = len(steps)
+    detector = ChangeDetector()
+    for index in range(len(series)):
+        for step in steps:
+            detector.watch((index, step), step)
+    offsets = np.arange(width, dtype=np.intp) if np is not None else None
+    stats_rules = rules_from_config(rules) if rules is not None else None
+
+    # 每个策略、每个序列的下降方向提醒时间
+    down_times: List[List[List[float]]] = [
+        [[] for _ in series] for _ in strategies
+    ]
+    for ts, indexes, prices in _events(series):
+        if np is not None:
+            watch_ids = (indexes[:, None] * width + offsets).ravel()
+            cell_prices = np.repeat(prices, width)
+        else:
+            watch_ids = [index * width + k for index in indexes for k in range(width)]
+            cell_prices = [price for price in prices for _ in range(width)]
+        for change in detector.detect(watch_ids, cell_prices):
+            index, k = divmod(change.watch_id, width)
+            metrics = results[strategies[k]][series_routes[index]]
+            if not change.baseline:
+                metrics["first"] += 1
+                continue
+            metrics["alerts"] += 1
+            if change.price < change.baseline:
+                metrics["down_alerts"] += 1
+                down_times[k][index].append(ts)
+
+        if stats_rules is not None:
+            if np is not None:
+                indexes, prices = indexes.tolist(), prices.tolist()
+            for hit in stats_rules.observe(indexes, prices, ts):
+                index = indexes[hit.position]
+                metrics = results[RULES_STRATEGY][series_routes[index]]
+                metrics["alerts"] += 1
+                metrics["down_alerts"] += 1
+                down_times[-1][index].append(ts)
+                metrics["kinds"][hit.kind] = metrics["kinds"].get(hit.kind, 0) + 1
+
+    # 降价与策略无关，每个序列只计算一次，再与各策略的提醒时间匹配
+    drop_ratio = drop_percent / 100
+    for index, item in enumerate(series):
+        route = series_routes[index]
+        drops = find_drops(item.timestamps, item.prices, drop_ratio)
+        span = (item.timestamps[-1] - item.timestamps[0]) / DAY
+        for k, strategy in enumerate(strategies):
+            metrics = results[strategy][route]
+            metrics["series"] += 1
+            metrics["series_days"] += span
+            metrics["drops"] += len(drops)
+            alerts = down_times[k][index]
+            for n, (onset, crossed) in enumerate(drops):
+                end = drops[n + 1][0] if n + 1 < len(drops) else float("inf")
+                position = bisect.bisect_left(alerts, onset)
+                if position < len(alerts) and alerts[position] < end:
+                    metrics["caught"] += 1
+                    metrics["latencies"].append(max(0.0, alerts[position] - crossed))
+    return results
+
+
+def _split(history: RouteHistory, parts: int) -> List[RouteHistory]:
+    """按观察数把航线尽量均匀地分为 parts 组"""
+    sizes = {
+        route: sum(len(item.prices) for item in items)
+        for route, items in history.items()
+    }
+    groups: List[RouteHistory] = [{} for _ in range(parts)]
+    loads = [0] * parts
+    for route in sorted(sizes, key=sizes.get, reverse=True):
+        target = loads.index(min(loads))
+        groups[target][route] = history[route]
+        loads[target] += sizes[route]
+    return [group for group in groups if group]
+
+
+def run_backtest(
+    history: RouteHistory,
+    steps: Sequence[int],
+    rules: Optional[dict] = None,
+    drop_percent: float = DEFAULT_DROP_PERCENT,
+    jobs: Optional[int] = None,
+) -> Dict[str, Dict[str, dict]]:
+    """回测所有航线，航线较多时在多个进程中并行
+
+    Args:
+        history: 按航线分组的价格序列
+        steps: 要评估的 priceStep
+        rules: alertRules 格式的统计规则，None 表示不评估
+        drop_percent: 降价的判定百分比
+        jobs: 进程数，默认 CPU 核数
+
+    Returns:
+        Dict[str, Dict[str, dict]]: 策略名称 → 航线 → 指标
+    """
+    jobs = jobs or os.cpu_count() or 1
+    groups = _split(history, min(jobs * 4, len(history)) or 1)
+    if jobs == 1 or len(groups) <= 1:
+        partials = [
+            backtest_routes(group, steps, rules, drop_percent) for group in groups
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(backtest_routes, group, steps, rules, drop_percent)
+                for group in groups
+            ]
+            partials = [future.result() for future in futures]
+
+    results: Dict[str, Dict[str, dict]] = {}
+    for partial in partials:
+        for strategy, routes in partial.items():
+            results.setdefault(strategy, {}).update(routes)
+    return results
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def summarize(metrics: Iterable[dict]) -> dict:
+    """合并多条航线的指标，计算召回率和延迟分位数"""
+    total = _new_metrics()
+    kinds: Dict[str, int] = {}
+    for item in metrics:
+        for key, value in item.items():
+            if key == "kinds":
+                for kind, count in value.items():
+                    kinds[kind] = kinds.get(kind, 0) + count
+            else:
+                total[key] += value
+    latencies = total.pop("latencies")
+    days = total.pop("series_days")
+    summary = {
+        **total,
+        "alerts_per_series_day": total["alerts"] / days if days else None,
+        "recall": total["caught"] / total["drops"] if total["drops"] else None,
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p90": _percentile(latencies, 90),
+    }
+    if kinds:
+        summary["kinds"] = kinds
+    return summary
+
+
+def _format_hours(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds / 3600:.1f}h"
+
+
+def _format_row(name: str, summary: dict) -> str:
+    recall = summary["recall"]
+    per_day = summary["alerts_per_series_day"]
+    return (
+        f"{name:<18} {summary['alerts']:>8} "
+        f"{'-' if per_day is None else f'{per_day:.2f}':>8} "
+        f"{summary['caught']:>6}/{summary['drops']:<6} "
+        f"{'-' if recall is None else f'{recall:.0%}':>6} "
+        f"{_format_hours(summary['latency_p50']):>8} "
+        f"{_format_hours(summary['latency_p90']):>8}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用保存的价格历史回测提醒规则")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--history-db", help="historyDb 价格历史数据库")
+    source.add_argument("--archive-dir", help="archiveDir 列式归档目录")
+    source.add_argument(
+        "--git-history",
+        nargs="?",
+        const=HISTORY_JSON,
+        help="从 git 历史读取 price_history.json 快照（默认 GitHub/price_history.json）",
+    )
+    parser.add_argument(
+        "--route-name", default="github", help="--git-history 在结果中的航线标识"
+    )
+    parser.add_argument(
+        "--steps",
+        default=",".join(str(step) for step in DEFAULT_STEPS),
+        help="要评估的 priceStep，逗号分隔",
+    )
+    parser.add_argument("--routes", default=None, help="只回测这些航线，逗号分隔")
+    parser.add_argument(
+        "--rules", default=None, help="同时评估的统计规则，alertRules 格式的 JSON"
+    )
+    parser.add_argument(
+        "--drop-percent",
+        type=float,
+        default=DEFAULT_DROP_PERCENT,
+        help="价格从高点下降超过该百分比视为一次降价",
+    )
+    parser.add_argument("--jobs", type=int, default=None, help="并行进程数")
+    parser.add_argument("--by-route", action="store_true", help="输出每条航线的结果")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    routes = args.routes.split(",") if args.routes else None
+    if args.history_db:
+        history = load_store(args.history_db, routes)
+    elif args.archive_dir:
+        history = load_archive(args.archive_dir, routes)
+    else:
+        history = load_git_history(args.git_history, args.route_name)
+    steps = sorted({int(step) for step in args.steps.split(",")})
+    rules = json.loads(args.rules) if args.rules else None
+
+    series_count = sum(len(items) for items in history.values())
+    observations = sum(
+        len(item.prices) for items in history.values() for item in items
+    )
+    print(f"{len(history)} 条航线，{series_count} 个序列，{observations} 条观察")
+    results = run_backtest(history, steps, rules, args.drop_percent, args.jobs)
+
+    header = (
+        f"{'策略':<16} {'提醒数':>6} {'每序列每天':>4} {'捕获/降价':>11} "
+        f"{'召回率':>4} {'延迟p50':>8} {'延迟p90':>8}"
+    )
+    report = {"drop_percent": args.drop_percent, "strategies": {}}
+    print(header)
+    for strategy, by_route in results.items():
+        summary = summarize(by_route.values())
+        report["strategies"][strategy] = {"summary": summary, "routes": {}}
+        print(_format_row(strategy, summary))
+        if "kinds" in summary:
+            print(f"{'':<18} 命中类型: {summary['kinds']}")
+        for route, metrics in by_route.items():
+            route_summary = summarize([metrics])
+            report["strategies"][strategy]["routes"][route] = route_summary
+            if args.by_route:
+                print(_format_row(f"  {route}", route_summary))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""全局请求预算分配
+
+携程接口在每小时请求过多时会返回 status == 2。预算分配器在调度器和抓取之间：
+- 按每小时请求上限把查询次数分配给各航线，使预期捕捉到的价格变化次数最大；
+- 每条航线的变化速率用 Gamma 后验描述，分配时做 Thompson 采样（多臂老虎机），
+  变化多的航线多查询，同时给变化少的航线保留探索机会；
+- 以滑动一小时窗口计数，超出预算的到期航线推迟到有额度时再查询；
+- report() 汇总预算的实际使用情况。
+"""
+
+import heapq
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 3600  # 预算窗口（秒）
+PRIOR_EVENTS = 1.0  # Gamma 先验：相当于观察到 1 次变化
+PRIOR_HOURS = 24.0  # Gamma 先验：相当于观察了 24 小时
+MAX_ALLOCATION_STEPS = 2000  # 贪心分配的最大步数
+
+
+def expected_detections(rate: float, polls_per_hour: float) -> float:
+    """以给定频率查询时每小时预期发现的价格变化次数
+
+    价格变化视为速率为 rate（次/小时）的泊松过程，每次查询只要距上次查询
+    发生过变化就算发现一次：polls * (1 - exp(-rate / polls))。
+
+    Args:
+        rate: 价格变化速率（次/小时）
+        polls_per_hour: 每小时查询次数
+
+    Returns:
+        float: 每小时预期发现的变化次数
+    """
+    if polls_per_hour <= 0 or rate <= 0:
+        return 0.0
+    return polls_per_hour * -math.expm1(-rate / polls_per_hour)
+
+
+class _RouteStats:
+    __slots__ = ("events", "hours", "polls", "changes", "last_poll", "per_hour")
+
+    def __init__(self):
+        self.events = 0.0  # 观察到的变化次数
+        self.hours = 0.0  # 观察时长（小时）
+        self.polls = 0  # 累计查询次数
+        self.changes = 0  # 累计发现的变化次数
+        self.last_poll: Optional[float] = None
+        self.per_hour = 0.0  # 当前分配的每小时查询次数
+
+
+class BudgetAllocator:
+    """按每小时请求上限在各航线之间分配查询次数（线程安全）"""
+
+    def __init__(
+        self,
+        requests_per_hour: int,
+        requests_per_poll: int = 2,
+        min_interval: float = 60,
+        max_interval: float = 24 * 3600,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            requests_per_hour: 每小时请求上限
+            requests_per_poll: 每次查询一条航线消耗的请求数（直飞 + 非直飞）
+            min_interval: 单条航线的最短查询间隔（秒）
+            max_interval: 单条航线的最长查询间隔（秒）
+            clock: 时钟函数
+            rng: 随机数生成器，用于 Thompson 采样
+        """
+        if requests_per_hour < requests_per_poll:
+            raise ValueError("requests_per_hour 不能小于单次查询消耗的请求数")
+        self.requests_per_hour = requests_per_hour
+        self.requests_per_poll = requests_per_poll
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self._rng = rng or random.Random()
+        self._routes: Dict[Hashable, _RouteStats] = {}
+        self._spent: deque = deque()  # 窗口内每次查询的时间
+        self._deferred = 0
+        self._lock = threading.Lock()
+
+    def add_route(self, key: Hashable) -> None:
+        """登记一条航线"""
+        with self._lock:
+            self._routes.setdefault(key, _RouteStats())
+
+    def remove_route(self, key: Hashable) -> None:
+        """移除一条航线"""
+        with self._lock:
+            self._routes.pop(key, None)
+
+    def record_poll(self, key: Hashable, changes: int) -> None:
+        """记录一次查询的结果，更新该航线的变化速率后验
+
+        Args:
+            key: 航线标识
+            changes: 本次查询发现的、超过 priceStep 的价格变化次数
+        """
+        now = self.clock()
+        with self._lock:
+            stats = self._routes.setdefault(key, _RouteStats())
+            if stats.last_poll is not None:
+                stats.hours += max(0.0, now - stats.last_poll) / 3600
+                stats.events += changes
+            stats.last_poll = now
+            stats.polls += 1
+            stats.changes += changes
+
+    def mean_rate(self, key: Hashable) -> float:
+        """航线变化速率的后验均值（次/小时）"""
+        stats = self._routes.get(key) or _RouteStats()
+        return (PRIOR_EVENTS + stats.events) / (PRIOR_HOURS + stats.hours)
+
+    def allocate(self) -> Dict[Hashable, float]:
+        """重新分配每条航线的查询间隔
+
+        对每条航线从后验中采样一个变化速率，然后按边际收益贪心地分配
+        每小时的查询次数，直到用完预算。
+
+        Returns:
+            Dict[Hashable, float]: 航线标识到查询间隔（秒）的映射
+        """
+        with self._lock:
+            if not self._routes:
+                return {}
+            budget = self.requests_per_hour / self.requests_per_poll
+            floor = 3600 / self.max_interval
+            ceiling = 3600 / self.min_interval
+
+            rates = {}
+            for key, stats in self._routes.items():
+                shape = PRIOR_EVENTS + stats.events
+                scale = 1 / (PRIOR_HOURS + stats.hours)
+                rates[key] = self._rng.gammavariate(shape, scale)
+
+            # 每条航线先分到最低频率，预算不足时按比例缩减
+            base = min(floor, budget / len(rates))
+            allocation = {key: base for key in rates}
+            remaining = budget - base * len(rates)
+            step = max(remaining / MAX_ALLOCATION_STEPS, 1e-6)
+
+            def _gain(key):
+                current = allocation[key]
+                return expected_detections(
+                    rates[key], current + step
+                ) - expected_detections(rates[key], current)
+
+            heap = [(-_gain(key), key_index, key) for key_index, key in enumerate(rates)]
+            heapq.heapify(heap)
+            while heap and remaining >= step:
+                neg_gain, key_index, key = heapq.heappop(heap)
+                if neg_gain >= 0:
+                    break
+                allocation[key] += step
+                remaining -= step
+                if allocation[key] + step <= ceiling:
+                    heapq.heappush(heap, (-_gain(key), key_index, key))
+
+            intervals = {}
+            for key, per_hour in allocation.items():
+                self._routes[key].per_hour = per_hour
+                intervals[key] = min(
+                    max(3600 / per_hour, self.min_interval), 10 * self.max_interval
+                )
+            return intervals
+
+    def prioritize(self, keys: List[Hashable]) -> List[Hashable]:
+        """按预期收益（后验速率 × 距上次查询的时长）从高到低排序到期航线"""
+        now = self.clock()
+
+        def _value(key):
+            stats = self._routes.get(key)
+            waited = now - stats.last_poll if stats and stats.last_poll else WINDOW
+            return self.mean_rate(key) * waited
+
+        with self._lock:
+            return sorted(keys, key=_value, reverse=True)
+
+    def try_acquire(self, key: Hashable) -> bool:
+        """为一次查询申请预算
+
+        Args:
+            key: 航线标识
+
+        Returns:
+            bool: 窗口内仍有额度时返回 True 并记账，否则返回 False
+        """
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            if (len(self._spent) + 1) * self.requests_per_poll > self.requests_per_hour:
+                self._deferred += 1
+                return False
+            self._spent.append(now)
+            return True
+
+    def seconds_until_available(self) -> float:
+        """距离窗口内释放出下一次查询额度还有多少秒"""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            if (len(self._spent) + 1) * self.requests_per_poll <= self.requests_per_hour:
+                return 0.0
+            return max(0.0, self._spent[0] + WINDOW - now)
+
+    def report(self) -> dict:
+        """汇总预算使用情况
+
+        Returns:
+            dict: 包含窗口内已用请求数、上限、被推迟的查询次数及每条航线的统计
+        """
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            return {
+                "limit": self.requests_per_hour,
+                "used": len(self._spent) * self.requests_per_poll,
+                "deferred": self._deferred,
+                "routes": {
+                    key: {
+                        "polls": stats.polls,
+                        "changes": stats.changes,
+                        "rate_per_hour": round(self.mean_rate(key), 4),
+                        "allocated_per_hour": round(stats.per_hour, 2),
+                    }
+                    for key, stats in self._routes.items()
+                },
+            }
+
+    def _expire(self, now: float) -> None:
+        """移除窗口之外的记录，调用方需持有锁"""
+        while self._spent and self._spent[0] <= now - WINDOW:
+            self._spent.popleft()
@@ -0,0 +1,234 @@
+"""lowestPrice 响应缓存（stale-while-revalidate）
+
+以 (dcity, acity, flightWay, direct) 为键缓存价格日历：
+- 未过期（TTL 内）的数据直接返回；
+- 过期但仍在 stale 窗口内的数据立即返回，同时在后台只发起一次刷新；
+- 接口失败时继续返回最后一次成功的数据，并标记为 stale；
+- 内存中按 LRU 淘汰，可选地同步写入磁盘目录，供同一台机器上的多个进程共享。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from flight_transport import build_params
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60  # 缓存有效期（秒）
+DEFAULT_STALE_TTL = 60  # 过期后仍可直接返回旧数据的时长（秒）
+DEFAULT_MAX_ENTRIES = 256  # 内存中最多缓存的条目数
+STALE_KEY = "_stale"  # 返回数据中表示数据已过期的字段
+
+CacheKey = Tuple[str, str, str, bool]
+
+
+def get_cache_key(config: dict, direct: bool) -> CacheKey:
+    """生成缓存键 (dcity, acity, flightWay, direct)"""
+    params = build_params(config, direct)
+    return (params["dcity"], params["acity"], params["flightWay"], direct)
+
+
+def is_stale(data: dict) -> bool:
+    """判断缓存返回的数据是否已过期"""
+    return bool(data.get(STALE_KEY))
+
+
+class _CacheEntry:
+    __slots__ = ("data", "fetched_at", "refreshing")
+
+    def __init__(self, data: dict, fetched_at: float):
+        self.data = data
+        self.fetched_at = fetched_at
+        self.refreshing = False
+
+
+class PriceCache:
+    """位于 fetch_flight_prices 之前的响应缓存
+
+    用法与 fetch_flight_prices 相同：cache.fetch(config, direct)。
+    """
+
+    def __init__(
+        self,
+        fetch_func: Callable[[dict, bool], dict],
+        ttl: float = DEFAULT_TTL,
+        stale_ttl: float = DEFAULT_STALE_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        disk_dir: Optional[str] = None,
+        refresh_workers: int = 2,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            fetch_func: 实际的抓取函数，签名为 fetch_func(config, direct)
+            ttl: 缓存有效期（秒）
+            stale_ttl: 过期后仍可直接返回旧数据并后台刷新的时长（秒）
+            max_entries: 内存中最多缓存的条目数
+            disk_dir: 磁盘缓存目录，为 None 时只使用内存缓存
+            refresh_workers: 后台刷新线程数
+            clock: 时钟函数
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries 必须是正整数")
+        self.fetch_func = fetch_func
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.clock = clock
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="cache-refresh"
+        )
+
+    def fetch(self, config: dict, direct: bool = True) -> dict:
+        """获取价格数据，优先返回缓存
+
+        Args:
+            config: 配置信息
+            direct: 是否只查询直飞航班
+
+        Returns:
+            dict: 航班价格数据，过期数据带有 STALE_KEY 标记
+
+        Raises:
+            requests.exceptions.RequestException, ValueError:
+                接口失败且没有任何可用的缓存数据
+        """
+        key = get_cache_key(config, direct)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._get_entry(key, now)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    return entry.data
+                if age < self.ttl + self.stale_ttl:
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        self._executor.submit(self._refresh, key, config, direct)
+                    return {**entry.data, STALE_KEY: True}
+
+            # 同一个键同时只有一个请求在进行，其余调用方等待其结果
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if owner:
+            try:
+                data = self.fetch_func(config, direct)
+                self._store(key, data)
+                future.set_result(data)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        try:
+            return future.result()
+        except Exception as e:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                raise
+            logger.warning(f"{key} 获取价格失败，使用缓存的旧数据: {e}")
+            return {**entry.data, STALE_KEY: True}
+
+    def _refresh(self, key: CacheKey, config: dict, direct: bool) -> None:
+        """后台刷新一个缓存条目"""
+        try:
+            self._store(key, self.fetch_func(config, direct))
+        except Exception as e:
+            logger.warning(f"{key} 后台刷新失败，继续使用旧数据: {e}")
+        finally:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+
+    def _get_entry(self, key: CacheKey, now: float) -> Optional[_CacheEntry]:
+        """取出条目，内存中的条目缺失或过期时尝试读取磁盘上更新的版本
+
+        调用方需持有锁。
+        """
+        entry = self._entries.get(key)
+        if entry is None or now - entry.fetched_at >= self.ttl:
+            disk_entry = self._load_from_disk(key)
+            if disk_entry is not None and (
+                entry is None or disk_entry.fetched_at > entry.fetched_at
+            ):
+                if entry is not None:
+                    disk_entry.refreshing = entry.refreshing
+                entry = disk_entry
+            if entry is None:
+                return None
+            self._put(key, entry)
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: CacheKey, entry: _CacheEntry) -> None:
+        """写入内存并按 LRU 淘汰，调用方需持有锁"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, key: CacheKey, data: dict) -> None:
+        """保存一次成功的抓取结果"""
+        entry = _CacheEntry(data, self.clock())
+        with self._lock:
+            self._put(key, entry)
+        self._save_to_disk(key, entry)
+
+    def _disk_path(self, key: CacheKey) -> str:
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{name}.json")
+
+    def _load_from_disk(self, key: CacheKey) -> Optional[_CacheEntry]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            return _CacheEntry(payload["data"], payload["fetched_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取磁盘缓存失败: {e}")
+            return None
+
+    def _save_to_disk(self, key: CacheKey, entry: _CacheEntry) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"data": entry.data, "fetched_at": entry.fetched_at},
+                    f,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入磁盘缓存失败: {e}")
+
+    def close(self) -> None:
+        """关闭后台刷新线程"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,171 @@
+"""自适应查询节奏
+
+根据每个 (航线, 日期, 是否直飞) 序列实际观察到的价格变化频率估算变化速率，
+让价格长期不动的日期少查询，临近出发的日期多查询，已经过去的日期不再查询。
+航线的查询间隔取其所有未过期日期中最短的那个间隔。
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HALF_LIFE = 3 * 24 * 3600  # 历史观察的半衰期（秒）
+DEFAULT_HORIZON_DAYS = 30  # 距出发多少天内开始缩短间隔
+DEFAULT_TARGET_CHANGES = 0.5  # 每个间隔内期望的价格变化次数
+PRIOR_PERIOD = 24 * 3600  # 先验：每天变化一次
+PRIOR_WEIGHT = 0.25  # 先验的权重（相当于多少个先验周期的观察）
+
+
+def departure_deadline(date: str) -> float:
+    """出发日期当天结束的时间戳
+
+    Args:
+        date: YYYYMMDD 格式的日期
+
+    Returns:
+        float: 本地时间出发日期次日零点的时间戳
+    """
+    day = datetime.strptime(date, "%Y%m%d") + timedelta(days=1)
+    return day.timestamp()
+
+
+def active_dates(dates: Iterable[str], now: Optional[float] = None) -> List[str]:
+    """过滤掉已经过去的日期
+
+    Args:
+        dates: YYYYMMDD 格式的日期列表
+        now: 当前时间戳
+
+    Returns:
+        List[str]: 尚未过去的日期
+    """
+    now = time.time() if now is None else now
+    return [date for date in dates if departure_deadline(date) > now]
+
+
+class _SeriesRate:
+    __slots__ = ("last_price", "last_time", "events", "exposure")
+
+    def __init__(self):
+        self.last_price: Optional[int] = None
+        self.last_time = 0.0
+        self.events = 0.0  # 衰减后的变化次数
+        self.exposure = 0.0  # 衰减后的观察时长（秒）
+
+
+class CadencePolicy:
+    """根据价格变化频率和距出发天数计算查询间隔"""
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        horizon_days: float = DEFAULT_HORIZON_DAYS,
+        target_changes: float = DEFAULT_TARGET_CHANGES,
+        half_life: float = DEFAULT_HALF_LIFE,
+    ):
+        """
+        Args:
+            min_interval: 最短查询间隔（秒）
+            max_interval: 最长查询间隔（秒）
+            horizon_days: 距出发少于该天数时按比例缩短间隔
+            target_changes: 每个查询间隔内期望捕捉到的价格变化次数
+            half_life: 历史观察的半衰期（秒），越小对近期变化越敏感
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("需要满足 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.horizon_days = horizon_days
+        self.target_changes = target_changes
+        self.half_life = half_life
+        self._series: Dict[Hashable, _SeriesRate] = {}
+
+    def observe(
+        self, key: Hashable, price: Optional[int], now: Optional[float] = None
+    ) -> None:
+        """记录一次观察到的价格
+
+        Args:
+            key: 序列标识，如 (航线标识, 日期, 是否直飞)
+            price: 本次价格，为空时忽略
+            now: 观察时间戳
+        """
+        if not price:
+            return
+        now = time.time() if now is None else now
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _SeriesRate()
+        if series.last_price is not None:
+            dt = max(0.0, now - series.last_time)
+            decay = 0.5 ** (dt / self.half_life)
+            series.events = series.events * decay + (price != series.last_price)
+            series.exposure = series.exposure * decay + dt
+        series.last_price = price
+        series.last_time = now
+
+    def change_rate(self, key: Hashable) -> float:
+        """估算序列每秒的价格变化次数（带先验的泊松速率估计）"""
+        series = self._series.get(key)
+        events = series.events if series else 0.0
+        exposure = series.exposure if series else 0.0
+        return (events + PRIOR_WEIGHT) / (exposure + PRIOR_WEIGHT * PRIOR_PERIOD)
+
+    def interval_for(
+        self, keys: Iterable[Hashable], date: str, now: Optional[float] = None
+    ) -> Optional[float]:
+        """计算一个日期的查询间隔
+
+        Args:
+            keys: 该日期对应的序列标识（如直飞和非直飞）
+            date: YYYYMMDD 格式的出发日期
+            now: 当前时间戳
+
+        Returns:
+            Optional[float]: 查询间隔（秒），日期已过去时返回 None
+        """
+        now = time.time() if now is None else now
+        seconds_left = departure_deadline(date) - now
+        if seconds_left <= 0:
+            return None
+
+        rate = sum(self.change_rate(key) for key in keys)
+        interval = self.target_changes / rate if rate > 0 else self.max_interval
+
+        # 临近出发时价格波动更频繁，按剩余天数线性缩短间隔
+        days_left = seconds_left / 86400
+        if days_left < self.horizon_days:
+            interval *= max(days_left / self.horizon_days, 0.0)
+
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def route_interval(
+        self, route_key: str, dates: Iterable[str], now: Optional[float] = None
+    ) -> Optional[float]:
+        """计算航线的查询间隔，即其所有未过期日期中最短的间隔
+
+        Args:
+            route_key: 航线标识
+            dates: 该航线监控的日期
+            now: 当前时间戳
+
+        Returns:
+            Optional[float]: 查询间隔（秒），所有日期都已过去时返回 None
+        """
+        intervals = [
+            self.interval_for(
+                [(route_key, date, True), (route_key, date, False)], date, now
+            )
+            for date in dates
+        ]
+        intervals = [interval for interval in intervals if interval is not None]
+        return min(intervals) if intervals else None
+
+    def forget(self, route_key: str, date: str) -> None:
+        """删除一个日期的历史观察"""
+        self._series.pop((route_key, date, True), None)
+        self._series.pop((route_key, date, False), None)
@@ -0,0 +1,38 @@
+"""可替换的时钟
+
+监控循环和各组件都通过 clock()（返回当前时间戳）和 sleep(seconds) 访问时间，
+默认使用 time.time 和 time.sleep。VirtualClock 提供同样的两个函数，sleep 不真正
+等待而是把虚拟时间向前推进，用于在几秒内模拟几十天的查询。
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class VirtualClock:
+    """虚拟时钟（线程安全）
+
+    每次 sleep 都把时间向前推进，多个线程同时等待时按先后顺序累加。
+    需要确定的执行顺序时，应让抓取只使用一个线程（maxWorkers 为 1）。
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        """
+        Args:
+            start: 起始时间戳，默认当前真实时间
+        """
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        """当前虚拟时间戳，可直接作为 clock 参数"""
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds: float) -> None:
+        """把虚拟时间推进 seconds 秒，可直接作为 sleep 参数"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._now += seconds
@@ -0,0 +1,173 @@
+"""价格提醒合并与抖动抑制
+
+价格在阈值附近来回波动时，每次超过 priceStep 都会产生一条提醒。合并器在提醒
+和发送之间缓冲：
+- 同一 (航线, 日期, 是否直飞) 在窗口内的多次变化合并为一条净变化提醒；
+- 窗口结束时净变化小于 priceStep（如 A→B→A）的视为抖动，不再提醒；
+- 每小时发出的提醒数有上限，超出的提醒留在缓冲区继续合并，等额度恢复后发送；
+- 目标价格等其他类型的提醒按 (序列, 类型, 基准价格) 单独合并，不做抖动判断；
+- stats() 统计被合并、被抑制和被推迟的提醒数。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from flight_events import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 300  # 合并窗口（秒）
+HOUR = 3600
+
+
+def _pending_key(alert: PriceAlert) -> tuple:
+    """priceStep 提醒按序列合并，其他类型的提醒按 (序列, 类型, 基准价格) 合并"""
+    if alert.kind == "step":
+        return alert.series
+    return (*alert.series, alert.kind, alert.baseline)
+
+
+class _Pending:
+    __slots__ = ("first", "last", "price_step", "opened_at", "merged", "capped")
+
+    def __init__(self, alert: PriceAlert, price_step: int, opened_at: float):
+        self.first = alert  # 窗口内第一条提醒，提供基准价格
+        self.last = alert  # 窗口内最后一条提醒，提供当前价格
+        self.price_step = price_step
+        self.opened_at = opened_at
+        self.merged = 1
+        self.capped = False  # 是否因每小时上限被推迟过
+
+
+class AlertCoalescer:
+    """按序列合并价格提醒（线程安全）"""
+
+    def __init__(
+        self,
+        format_message: Callable[[str, bool, int, int], str],
+        window: float = DEFAULT_WINDOW,
+        max_per_hour: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            format_message: 由 (日期, 是否直飞, 价格, 基准价格) 生成净变化提醒文本的函数
+            window: 合并窗口（秒）
+            max_per_hour: 每小时最多发出的提醒数，None 表示不限
+            clock: 时钟函数
+        """
+        if window < 0:
+            raise ValueError("window 不能小于0")
+        if max_per_hour is not None and max_per_hour <= 0:
+            raise ValueError("max_per_hour 必须大于0")
+        self.format_message = format_message
+        self.window = window
+        self.max_per_hour = max_per_hour
+        self.clock = clock
+        self._pending: Dict[tuple, _Pending] = {}
+        self._sent: deque = deque()  # 最近一小时内发出提醒的时间
+        self._counters = {
+            "received": 0,
+            "emitted": 0,
+            "coalesced": 0,
+            "flaps": 0,
+            "capped": 0,
+        }
+        self._lock = threading.Lock()
+
+    def add(self, alerts: List[PriceAlert], price_step: int) -> None:
+        """放入一批提醒
+
+        Args:
+            alerts: 同一条航线的价格提醒
+            price_step: 该航线的价格变化阈值
+        """
+        now = self.clock()
+        with self._lock:
+            for alert in alerts:
+                self._counters["received"] += 1
+                key = _pending_key(alert)
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = _Pending(alert, price_step, now)
+                else:
+                    pending.last = alert
+                    pending.merged += 1
+                    self._counters["coalesced"] += 1
+
+    def flush(self) -> List[PriceAlert]:
+        """取出窗口已经结束的净变化提醒
+
+        Returns:
+            List[PriceAlert]: 需要发送的提醒
+        """
+        now = self.clock()
+        ready = []
+        with self._lock:
+            self._expire(now)
+            for key, pending in list(self._pending.items()):
+                if now - pending.opened_at < self.window:
+                    continue
+                first, last = pending.first, pending.last
+                net_change = last.price - first.baseline
+                if (
+                    last.kind == "step"
+                    and first.baseline
+                    and abs(net_change) < pending.price_step
+                ):
+                    # 窗口内价格来回变动，净变化不足阈值
+                    del self._pending[key]
+                    self._counters["flaps"] += pending.merged
+                    route, date, direct = last.series
+                    logger.info(
+                        f"抑制抖动提醒: {route} {date} {'直飞' if direct else '非直飞'} "
+                        f"¥{first.baseline} → ¥{last.price}"
+                    )
+                    continue
+                if self.max_per_hour is not None and (
+                    len(self._sent) + len(ready) >= self.max_per_hour
+                ):
+                    # 超出每小时上限，留在缓冲区继续合并
+                    if not pending.capped:
+                        pending.capped = True
+                        self._counters["capped"] += 1
+                    continue
+                del self._pending[key]
+                if pending.merged == 1 or last.kind != "step":
+                    ready.append(last)
+                else:
+                    ready.append(
+                        last._replace(
+                            baseline=first.baseline,
+                            message=self.format_message(
+                                last.date, last.direct, last.price, first.baseline
+                            ),
+                        )
+                    )
+            self._sent.extend([now] * len(ready))
+            self._counters["emitted"] += len(ready)
+        return ready
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """距离最早的窗口结束还有多少秒，没有缓冲的提醒时返回 None"""
+        now = self.clock()
+        with self._lock:
+            if not self._pending:
+                return None
+            due = min(p.opened_at for p in self._pending.values()) + self.window
+            if self.max_per_hour is not None and len(self._sent) >= self.max_per_hour:
+                due = max(due, self._sent[0] + HOUR)
+            return max(0.0, due - now)
+
+    def stats(self) -> Dict[str, int]:
+        """收到、发出、被合并、被当作抖动抑制和因上限推迟的提醒数"""
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending))
+
+    def _expire(self, now: float) -> None:
+        """移除一小时之前的发送记录，调用方需持有锁"""
+        while self._sent and self._sent[0] <= now - HOUR:
+            self._sent.popleft()
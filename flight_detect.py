@@ -0,0 +1,256 @@
+"""批量价格变化检测
+
+每个 (航线, 日期, 是否直飞) 在注册时分配一个监控编号，基准价格和价格变化阈值
+保存在按编号索引的数组中。一轮查询的所有价格一次性传入 detect()，批量计算：
+- 首次获取掩码：基准价格为 0 表示尚未获取过价格；
+- 变化量和阈值判断：|当前价格 - 基准价格| >= 阈值；
+- 只返回需要提醒的格子，并把它们的基准价格重置为当前价格。
+
+命令行、回测、图形界面和 GitHub Actions 脚本共用这一份判断规则；价格为 0 或缺失的
+格子不参与判断。只监控一条航线的调用方用 detect_calendar 对比一轮价格日历。
+安装了 NumPy 时使用向量化计算，否则退回到逐个比较。
+"""
+
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+Series = Tuple[str, str, bool]  # (航线, 日期, 是否直飞)
+
+INITIAL_CAPACITY = 256
+
+
+class Change(NamedTuple):
+    """一个需要提醒的格子"""
+
+    watch_id: int  # 监控编号
+    price: int  # 当前价格
+    baseline: int  # 提醒前的基准价格，0 表示首次获取
+
+
+class CalendarChange(NamedTuple):
+    """价格日历中一个需要提醒的日期"""
+
+    date: str  # 出发日期
+    direct: bool  # 是否直飞
+    price: int  # 当前价格
+    baseline: int  # 提醒前的基准价格，0 表示首次获取
+
+
+class ChangeDetector:
+    """按监控编号保存基准价格的变化检测器（线程安全）"""
+
+    def __init__(self, use_numpy: Optional[bool] = None):
+        """
+        Args:
+            use_numpy: 是否使用 NumPy，None 表示安装了就使用
+
+        Raises:
+            ImportError: 指定使用 NumPy 但未安装
+        """
+        if use_numpy and np is None:
+            raise ImportError("ChangeDetector 的向量化计算需要安装 numpy")
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self._ids: Dict[Series, int] = {}
+        self._series: List[Optional[Series]] = []
+        self._free: List[int] = []  # 已释放、可以重新分配的监控编号
+        if self.use_numpy:
+            self._baselines = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+            self._steps = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        else:
+            self._baselines = []
+            self._steps = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def watch(self, series: Series, price_step: int) -> int:
+        """注册一个格子，已注册时只更新阈值
+
+        Args:
+            series: (航线, 日期, 是否直飞)
+            price_step: 价格变化阈值
+
+        Returns:
+            int: 监控编号
+        """
+        with self._lock:
+            watch_id = self._ids.get(series)
+            if watch_id is not None:
+                self._steps[watch_id] = price_step
+                return watch_id
+            if self._free:
+                watch_id = self._free.pop()
+                self._ids[series] = watch_id
+                self._series[watch_id] = series
+                self._baselines[watch_id] = 0
+                self._steps[watch_id] = price_step
+                return watch_id
+            watch_id = len(self._series)
+            self._ids[series] = watch_id
+            self._series.append(series)
+            if self.use_numpy:
+                if watch_id == len(self._baselines):
+                    self._baselines = np.concatenate(
+                        (self._baselines, np.zeros_like(self._baselines))
+                    )
+                    self._steps = np.concatenate(
+                        (self._steps, np.zeros_like(self._steps))
+                    )
+                self._baselines[watch_id] = 0
+                self._steps[watch_id] = price_step
+            else:
+                self._baselines.append(0)
+                self._steps.append(price_step)
+            return watch_id
+
+    def forget(self, series: Series) -> Optional[int]:
+        """释放一个格子，编号之后可能分配给新注册的格子
+
+        Returns:
+            Optional[int]: 被释放的监控编号，未注册时返回 None
+        """
+        with self._lock:
+            watch_id = self._ids.pop(series, None)
+            if watch_id is None:
+                return None
+            self._series[watch_id] = None
+            self._baselines[watch_id] = 0
+            self._steps[watch_id] = 0
+            self._free.append(watch_id)
+            return watch_id
+
+    def watch_id(self, series: Series) -> Optional[int]:
+        """格子的监控编号，未注册时返回 None"""
+        return self._ids.get(series)
+
+    def series(self, watch_id: int) -> Series:
+        """监控编号对应的 (航线, 日期, 是否直飞)"""
+        return self._series[watch_id]
+
+    def get_baseline(self, series: Series) -> int:
+        """格子当前的基准价格，未注册或尚未获取过价格时返回 0"""
+        watch_id = self._ids.get(series)
+        if watch_id is None:
+            return 0
+        with self._lock:
+            return int(self._baselines[watch_id])
+
+    def set_baseline(self, series: Series, price: int) -> bool:
+        """直接设置基准价格，如从发件箱恢复
+
+        Returns:
+            bool: 格子是否已注册
+        """
+        watch_id = self._ids.get(series)
+        if watch_id is None:
+            return False
+        with self._lock:
+            self._baselines[watch_id] = price
+        return True
+
+    def baselines(self) -> Dict[Series, int]:
+        """所有已获取过价格的格子的基准价格"""
+        with self._lock:
+            values = self._baselines[: len(self._series)]
+            if self.use_numpy:
+                values = values.tolist()
+            return {
+                series: price
+                for series, price in zip(self._series, values)
+                if price
+            }
+
+    def detect(self, watch_ids: Sequence[int], prices: Sequence[int]) -> List[Change]:
+        """批量对比一轮价格与基准价格，更新需要提醒的格子的基准价格
+
+        Args:
+            watch_ids: 监控编号，同一批内不能重复
+            prices: 与 watch_ids 一一对应的当前价格，0 表示没有价格
+
+        Returns:
+            List[Change]: 需要提醒的格子，顺序与输入一致
+        """
+        if len(watch_ids) != len(prices):
+            raise ValueError("watch_ids 和 prices 的长度必须相同")
+        if not len(watch_ids):
+            return []
+        with self._lock:
+            if self.use_numpy:
+                return self._detect_numpy(watch_ids, prices)
+            return self._detect_python(watch_ids, prices)
+
+    def _detect_numpy(
+        self, watch_ids: Sequence[int], prices: Sequence[int]
+    ) -> List[Change]:
+        count = len(watch_ids)
+        if isinstance(watch_ids, np.ndarray) and isinstance(prices, np.ndarray):
+            # 回测等批量调用直接传入数组，不逐个转换
+            ids = watch_ids.astype(np.intp, copy=False)
+            current = prices.astype(np.int64, copy=False)
+        else:
+            ids = np.fromiter(watch_ids, dtype=np.intp, count=count)
+            current = np.fromiter(prices, dtype=np.int64, count=count)
+        baselines = self._baselines[ids]
+        first_seen = baselines == 0
+        crossed = np.abs(current - baselines) >= self._steps[ids]
+        changed = (current != 0) & (first_seen | crossed)
+        ids, current, baselines = ids[changed], current[changed], baselines[changed]
+        self._baselines[ids] = current
+        return [
+            Change(*cell)
+            for cell in zip(ids.tolist(), current.tolist(), baselines.tolist())
+        ]
+
+    def _detect_python(
+        self, watch_ids: Sequence[int], prices: Sequence[int]
+    ) -> List[Change]:
+        changes = []
+        for watch_id, price in zip(watch_ids, prices):
+            if not price:
+                continue
+            baseline = self._baselines[watch_id]
+            if baseline and abs(price - baseline) < self._steps[watch_id]:
+                continue
+            self._baselines[watch_id] = price
+            changes.append(Change(watch_id, price, baseline))
+        return changes
+
+
+def detect_calendar(
+    detector: ChangeDetector,
+    route: str,
+    dates: Sequence[str],
+    direct_prices: Dict[str, int],
+    non_direct_prices: Dict[str, int],
+    price_step: int,
+) -> List[CalendarChange]:
+    """对比一条航线一轮查询的价格日历，未注册的日期自动注册
+
+    Args:
+        detector: 变化检测器
+        route: 航线标识
+        dates: 监控的出发日期
+        direct_prices: 直飞价格日历 {日期: 价格}
+        non_direct_prices: 非直飞价格日历 {日期: 价格}
+        price_step: 价格变化阈值
+
+    Returns:
+        List[CalendarChange]: 需要提醒的日期，按日期顺序、同一日期先直飞后非直飞
+    """
+    watch_ids = []
+    prices = []
+    for date in dates:
+        for direct, calendar in ((True, direct_prices), (False, non_direct_prices)):
+            watch_ids.append(detector.watch((route, date, direct), price_step))
+            prices.append(calendar.get(date) or 0)
+    changes = []
+    for change in detector.detect(watch_ids, prices):
+        _, date, direct = detector.series(change.watch_id)
+        changes.append(CalendarChange(date, direct, change.price, change.baseline))
+    return changes
@@ -0,0 +1,153 @@
+"""与查询循环解耦的通知发送队列
+
+查询循环只把通知放入有界队列，由专门的工作线程负责发送，
+SMTP 登录慢或服务器卡顿不会推迟下一次查询：
+- submit 从不等待网络 I/O，队列已满时立即返回 False 并计入 dropped；
+- stats() 提供队列深度、最高水位、排队时间等背压指标。
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 100  # 队列容量
+DEFAULT_WORKERS = 1  # 发送线程数
+CLOSE_TIMEOUT = 30  # 关闭时等待队列发送完毕的最长时间（秒）
+
+_STOP = object()  # 通知工作线程退出的标记
+
+
+class NotificationQueue:
+    """有界通知队列和发送线程（线程安全）"""
+
+    def __init__(
+        self,
+        send_func: Callable[[str], bool],
+        capacity: int = DEFAULT_CAPACITY,
+        workers: int = DEFAULT_WORKERS,
+        name: str = "notify",
+    ):
+        """
+        Args:
+            send_func: 发送函数，接收消息内容，返回是否发送成功
+            capacity: 队列容量
+            workers: 发送线程数
+            name: 线程名前缀
+        """
+        if capacity <= 0 or workers <= 0:
+            raise ValueError("capacity 和 workers 必须大于0")
+        self.send_func = send_func
+        self.capacity = capacity
+        self._queue: queue.Queue = queue.Queue(maxsize=capacity)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._submitted = 0
+        self._delivered = 0
+        self._failed = 0
+        self._dropped = 0
+        self._high_watermark = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._threads: List[threading.Thread] = []
+        for index in range(workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"{name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, message: str) -> bool:
+        """把通知放入队列，不等待
+
+        Args:
+            message: 消息内容
+
+        Returns:
+            bool: 是否成功入队；队列已满或已关闭时返回 False
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            try:
+                self._queue.put_nowait((time.monotonic(), message))
+            except queue.Full:
+                self._dropped += 1
+                dropped = self._dropped
+            else:
+                self._submitted += 1
+                self._high_watermark = max(self._high_watermark, self._queue.qsize())
+                return True
+        logger.warning(f"通知队列已满（容量 {self.capacity}），丢弃第 {dropped} 条通知")
+        return False
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            enqueued_at, message = item
+            waited = time.monotonic() - enqueued_at
+            try:
+                ok = self.send_func(message)
+            except Exception as e:
+                logger.error(f"发送通知出错: {e}")
+                ok = False
+            with self._lock:
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+                if ok:
+                    self._delivered += 1
+                else:
+                    self._failed += 1
+
+    def stats(self) -> dict:
+        """背压指标
+
+        Returns:
+            dict: 已提交、已发送、发送失败、被丢弃的数量，当前深度、最高水位，
+                  以及平均和最长排队时间（秒）
+        """
+        with self._lock:
+            finished = self._delivered + self._failed
+            return {
+                "capacity": self.capacity,
+                "depth": self._queue.qsize(),
+                "high_watermark": self._high_watermark,
+                "submitted": self._submitted,
+                "delivered": self._delivered,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "avg_wait": self._total_wait / finished if finished else 0.0,
+                "max_wait": self._max_wait,
+            }
+
+    def close(self, timeout: Optional[float] = CLOSE_TIMEOUT) -> None:
+        """停止接收新通知，等待队列中已有的通知发送完毕
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def _remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            for _ in self._threads:
+                # 退出标记排在已有通知之后，队列满时等待发送线程腾出位置
+                self._queue.put(_STOP, timeout=_remaining())
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(_remaining())
+        pending = self._queue.qsize()
+        if pending:
+            logger.warning(f"通知队列关闭时仍有 {pending} 条未发送")
@@ -0,0 +1,143 @@
+"""多航线并发抓取引擎
+
+将所有 (航线, 直飞/非直飞) 组合提交到一个有界线程池中并发请求，
+一轮查询的耗时约等于最慢的那次请求，而不是所有请求耗时之和。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8  # 默认最大并发请求数
+
+# 航线配置中可以覆盖全局配置的字段
+ROUTE_FIELDS = [
+    "placeFrom",
+    "placeTo",
+    "dateToGo",
+    "flightWay",
+    "priceStep",
+    "sleepTime",
+]
+
+FetchFunc = Callable[[dict, bool], dict]
+FetchKey = Tuple[str, bool]
+
+
+def normalize_flight_way(flight_way: str) -> str:
+    """规范化航程类型参数
+
+    Args:
+        flight_way: 配置中的航程类型（如 'OneWay'）
+
+    Returns:
+        str: 接口需要的航程类型（'Oneway' 或 'Roundtrip'）
+    """
+    if flight_way.lower() == "oneway":
+        return "Oneway"
+    if flight_way.lower() == "roundtrip":
+        return "Roundtrip"
+    return flight_way
+
+
+def get_route_key(route: dict) -> str:
+    """生成航线的唯一标识
+
+    Args:
+        route: 航线配置
+
+    Returns:
+        str: 形如 'SHA-JIQ-Oneway' 的标识
+    """
+    return "-".join(
+        [
+            route["placeFrom"].upper(),
+            route["placeTo"].upper(),
+            normalize_flight_way(route["flightWay"]),
+        ]
+    )
+
+
+def build_routes(config: dict) -> List[dict]:
+    """根据配置生成航线列表
+
+    优先使用 config["routes"]，每条航线未填写的字段继承全局配置；
+    未配置 routes 时退回到单条 placeFrom/placeTo 航线。
+
+    Args:
+        config: 配置信息
+
+    Returns:
+        List[dict]: 完整的航线配置列表（包含全局配置项）
+    """
+    route_list = config.get("routes") or [
+        {"placeFrom": config["placeFrom"], "placeTo": config["placeTo"]}
+    ]
+
+    routes = []
+    seen = set()
+    for item in route_list:
+        route = {**config, **{k: v for k, v in item.items() if k in ROUTE_FIELDS}}
+        route.pop("routes", None)
+        key = get_route_key(route)
+        if key in seen:
+            logger.warning(f"航线重复配置，已忽略: {key}")
+            continue
+        seen.add(key)
+        routes.append(route)
+    return routes
+
+
+class FetchEngine:
+    """基于线程池的并发抓取引擎
+
+    线程池在多轮查询之间复用，max_workers 即并发请求上限。
+    """
+
+    def __init__(self, fetch_func: FetchFunc, max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        Args:
+            fetch_func: 单次抓取函数，签名为 fetch_func(route, direct)
+            max_workers: 最大并发请求数
+        """
+        if max_workers <= 0:
+            raise ValueError("max_workers 必须是正整数")
+        self.fetch_func = fetch_func
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fetch"
+        )
+
+    def fetch_all(
+        self, routes: List[dict]
+    ) -> Tuple[Dict[FetchKey, dict], Dict[FetchKey, Exception]]:
+        """并发抓取所有航线的直飞和非直飞价格
+
+        Args:
+            routes: 航线配置列表
+
+        Returns:
+            Tuple: (成功结果, 失败异常)，两者均以 (航线标识, 是否直飞) 为键
+        """
+        futures = {}
+        for route in routes:
+            key = get_route_key(route)
+            for direct in (True, False):
+                futures[(key, direct)] = self._executor.submit(
+                    self.fetch_func, route, direct
+                )
+
+        results: Dict[FetchKey, dict] = {}
+        errors: Dict[FetchKey, Exception] = {}
+        for fetch_key, future in futures.items():
+            try:
+                results[fetch_key] = future.result()
+            except Exception as e:
+                errors[fetch_key] = e
+        return results, errors
+
+    def close(self) -> None:
+        """关闭线程池"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,36 @@
+"""价格提醒事件
+
+价格对比的结果除了通知文本，还带有 (航线, 日期, 是否直飞, 价格, 基准价格)，
+供发件箱去重、提醒合并等后续环节使用。
+
+kind 区分提醒来源：
+- "step"：价格相对基准价格的变化超过 priceStep，基准价格随提醒更新；
+- "target"：价格穿过订阅的目标价格，baseline 为目标价格。
+"""
+
+from typing import NamedTuple, Tuple
+
+
+class PriceAlert(NamedTuple):
+    """一次价格提醒"""
+
+    route: str  # 航线标识，如 "SHA-JIQ-Oneway"
+    date: str  # 出发日期（YYYYMMDD）
+    direct: bool  # 是否直飞
+    price: int  # 当前价格
+    baseline: int  # 提醒前的基准价格，0 表示首次获取
+    message: str  # 通知文本
+    kind: str = "step"  # 提醒类型
+
+    @property
+    def series(self) -> Tuple[str, str, bool]:
+        """所属的价格序列 (航线, 日期, 是否直飞)"""
+        return self.route, self.date, self.direct
+
+    @property
+    def idempotency_key(self) -> str:
+        """同一序列从同一基准价格变为同一价格的同类提醒视为重复"""
+        key = f"{self.route}|{self.date}|{int(self.direct)}|{self.price}|{self.baseline}"
+        if self.kind != "step":
+            key += f"|{self.kind}"
+        return key
@@ -0,0 +1,250 @@
+"""进程级限流器与熔断器
+
+同一个接口地址的所有请求共用一个令牌桶和一个熔断器：
+- 令牌桶限制请求速率，允许一定的突发；
+- 熔断器在连续失败达到阈值后打开（open），期间所有请求立即失败，
+  打开时长按指数退避并加入随机抖动；到期后进入半开（half-open）状态，
+  只放行一次试探请求，成功则关闭，失败则以更长的退避时间重新打开。
+某条航线把上游打挂时，熔断器会替所有航线一起停下来，而不是各自重试。
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 2.0  # 每秒补充的令牌数
+DEFAULT_BURST = 8  # 令牌桶容量
+DEFAULT_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+DEFAULT_BASE_DELAY = 5.0  # 第一次熔断的时长（秒）
+DEFAULT_MAX_DELAY = 600.0  # 熔断时长上限（秒）
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """熔断器打开时请求被直接拒绝"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"接口熔断中，{retry_after:.0f} 秒后重试: {endpoint}")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）"""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 令牌桶容量，即允许的最大突发请求数
+            clock: 时钟函数
+            sleep: 等待函数
+        """
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate 和 burst 必须大于0")
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """获取一个令牌，必要时等待
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            bool: 是否获取成功；超时时不会消耗令牌
+        """
+        wait = self._reserve()
+        if timeout is not None and wait > timeout:
+            with self._lock:
+                self._tokens += 1
+            return False
+        if wait > 0:
+            self.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """带指数退避和抖动的熔断器（线程安全）"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            name: 熔断器名称（通常是接口地址）
+            failure_threshold: 连续失败多少次后熔断
+            base_delay: 第一次熔断的时长（秒）
+            max_delay: 熔断时长上限（秒）
+            clock: 时钟函数
+            rng: 随机数生成器，用于退避抖动
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self._rng = rng or random.Random()
+        self._state = CLOSED
+        self._failures = 0
+        self._trips = 0  # 连续熔断次数，用于计算退避时长
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def retry_after(self) -> float:
+        """熔断打开时距离可以重试还有多少秒，未熔断时返回 0"""
+        with self._lock:
+            self._update_state()
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._open_until - self.clock())
+
+    def before_request(self) -> None:
+        """请求前检查熔断状态
+
+        Raises:
+            CircuitOpenError: 熔断打开，或半开状态下已有试探请求在进行
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_after = max(0.0, self._open_until - self.clock())
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self) -> None:
+        """记录一次成功请求"""
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"熔断器恢复: {self.name}")
+            self._state = CLOSED
+            self._failures = 0
+            self._trips = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """记录一次失败请求，必要时打开熔断"""
+        with self._lock:
+            self._update_state()
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self) -> None:
+        """打开熔断，调用方需持有锁"""
+        self._trips += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self._trips - 1))
+        delay = self._rng.uniform(delay / 2, delay)
+        self._state = OPEN
+        self._open_until = self.clock() + delay
+        self._failures = 0
+        self._probing = False
+        logger.warning(f"接口连续失败，熔断 {delay:.0f} 秒: {self.name}")
+
+    def _update_state(self) -> None:
+        """熔断到期后进入半开状态，调用方需持有锁"""
+        if self._state == OPEN and self.clock() >= self._open_until:
+            self._state = HALF_OPEN
+            self._probing = False
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def configure_endpoint(
+    endpoint: str,
+    rate: float = DEFAULT_RATE,
+    burst: int = DEFAULT_BURST,
+    failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+    rng: Optional[random.Random] = None,
+) -> None:
+    """为一个接口地址设置限流和熔断参数（替换已有的实例）
+
+    Args:
+        endpoint: 接口地址
+        rate: 每秒补充的令牌数
+        burst: 令牌桶容量
+        failure_threshold: 连续失败多少次后熔断
+        base_delay: 第一次熔断的时长（秒）
+        max_delay: 熔断时长上限（秒）
+        clock: 限流器和熔断器使用的时钟函数
+        sleep: 限流器的等待函数
+        rng: 熔断退避抖动的随机数生成器，需要可重现时传入固定种子
+    """
+    with _registry_lock:
+        _limiters[endpoint] = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        _breakers[endpoint] = CircuitBreaker(
+            endpoint, failure_threshold, base_delay, max_delay, clock=clock, rng=rng
+        )
+
+
+def get_limiter(endpoint: str) -> TokenBucket:
+    """获取接口地址对应的进程级令牌桶"""
+    with _registry_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            limiter = _limiters[endpoint] = TokenBucket()
+        return limiter
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """获取接口地址对应的进程级熔断器"""
+    with _registry_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
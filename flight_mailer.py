@@ -0,0 +1,232 @@
+"""复用 SMTP 连接的邮件发送器
+
+- 登录后的 SMTP 会话在多次发送之间保持，空闲过久时先用 NOOP 检测，
+  连接断开时自动重连并重发一次；
+- 多个收件人按批发送，同一批收件人共用一封邮件，所有批次共用一个会话；
+- build_digest 把一轮查询中所有航线的消息按航线分组合并为一封摘要。
+"""
+
+import logging
+import re
+import smtplib
+import threading
+import time
+from email.header import Header
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBJECT = "航班价格提醒"
+DEFAULT_SMTP_PORT = 465
+SMTP_TIMEOUT = 30  # SMTP 连接超时时间（秒）
+IDLE_CHECK = 120  # 连接空闲超过该时长后，发送前先检测是否仍然可用（秒）
+MAX_RECIPIENTS_PER_BATCH = 20  # 每封邮件最多的收件人数
+
+_LABEL_PATTERN = re.compile(r"^\[(.+?)\] (.*)$", re.S)
+
+
+def parse_recipients(receiver: str) -> List[str]:
+    """把逗号、分号或空白分隔的收件人字符串拆成列表（去重，保持顺序）"""
+    recipients = []
+    for address in re.split(r"[,;\s]+", receiver or ""):
+        if address and address not in recipients:
+            recipients.append(address)
+    return recipients
+
+
+def build_digest(messages: List[str]) -> str:
+    """把一轮查询的所有消息合并为一封摘要
+
+    带 "[航线] " 前缀的消息按航线分组，每条航线一段；没有前缀的消息原样保留。
+
+    Args:
+        messages: 本轮所有航线的通知消息
+
+    Returns:
+        str: 摘要正文
+    """
+    groups: Dict[str, List[str]] = {}
+    plain = []
+    for message in messages:
+        match = _LABEL_PATTERN.match(message)
+        if match:
+            groups.setdefault(match.group(1), []).append(match.group(2))
+        else:
+            plain.append(message)
+    if not groups:
+        return "\n".join(plain)
+
+    sections = ["\n".join(plain)] if plain else []
+    for label, items in groups.items():
+        sections.append("\n".join([f"【{label}】"] + [f"  {item}" for item in items]))
+    return "\n\n".join(sections)
+
+
+class SmtpMailer:
+    """保持登录状态的 SMTP 发送器（线程安全）"""
+
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        sender: str,
+        password: str,
+        timeout: float = SMTP_TIMEOUT,
+        batch_size: int = MAX_RECIPIENTS_PER_BATCH,
+    ):
+        """
+        Args:
+            server: SMTP 服务器地址
+            port: SMTP 端口，465 使用 SSL，其他端口使用 STARTTLS
+            sender: 发件人邮箱（同时作为登录用户名）
+            password: 邮箱授权码/密码
+            timeout: 连接超时时间（秒）
+            batch_size: 每封邮件最多的收件人数
+        """
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout: float) -> smtplib.SMTP:
+        """建立连接并登录，调用方需持有锁"""
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.server, self.port, timeout=timeout)
+        else:
+            smtp = smtplib.SMTP(self.server, self.port, timeout=timeout)
+            smtp.starttls()
+        smtp.login(self.sender, self.password)
+        logger.info(f"已连接 SMTP 服务器: {self.server}:{self.port}")
+        return smtp
+
+    def _disconnect(self) -> None:
+        """关闭连接，调用方需持有锁"""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def _session(self, timeout: float) -> smtplib.SMTP:
+        """返回可用的会话，必要时重新连接，调用方需持有锁"""
+        if self._smtp is not None and self._smtp.sock is not None:
+            # 复用的连接按本次发送的超时读写
+            self._smtp.sock.settimeout(timeout)
+        if self._smtp is not None and time.monotonic() - self._last_used > IDLE_CHECK:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._disconnect()
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        if self._smtp is None:
+            self._smtp = self._connect(timeout)
+        return self._smtp
+
+    def send(
+        self,
+        message: str,
+        recipients: List[str],
+        subject: str = DEFAULT_SUBJECT,
+        retries: int = 1,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """发送一封邮件给所有收件人，收件人按批次共用同一个会话
+
+        Args:
+            message: 邮件正文
+            recipients: 收件人列表
+            subject: 邮件主题
+            retries: 连接断开或网络错误时重连后重发的次数；调用方自己负责重试时
+                     传 0，失败时连接已经关闭，下一次发送会重新连接
+            timeout: 本次发送的连接和读写超时（秒），默认使用实例配置；
+                     共享发送器被多个渠道使用时由各渠道传入自己的超时
+
+        Raises:
+            smtplib.SMTPException, OSError: 重连后仍然发送失败
+        """
+        batches = [
+            recipients[i : i + self.batch_size]
+            for i in range(0, len(recipients), self.batch_size)
+        ]
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            for batch in batches:
+                msg = MIMEText(message, "plain", "utf-8")
+                msg["From"] = self.sender
+                msg["To"] = ", ".join(batch)
+                msg["Subject"] = Header(subject, "utf-8")
+                self._deliver(batch, msg.as_string(), retries, timeout)
+                self._last_used = time.monotonic()
+
+    def _deliver(
+        self, batch: List[str], raw: str, retries: int, timeout: float
+    ) -> None:
+        """发送一批，连接断开或网络错误时重连后重发，调用方需持有锁"""
+        for attempt in range(retries + 1):
+            try:
+                self._session(timeout).sendmail(self.sender, batch, raw)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._disconnect()
+                if attempt == retries:
+                    raise
+            except smtplib.SMTPException:
+                # 协议层错误（如收件人被拒），不重发
+                self._disconnect()
+                raise
+            except OSError:
+                self._disconnect()
+                if attempt == retries:
+                    raise
+
+    def close(self) -> None:
+        """退出登录并关闭连接"""
+        with self._lock:
+            self._disconnect()
+
+
+_mailers: Dict[Tuple[str, int, str, str], SmtpMailer] = {}
+_registry_lock = threading.Lock()
+
+
+def get_shared_mailer(config: dict) -> Optional[SmtpMailer]:
+    """按配置中的邮件参数获取进程级共享的发送器
+
+    Args:
+        config: 包含 email_sender、email_password、smtp_server、smtp_port 的配置
+
+    Returns:
+        Optional[SmtpMailer]: 邮件配置不完整时返回 None
+    """
+    sender = config.get("email_sender")
+    password = config.get("email_password")
+    smtp_server = config.get("smtp_server")
+    smtp_port = int(config.get("smtp_port") or DEFAULT_SMTP_PORT)
+    if not all([sender, password, smtp_server]):
+        return None
+
+    key = (smtp_server, smtp_port, sender, password)
+    with _registry_lock:
+        mailer = _mailers.get(key)
+        if mailer is None:
+            mailer = _mailers[key] = SmtpMailer(
+                smtp_server, smtp_port, sender, password
+            )
+        return mailer
+
+
+def close_shared_mailers() -> None:
+    """关闭所有共享发送器的连接"""
+    with _registry_lock:
+        mailers = list(_mailers.values())
+        _mailers.clear()
+    for mailer in mailers:
+        mailer.close()
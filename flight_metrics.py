@@ -0,0 +1,531 @@
+"""运行指标与 Prometheus 文本格式的 /metrics 接口
+
+MetricsRegistry 记录抓取 → 解析 → 对比 → 通知流程中的指标：
+- 每次接口请求的耗时直方图和结果计数（按航线、是否直飞），结果区分 HTTP 错误、
+  status == 2、熔断、超时等；
+- 每轮查询的耗时直方图和各阶段累计耗时；
+- 各类提醒的数量，以及每条航线最近一次成功获取价格的时间；
+- 通知队列、通知渠道、提醒合并器、异常值过滤器、请求预算等组件的 stats()，
+  在每次抓取 /metrics 时才读取。
+
+热路径上每次请求只多两次 perf_counter 和一次加锁的计数，文本在抓取时才生成。
+MetricsServer 在后台线程中提供 GET /metrics，默认只监听本机地址。
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from flight_engine import get_route_key
+from flight_limiter import OPEN, CircuitOpenError
+from flight_transport import RateLimitedError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"  # 默认只允许本机抓取
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 请求耗时分桶（秒）
+CYCLE_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)  # 每轮耗时分桶
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metric(NamedTuple):
+    """一个指标及其各标签组合的取值"""
+
+    name: str
+    kind: str  # "counter" 或 "gauge"
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+def classify_error(error: Exception) -> str:
+    """把抓取异常归类为请求结果标签"""
+    if isinstance(error, RateLimitedError):
+        return "status2"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, requests.exceptions.HTTPError):
+        return "http_error"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    # requests 的 JSONDecodeError 同时是 ValueError，按无效响应统计
+    if isinstance(error, ValueError):
+        return "invalid_response"
+    if isinstance(error, requests.exceptions.RequestException):
+        return "network_error"
+    return "error"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    text = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+    return f"{{{text}}}" if text else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Histogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size  # 各分桶（不累积）的计数，最后一个是 +Inf
+        self.total = 0.0
+
+
+def _render_histogram(
+    lines: List[str],
+    name: str,
+    help_text: str,
+    buckets: Tuple[float, ...],
+    series: Dict[Labels, _Histogram],
+) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    bounds = [repr(bound) for bound in buckets] + ["+Inf"]
+    for labels, histogram in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            bucket_labels = _format_labels(labels + (("le", bound),))
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        text = _format_labels(labels)
+        lines.append(f"{name}_sum{text} {repr(histogram.total)}")
+        lines.append(f"{name}_count{text} {cumulative}")
+
+
+def _render_metric(lines: List[str], metric: Metric) -> None:
+    lines.append(f"# HELP {metric.name} {metric.help}")
+    lines.append(f"# TYPE {metric.name} {metric.kind}")
+    for labels, value in metric.samples:
+        text = _format_labels(sorted(labels.items()))
+        lines.append(f"{metric.name}{text} {_format_value(value)}")
+
+
+class StageTimer:
+    """记录一轮查询中各阶段的耗时（不加锁，只在查询线程中使用）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str) -> None:
+        """结束一个阶段：记录从上一次 mark（或开始）到现在的耗时"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def elapsed(self) -> float:
+        """从开始到最后一次 mark 的耗时（秒）"""
+        return self._last - self.started
+
+
+class MetricsRegistry:
+    """监控流程的运行指标（线程安全）"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            clock: 时钟函数，用于计算距上次成功获取价格的秒数
+        """
+        self.clock = clock
+        self._requests: Dict[Labels, int] = {}
+        self._latency: Dict[Labels, _Histogram] = {}
+        self._cycles: Dict[Labels, _Histogram] = {}
+        self._stage_seconds: Dict[str, float] = {}
+        self._alerts: Dict[str, int] = {}
+        self._last_success: Dict[str, float] = {}
+        self._collectors: List[Callable[[], List[Metric]]] = []
+        self._lock = threading.Lock()
+
+    def observe_request(
+        self, route_key: str, direct: bool, seconds: float, outcome: str = "ok"
+    ) -> None:
+        """记录一次接口请求的耗时和结果
+
+        Args:
+            route_key: 航线标识
+            direct: 是否直飞
+            seconds: 请求耗时（秒）
+            outcome: 请求结果，"ok" 或 classify_error 返回的类型
+        """
+        labels = (("direct", "true" if direct else "false"), ("route", route_key))
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            histogram = self._latency.get(labels)
+            if histogram is None:
+                histogram = self._latency[labels] = _Histogram(
+                    len(LATENCY_BUCKETS) + 1
+                )
+            histogram.counts[index] += 1
+            histogram.total += seconds
+            key = labels + (("outcome", outcome),)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def wrap(
+        self, fetch_func: Callable[[dict, bool], dict]
+    ) -> Callable[[dict, bool], dict]:
+        """包装抓取函数，记录每次调用的耗时和结果
+
+        Args:
+            fetch_func: 签名为 fetch_func(config, direct) 的抓取函数
+
+        Returns:
+            Callable[[dict, bool], dict]: 签名相同的抓取函数
+        """
+
+        def fetch(config: dict, direct: bool = True) -> dict:
+            start = time.perf_counter()
+            try:
+                data = fetch_func(config, direct)
+            except Exception as e:
+                self.observe_request(
+                    get_route_key(config),
+                    direct,
+                    time.perf_counter() - start,
+                    classify_error(e),
+                )
+                raise
+            self.observe_request(
+                get_route_key(config), direct, time.perf_counter() - start
+            )
+            return data
+
+        return fetch
+
+    def observe_cycle(
+        self,
+        timer: StageTimer,
+        ok_routes: Iterable[str] = (),
+        alert_kinds: Iterable[str] = (),
+        fetched_at: Optional[float] = None,
+    ) -> None:
+        """记录一轮查询的耗时、成功的航线和产生的提醒
+
+        Args:
+            timer: 本轮查询的阶段计时
+            ok_routes: 成功获取价格的航线标识
+            alert_kinds: 本轮每条提醒的类型
+            fetched_at: 本轮获取价格的时间戳，默认当前时间
+        """
+        fetched_at = self.clock() if fetched_at is None else fetched_at
+        index = bisect_left(CYCLE_BUCKETS, timer.elapsed)
+        with self._lock:
+            histogram = self._cycles.get(())
+            if histogram is None:
+                histogram = self._cycles[()] = _Histogram(len(CYCLE_BUCKETS) + 1)
+            histogram.counts[index] += 1
+            histogram.total += timer.elapsed
+            self._add_stages(timer.stages)
+            for route_key in ok_routes:
+                self._last_success[route_key] = fetched_at
+            for kind in alert_kinds:
+                self._alerts[kind] = self._alerts.get(kind, 0) + 1
+
+    def observe_stages(self, stages: Dict[str, float]) -> None:
+        """累加查询之外的阶段耗时（如合并和提交通知）"""
+        with self._lock:
+            self._add_stages(stages)
+
+    def _add_stages(self, stages: Dict[str, float]) -> None:
+        """累加各阶段耗时，调用方需持有锁"""
+        for stage, seconds in stages.items():
+            self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + seconds
+
+    def add_collector(self, collect: Callable[[], List[Metric]]) -> None:
+        """添加在每次抓取 /metrics 时调用的指标收集函数"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式的全部指标"""
+        now = self.clock()
+        with self._lock:
+            requests_total = sorted(self._requests.items())
+            latency = {key: _copy(value) for key, value in self._latency.items()}
+            cycles = {key: _copy(value) for key, value in self._cycles.items()}
+            stage_seconds = sorted(self._stage_seconds.items())
+            alerts = sorted(self._alerts.items())
+            last_success = sorted(self._last_success.items())
+
+        lines: List[str] = []
+        _render_metric(
+            lines,
+            Metric(
+                "flight_requests_total",
+                "counter",
+                "接口请求数，按航线、是否直飞和结果",
+                [(dict(labels), count) for labels, count in requests_total],
+            ),
+        )
+        _render_histogram(
+            lines,
+            "flight_request_duration_seconds",
+            "接口请求耗时（秒），包含限流等待",
+            LATENCY_BUCKETS,
+            latency,
+        )
+        _render_histogram(
+            lines,
+            "flight_cycle_duration_seconds",
+            "每轮查询的耗时（秒）",
+            CYCLE_BUCKETS,
+            cycles,
+        )
+        metrics = [
+            Metric(
+                "flight_stage_seconds_total",
+                "counter",
+                "抓取、解析、对比、保存、通知各阶段的累计耗时（秒）",
+                [({"stage": stage}, seconds) for stage, seconds in stage_seconds],
+            ),
+            Metric(
+                "flight_alerts_total",
+                "counter",
+                "产生的提醒数，按类型",
+                [({"kind": kind}, count) for kind, count in alerts],
+            ),
+            Metric(
+                "flight_route_last_success_timestamp_seconds",
+                "gauge",
+                "航线最近一次成功获取价格的时间戳",
+                [({"route": key}, at) for key, at in last_success],
+            ),
+            Metric(
+                "flight_route_seconds_since_success",
+                "gauge",
+                "距航线最近一次成功获取价格的秒数",
+                [({"route": key}, max(0.0, now - at)) for key, at in last_success],
+            ),
+        ]
+        for collect in self._collectors:
+            try:
+                metrics.extend(collect())
+            except Exception as e:
+                logger.error(f"收集运行指标失败: {e}")
+        for metric in metrics:
+            if metric.samples:
+                _render_metric(lines, metric)
+        return "\n".join(lines) + "\n"
+
+
+def _copy(histogram: _Histogram) -> _Histogram:
+    copied = _Histogram(len(histogram.counts))
+    copied.counts = list(histogram.counts)
+    copied.total = histogram.total
+    return copied
+
+
+def component_metrics(
+    notifier=None,
+    channels=None,
+    coalescer=None,
+    outliers=None,
+    budget=None,
+    breaker=None,
+    outbox=None,
+) -> List[Metric]:
+    """把各组件的 stats() 转换为指标，未启用的组件传 None
+
+    Args:
+        notifier: flight_dispatch.NotificationQueue
+        channels: flight_notifiers.NotifierGroup
+        coalescer: flight_coalesce.AlertCoalescer
+        outliers: flight_outlier.OutlierFilter
+        budget: flight_budget.BudgetAllocator
+        breaker: flight_limiter.CircuitBreaker
+        outbox: flight_outbox.Outbox
+
+    Returns:
+        List[Metric]: 指标列表
+    """
+    metrics: List[Metric] = []
+    if notifier is not None:
+        stats = notifier.stats()
+        metrics += [
+            Metric(
+                "flight_notify_queue_depth",
+                "gauge",
+                "通知队列中等待发送的消息数",
+                [({}, stats["depth"])],
+            ),
+            Metric(
+                "flight_notify_queue_high_watermark",
+                "gauge",
+                "通知队列深度的最高水位",
+                [({}, stats["high_watermark"])],
+            ),
+            Metric(
+                "flight_notify_queue_messages_total",
+                "counter",
+                "通知队列的消息数，按结果（提交、发送、失败、队列满被丢弃）",
+                [
+                    ({"outcome": outcome}, stats[outcome])
+                    for outcome in ("submitted", "delivered", "failed", "dropped")
+                ],
+            ),
+            Metric(
+                "flight_notify_queue_max_wait_seconds",
+                "gauge",
+                "通知在队列中的最长排队时间（秒）",
+                [({}, stats["max_wait"])],
+            ),
+        ]
+    if channels is not None:
+        metrics.append(
+            Metric(
+                "flight_notifications_total",
+                "counter",
+                "各通知渠道（邮件、Pushplus、Webhook）发送成功和失败的次数",
+                [
+                    ({"channel": name, "result": result}, count)
+                    for name, counts in sorted(channels.stats().items())
+                    for result, count in sorted(counts.items())
+                ],
+            )
+        )
+    if coalescer is not None:
+        stats = coalescer.stats()
+        metrics += [
+            Metric(
+                "flight_coalescer_alerts_total",
+                "counter",
+                "提醒合并器的提醒数（收到、发出、被合并、抖动抑制、超出上限推迟）",
+                [
+                    ({"outcome": outcome}, count)
+                    for outcome, count in sorted(stats.items())
+                    if outcome != "pending"
+                ],
+            ),
+            Metric(
+                "flight_coalescer_pending",
+                "gauge",
+                "提醒合并器中等待窗口结束的提醒数",
+                [({}, stats["pending"])],
+            ),
+        ]
+    if outliers is not None:
+        metrics.append(
+            Metric(
+                "flight_outlier_prices_total",
+                "counter",
+                "异常值过滤器扣留、确认和丢弃的可疑价格数",
+                [
+                    ({"outcome": outcome}, count)
+                    for outcome, count in sorted(outliers.stats().items())
+                ],
+            )
+        )
+    if budget is not None:
+        report = budget.report()
+        metrics += [
+            Metric(
+                "flight_budget_requests_last_hour",
+                "gauge",
+                "最近一小时已用的请求预算",
+                [({}, report["used"])],
+            ),
+            Metric(
+                "flight_budget_requests_limit",
+                "gauge",
+                "每小时的请求预算上限",
+                [({}, report["limit"])],
+            ),
+            Metric(
+                "flight_budget_deferred_total",
+                "counter",
+                "因预算不足被推迟的查询次数",
+                [({}, report["deferred"])],
+            ),
+        ]
+    if breaker is not None:
+        metrics += [
+            Metric(
+                "flight_circuit_open",
+                "gauge",
+                "接口是否处于熔断状态",
+                [({}, int(breaker.state == OPEN))],
+            ),
+            Metric(
+                "flight_circuit_retry_after_seconds",
+                "gauge",
+                "熔断结束前还需等待的秒数",
+                [({}, breaker.retry_after())],
+            ),
+        ]
+    if outbox is not None:
+        metrics.append(
+            Metric(
+                "flight_outbox_pending",
+                "gauge",
+                "发件箱中尚未送达的提醒数",
+                [({}, outbox.pending_count())],
+            )
+        )
+    return metrics
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: "MetricsServer"
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f"指标请求: {format % args}")
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """在后台线程中提供 GET /metrics"""
+
+    daemon_threads = True
+
+    def __init__(
+        self, registry: MetricsRegistry, host: str = DEFAULT_HOST, port: int = 0
+    ):
+        """
+        Args:
+            registry: 运行指标
+            host: 监听地址
+            port: 端口，0 表示自动选择
+        """
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = registry
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        """指标接口的地址"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self) -> None:
+        """停止服务并释放端口"""
+        self.shutdown()
+        self.server_close()
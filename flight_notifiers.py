@@ -0,0 +1,290 @@
+"""可插拔的通知渠道
+
+内置三种渠道：邮件、Pushplus 微信推送、通用 HTTP Webhook。
+NotifierGroup 把一条通知同时发给所有渠道：
+- 每个渠道在独立线程中发送，各有自己的超时和重试设置，慢的渠道不会拖住其他渠道；
+- HTTP 渠道各自持有连接池，多次发送之间复用连接；
+- 至少一个渠道发送成功即视为送达，失败的渠道单独记录日志。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flight_mailer import DEFAULT_SUBJECT, get_shared_mailer, parse_recipients
+
+logger = logging.getLogger(__name__)
+
+PUSHPLUS_URL = "https://www.pushplus.plus/send"
+DEFAULT_TIMEOUT = 10.0  # 单次发送超时时间（秒）
+DEFAULT_RETRIES = 2  # 失败后的重试次数
+DEFAULT_RETRY_DELAY = 2.0  # 第一次重试的等待时间（秒），之后翻倍
+HTTP_POOL_SIZE = 4  # 每个 HTTP 渠道的连接池大小
+
+
+class Notifier:
+    """通知渠道基类，子类实现 _send"""
+
+    name = "notifier"
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        """
+        Args:
+            timeout: 单次发送超时时间（秒）
+            retries: 失败后的重试次数
+            retry_delay: 第一次重试的等待时间（秒），之后翻倍
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    @property
+    def deadline(self) -> float:
+        """包含全部重试在内的最长耗时（秒）"""
+        return self.timeout * (self.retries + 1) + self.retry_delay * (
+            2**self.retries - 1
+        )
+
+    def _send(self, title: str, message: str) -> None:
+        raise NotImplementedError
+
+    def send(self, title: str, message: str) -> None:
+        """发送一条通知，失败时按设置重试
+
+        Raises:
+            Exception: 重试后仍然失败
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                self._send(title, message)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    f"{self.name} 发送失败 (尝试 {attempt + 1}/{self.retries + 1}): "
+                    f"{e}. {delay:.1f}秒后重试..."
+                )
+                time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+
+class EmailNotifier(Notifier):
+    """邮件渠道，复用 flight_mailer 的共享 SMTP 会话
+
+    重试只由 Notifier.send 负责，发送器本身不再重连重发，一封邮件最多尝试
+    retries + 1 次。SMTP 连接和读写使用本渠道的 timeout，与 deadline 的计算一致。
+    """
+
+    name = "email"
+
+    def __init__(self, config: dict, **kwargs):
+        super().__init__(**kwargs)
+        self.config = config
+
+    def _send(self, title: str, message: str) -> None:
+        mailer = get_shared_mailer(self.config)
+        recipients = parse_recipients(self.config.get("email_receiver"))
+        if mailer is None or not recipients:
+            raise ValueError("邮件配置不完整")
+        mailer.send(
+            message, recipients, subject=title, retries=0, timeout=self.timeout
+        )
+
+
+class WebhookNotifier(Notifier):
+    """通用 HTTP Webhook：POST JSON {"title": ..., "content": ...}"""
+
+    name = "webhook"
+
+    def __init__(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs):
+        """
+        Args:
+            url: Webhook 地址
+            headers: 额外的请求头
+        """
+        super().__init__(**kwargs)
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, title: str, message: str) -> dict:
+        return {"title": title, "content": message}
+
+    def _check(self, response: requests.Response) -> None:
+        response.raise_for_status()
+
+    def _send(self, title: str, message: str) -> None:
+        response = self.session.post(
+            self.url, json=self._payload(title, message), timeout=self.timeout
+        )
+        self._check(response)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class PushplusNotifier(WebhookNotifier):
+    """Pushplus 微信推送"""
+
+    name = "pushplus"
+
+    def __init__(self, token: str, url: str = PUSHPLUS_URL, **kwargs):
+        """
+        Args:
+            token: Pushplus 的 token（配置中的 SCKEY）
+            url: 接口地址
+        """
+        super().__init__(url, **kwargs)
+        self.token = token
+
+    def _payload(self, title: str, message: str) -> dict:
+        return {
+            "token": self.token,
+            "title": title,
+            "content": message,
+            "template": "txt",
+        }
+
+    def _check(self, response: requests.Response) -> None:
+        response.raise_for_status()
+        result = response.json()
+        if result.get("code") != 200:
+            raise ValueError(f"Pushplus 返回错误: {result.get('msg')}")
+
+
+class NotifierGroup:
+    """把通知并发发送到多个渠道"""
+
+    def __init__(self, notifiers: List[Notifier], title: str = DEFAULT_SUBJECT):
+        """
+        Args:
+            notifiers: 通知渠道列表
+            title: 通知标题
+        """
+        self.notifiers = notifiers
+        self.title = title
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(notifiers) * 2), thread_name_prefix="notifier"
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            notifier.name: {"sent": 0, "failed": 0} for notifier in notifiers
+        }
+
+    def __len__(self) -> int:
+        return len(self.notifiers)
+
+    def send(self, message: str) -> bool:
+        """并发发送到所有渠道，等待每个渠道完成或超时
+
+        Args:
+            message: 消息内容
+
+        Returns:
+            bool: 是否至少有一个渠道发送成功
+        """
+        if not self.notifiers:
+            logger.warning("没有可用的通知渠道，跳过发送")
+            return False
+
+        futures = {
+            notifier: self._executor.submit(notifier.send, self.title, message)
+            for notifier in self.notifiers
+        }
+        wait(futures.values(), timeout=max(n.deadline for n in self.notifiers))
+
+        delivered = False
+        for notifier, future in futures.items():
+            try:
+                future.result(timeout=0)
+            except TimeoutError:
+                self._record(notifier, False)
+                logger.error(f"{notifier.name} 发送超时")
+            except Exception as e:
+                self._record(notifier, False)
+                logger.error(f"{notifier.name} 发送失败: {e}")
+            else:
+                self._record(notifier, True)
+                logger.info(f"{notifier.name} 发送成功")
+                delivered = True
+        return delivered
+
+    def _record(self, notifier: Notifier, ok: bool) -> None:
+        with self._lock:
+            self._stats[notifier.name]["sent" if ok else "failed"] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """每个渠道发送成功和失败的次数"""
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+    def close(self) -> None:
+        """关闭线程池和各渠道的连接"""
+        self._executor.shutdown(wait=False)
+        for notifier in self.notifiers:
+            notifier.close()
+
+
+def build_notifiers(config: dict) -> NotifierGroup:
+    """根据配置创建通知渠道
+
+    - 邮件：email_sender、email_password、email_receiver、smtp_server 齐全时启用；
+    - Pushplus：配置了 SCKEY 时启用；
+    - Webhook：配置了 webhookUrl 时启用，可用 webhookHeaders 添加请求头。
+    各渠道的 timeout、retries、retryDelay 可以在 channels.<渠道名> 中单独设置。
+
+    Args:
+        config: 配置信息
+
+    Returns:
+        NotifierGroup: 所有启用的渠道
+    """
+    channels = config.get("channels", {})
+
+    def _options(name: str) -> dict:
+        options = channels.get(name, {})
+        return {
+            "timeout": options.get("timeout", DEFAULT_TIMEOUT),
+            "retries": options.get("retries", DEFAULT_RETRIES),
+            "retry_delay": options.get("retryDelay", DEFAULT_RETRY_DELAY),
+        }
+
+    notifiers: List[Notifier] = []
+    if get_shared_mailer(config) is not None and parse_recipients(
+        config.get("email_receiver")
+    ):
+        notifiers.append(EmailNotifier(config, **_options("email")))
+    if config.get("SCKEY"):
+        notifiers.append(
+            PushplusNotifier(
+                config["SCKEY"],
+                url=config.get("pushplusUrl", PUSHPLUS_URL),
+                **_options("pushplus"),
+            )
+        )
+    if config.get("webhookUrl"):
+        notifiers.append(
+            WebhookNotifier(
+                config["webhookUrl"],
+                headers=config.get("webhookHeaders"),
+                **_options("webhook"),
+            )
+        )
+    return NotifierGroup(notifiers)
@@ -0,0 +1,268 @@
+"""持久化的通知发件箱
+
+每条价格提醒在发送之前先写入 SQLite 发件箱，发送成功后才标记为已送达：
+- 幂等键 (航线, 日期, 是否直飞, 价格, 基准价格) 相同的提醒在去重窗口内只保存一次，
+  重启后不会重复发送；priceStep 提醒的幂等键还包含该序列基准价格的代数，
+  每次基准价格变为新的价格时加一，A→B→A→B 中的两次 A→B 是两条不同的提醒，
+  而同一次变化被重复写入（如多个程序共用发件箱）时仍然只保存一次；
+- 发送失败的提醒按指数退避重试，直到送达或超过最大尝试次数；
+- 取出待发送提醒时加租约，租约到期前不会被再次取出，进程中途退出后自动重新发送；
+- baselines 表与提醒在同一事务中更新，重启后可以直接恢复各日期的目标价格，
+  不需要重新查询价格，也不会发出一批 "首次提醒"；只有 priceStep 提醒会更新基准价格。
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flight_events import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEDUPE_WINDOW = 24 * 3600  # 幂等键去重窗口（秒）
+DEFAULT_BASE_DELAY = 30.0  # 第一次重试的等待时间（秒）
+DEFAULT_MAX_DELAY = 3600.0  # 重试等待时间上限（秒）
+DEFAULT_MAX_ATTEMPTS = 20  # 超过该次数后放弃发送
+LEASE_SECONDS = 300  # 取出后多久未确认视为发送中断（秒）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT NOT NULL,
+    route TEXT NOT NULL,
+    date TEXT NOT NULL,
+    direct INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    baseline INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'step',
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    delivered_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_key ON outbox (idempotency_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending
+    ON outbox (next_attempt_at) WHERE delivered_at IS NULL;
+CREATE TABLE IF NOT EXISTS baselines (
+    route TEXT NOT NULL,
+    date TEXT NOT NULL,
+    direct INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (route, date, direct)
+) WITHOUT ROWID;
+"""
+
+OutboxEntry = Tuple[int, PriceAlert]
+
+
+class Outbox:
+    """SQLite 发件箱（线程安全）"""
+
+    def __init__(
+        self,
+        path: str,
+        dedupe_window: float = DEFAULT_DEDUPE_WINDOW,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            dedupe_window: 幂等键去重窗口（秒）
+            base_delay: 第一次重试的等待时间（秒）
+            max_delay: 重试等待时间上限（秒）
+            max_attempts: 最大尝试次数
+            clock: 时钟函数
+        """
+        self.path = path
+        self.dedupe_window = dedupe_window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+    def _migrate(self) -> None:
+        """为旧版本创建的发件箱补充 kind 列和基准价格的 generation 列"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "kind" not in columns:
+            with self._conn:
+                self._conn.execute(
+                    "ALTER TABLE outbox ADD COLUMN kind TEXT NOT NULL DEFAULT 'step'"
+                )
+        columns = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(baselines)")
+        }
+        if "generation" not in columns:
+            with self._conn:
+                self._conn.execute(
+                    "ALTER TABLE baselines "
+                    "ADD COLUMN generation INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def _advance_baseline(self, alert: PriceAlert) -> int:
+        """把序列的基准价格更新为提醒的价格，返回该价格对应的代数
+
+        基准价格已经是该价格时说明这次变化已经写入过，代数不变。
+        调用方需持有锁并处于事务中。
+        """
+        row = self._conn.execute(
+            "SELECT price, generation FROM baselines "
+            "WHERE route = ? AND date = ? AND direct = ?",
+            (alert.route, alert.date, int(alert.direct)),
+        ).fetchone()
+        if row is not None and row[0] == alert.price:
+            return row[1]
+        generation = (row[1] if row is not None else 0) + 1
+        self._conn.execute(
+            "INSERT INTO baselines (route, date, direct, price, generation) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (route, date, direct) "
+            "DO UPDATE SET price = excluded.price, generation = excluded.generation",
+            (alert.route, alert.date, int(alert.direct), alert.price, generation),
+        )
+        return generation
+
+    def enqueue(self, alerts: Iterable[PriceAlert]) -> int:
+        """在一个事务内写入提醒并更新基准价格
+
+        Args:
+            alerts: 价格提醒
+
+        Returns:
+            int: 新写入的提醒数（去重窗口内重复的提醒不会写入）
+        """
+        now = self.clock()
+        added = 0
+        with self._lock, self._conn:
+            for alert in alerts:
+                key = alert.idempotency_key
+                if alert.kind == "step":
+                    key += f"|{self._advance_baseline(alert)}"
+                duplicate = self._conn.execute(
+                    "SELECT 1 FROM outbox WHERE idempotency_key = ? AND created_at > ?",
+                    (key, now - self.dedupe_window),
+                ).fetchone()
+                if duplicate:
+                    logger.info(f"跳过重复的提醒: {key}")
+                    continue
+                self._conn.execute(
+                    "INSERT INTO outbox (idempotency_key, route, date, direct, price, "
+                    "baseline, message, kind, created_at, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        alert.route,
+                        alert.date,
+                        int(alert.direct),
+                        alert.price,
+                        alert.baseline,
+                        alert.message,
+                        alert.kind,
+                        now,
+                        now,
+                    ),
+                )
+                added += 1
+        return added
+
+    def claim(self, limit: int = 100) -> List[OutboxEntry]:
+        """取出到期的待发送提醒并加租约
+
+        Args:
+            limit: 最多取出的数量
+
+        Returns:
+            List[OutboxEntry]: (提醒编号, 提醒)，按写入顺序排列
+        """
+        now = self.clock()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, route, date, direct, price, baseline, message, kind "
+                "FROM outbox "
+                "WHERE delivered_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+                ((now + LEASE_SECONDS, row[0]) for row in rows),
+            )
+        return [
+            (entry_id, PriceAlert(route, date, bool(direct), *values))
+            for entry_id, route, date, direct, *values in rows
+        ]
+
+    def ack(self, entry_ids: List[int]) -> None:
+        """标记提醒已送达"""
+        now = self.clock()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE outbox SET delivered_at = ? WHERE id = ?",
+                ((now, entry_id) for entry_id in entry_ids),
+            )
+
+    def fail(self, entry_ids: List[int], error: str) -> None:
+        """记录一次发送失败，按指数退避安排下一次尝试"""
+        now = self.clock()
+        with self._lock, self._conn:
+            for entry_id in entry_ids:
+                row = self._conn.execute(
+                    "SELECT attempts FROM outbox WHERE id = ?", (entry_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                if attempts >= self.max_attempts:
+                    # 放弃发送：标记为已处理，保留错误信息便于排查
+                    logger.error(f"提醒 {entry_id} 发送 {attempts} 次均失败，放弃")
+                    next_attempt_at, delivered_at = now, now
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                    next_attempt_at, delivered_at = now + delay, None
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, "
+                    "delivered_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, next_attempt_at, delivered_at, error, entry_id),
+                )
+
+    def seconds_until_due(self) -> Optional[float]:
+        """距离下一条待发送提醒到期还有多少秒，没有待发送提醒时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT min(next_attempt_at) FROM outbox WHERE delivered_at IS NULL"
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - self.clock())
+
+    def pending_count(self) -> int:
+        """尚未送达的提醒数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM outbox WHERE delivered_at IS NULL"
+            ).fetchone()[0]
+
+    def baselines(self) -> Dict[Tuple[str, str, bool], int]:
+        """各 (航线, 日期, 是否直飞) 最近一次提醒的价格，用于重启后恢复目标价格"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT route, date, direct, price FROM baselines"
+            ).fetchall()
+        return {(route, date, bool(direct)): price for route, date, direct, price in rows}
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
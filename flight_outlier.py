@@ -0,0 +1,147 @@
+"""价格异常值过滤
+
+携程接口偶尔返回一瞬间的离谱价格（如 ¥1 或几万元），下一次查询又恢复正常。
+这样的价格直接参与对比时，会先触发一次提醒并刷新基准价格，恢复正常后再触发一次。
+
+OutlierFilter 在变化检测之前对每个序列运行 Hampel 滤波：
+- 每个序列只保存最近 window 个被接受的价格（固定大小的环形缓冲区）和一个待确认价格；
+- 新价格与窗口中位数的偏差同时超过 threshold 倍 MAD（换算为标准差）和
+  min_deviation 倍中位数时视为可疑；
+- 可疑价格本轮不参与对比，等待下一次查询确认：下一次价格更接近它而不是原来的
+  中位数时，确认为真实的价格变化，窗口从新的价格水平重新开始；下一次价格恢复
+  正常时，丢弃该可疑价格。
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_WINDOW = 7  # 每个序列保存的价格数
+DEFAULT_THRESHOLD = 3.0  # 偏差超过多少倍（换算为标准差的）MAD 视为可疑
+DEFAULT_MIN_DEVIATION = 0.3  # 偏差至少达到中位数的该比例才视为可疑
+MIN_SAMPLES = 3  # 窗口中的价格少于该数量时不做判断
+MAD_SCALE = 1.4826  # 正态分布下 MAD 与标准差的换算系数
+
+
+def _median(values: List[int]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class _Window:
+    __slots__ = ("prices", "next", "held")
+
+    def __init__(self):
+        self.prices: List[int] = []  # 最近被接受的价格（环形缓冲区）
+        self.next = 0  # 缓冲区写满后下一个覆盖的位置
+        self.held = 0  # 等待确认的可疑价格，0 表示没有
+
+    def push(self, price: int, size: int) -> None:
+        if len(self.prices) < size:
+            self.prices.append(price)
+        else:
+            self.prices[self.next] = price
+            self.next = (self.next + 1) % size
+
+    def reset(self, prices: List[int]) -> None:
+        self.prices = prices
+        self.next = 0
+
+
+class OutlierFilter:
+    """按监控编号对价格做 Hampel 滤波"""
+
+    def __init__(
+        self,
+        window: int = DEFAULT_WINDOW,
+        threshold: float = DEFAULT_THRESHOLD,
+        min_deviation: float = DEFAULT_MIN_DEVIATION,
+    ):
+        """
+        Args:
+            window: 每个序列保存的价格数
+            threshold: 偏差超过多少倍 MAD 视为可疑
+            min_deviation: 偏差至少达到中位数的该比例才视为可疑
+        """
+        if window < MIN_SAMPLES:
+            raise ValueError(f"window 不能小于 {MIN_SAMPLES}")
+        self.window = window
+        self.threshold = threshold
+        self.min_deviation = min_deviation
+        self._windows: List[Optional[_Window]] = []
+        self._held = 0
+        self._confirmed = 0
+        self._rejected = 0
+
+    def _suspicious(self, price: int, median: float, prices: List[int]) -> bool:
+        deviation = abs(price - median)
+        if deviation <= self.min_deviation * median:
+            return False
+        mad = _median([abs(p - median) for p in prices])
+        return deviation > self.threshold * MAD_SCALE * mad
+
+    def filter(
+        self, watch_ids: Sequence[int], prices: Sequence[int]
+    ) -> Tuple[List[int], List[int]]:
+        """过滤一轮价格
+
+        Args:
+            watch_ids: 监控编号
+            prices: 与 watch_ids 一一对应的当前价格，0 表示没有价格
+
+        Returns:
+            Tuple[List[int], List[int]]: (过滤后的价格，可疑价格替换为 0,
+                本轮被扣留等待确认的价格在输入中的位置)
+        """
+        filtered = list(prices)
+        held_positions = []
+        windows = self._windows
+        for position, (watch_id, price) in enumerate(zip(watch_ids, prices)):
+            if not price:
+                continue
+            if watch_id >= len(windows):
+                windows.extend([None] * (watch_id + 1 - len(windows)))
+            window = windows[watch_id]
+            if window is None:
+                window = windows[watch_id] = _Window()
+            if len(window.prices) < MIN_SAMPLES:
+                window.push(price, self.window)
+                continue
+
+            median = _median(window.prices)
+            held = window.held
+            if held:
+                window.held = 0
+                if abs(price - held) < abs(price - median):
+                    # 连续两次偏离到同一水平，确认为真实变化
+                    self._confirmed += 1
+                    window.reset([held, price])
+                    continue
+                # 上一次的可疑价格没有得到确认，视为接口的瞬时异常
+                self._rejected += 1
+                if not self._suspicious(price, median, window.prices):
+                    window.push(price, self.window)
+                    continue
+            elif not self._suspicious(price, median, window.prices):
+                window.push(price, self.window)
+                continue
+
+            window.held = price
+            self._held += 1
+            filtered[position] = 0
+            held_positions.append(position)
+        return filtered, held_positions
+
+    def forget(self, watch_id: int) -> None:
+        """清除一个序列的窗口，监控编号被释放时调用"""
+        if watch_id < len(self._windows):
+            self._windows[watch_id] = None
+
+    def stats(self) -> dict:
+        """被扣留、确认为真实变化和被丢弃的可疑价格数"""
+        return {
+            "held": self._held,
+            "confirmed": self._confirmed,
+            "rejected": self._rejected,
+        }
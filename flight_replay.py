@@ -0,0 +1,392 @@
+"""lowestPrice 响应的录制与回放
+
+录制：包装 fetch_flight_prices，把每次真实请求的参数、时间、耗时和返回数据
+（或异常）追加写入目录中的压缩 NDJSON 分段文件。每轮查询开始时先写一条轮次记录，
+分段只在轮次之间切换；每次启动写入新的分段，已有文件不会被修改。
+
+回放：按录制的顺序逐轮读取分段文件，用录制的响应代替接口请求。每轮只加载该轮的
+响应，内存占用与录制时长无关。轮次之间的间隔按 speed 倍速缩短，speed 为 0 时不等待。
+录制的异常按类型名还原为同一个异常类，回放时走与录制时相同的错误处理。
+
+两者都接受可替换的时钟和等待函数，可以在 flight_clock.VirtualClock 下录制和回放。
+回放时 cycle_time 是当前轮次录制时的开始时间，调用方可以据此推进虚拟时钟，
+使依赖时间的组件看到与录制时相同的时间，与回放倍速无关。
+
+记录格式（每行一个 JSON 对象）：
+    {"type": "cycle", "cycle": 1, "t": 1767225600.0, "routes": ["SHA-JIQ-OneWay"]}
+    {"type": "response", "cycle": 1, "t": 1767225600.1, "elapsed": 0.21,
+     "params": {...}, "data": {...}}
+    {"type": "response", "cycle": 1, "t": ..., "elapsed": ..., "params": {...},
+     "error": {"type": "HTTPError", "message": "..."}}
+"""
+
+import gzip
+import inspect
+import json
+import logging
+import lzma
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from flight_limiter import CircuitOpenError
+from flight_transport import RateLimitedError, build_params
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = {"gzip": (".ndjson.gz", gzip.open), "xz": (".ndjson.xz", lzma.open)}
+DEFAULT_COMPRESSION = "gzip"
+DEFAULT_SEGMENT_RECORDS = 5000  # 每个分段文件最多写入的响应数（在轮次之间切换）
+DEFAULT_SPEED = 60.0  # 回放倍速
+
+ParamsKey = Tuple[Tuple[str, str], ...]
+
+
+def _params_key(params: Dict[str, str]) -> ParamsKey:
+    return tuple(sorted(params.items()))
+
+
+def list_segments(directory: str) -> List[str]:
+    """目录中按写入顺序排列的分段文件路径"""
+    suffixes = tuple(suffix for suffix, _ in COMPRESSIONS.values())
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(suffixes)
+    ]
+
+
+def _open_segment(path: str, mode: str):
+    for suffix, opener in COMPRESSIONS.values():
+        if path.endswith(suffix):
+            return opener(path, mode)
+    raise ValueError(f"未知的分段文件类型: {path}")
+
+
+def read_records(directory: str) -> Iterator[dict]:
+    """按写入顺序逐条读取目录中的记录
+
+    程序异常退出时最后一个分段可能不完整，读到的完整记录照常返回，
+    截断的部分记录警告后跳过。
+    """
+    for path in list_segments(directory):
+        try:
+            with _open_segment(path, "rt") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning(f"跳过不完整的记录: {path}")
+        except (EOFError, OSError, lzma.LZMAError) as e:
+            logger.warning(f"分段文件不完整，已读取到截断处: {path} ({e})")
+
+
+class ResponseRecorder:
+    """把接口响应追加写入压缩 NDJSON 分段文件（线程安全）"""
+
+    def __init__(
+        self,
+        directory: str,
+        compression: str = DEFAULT_COMPRESSION,
+        segment_records: int = DEFAULT_SEGMENT_RECORDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            directory: 录制目录，不存在时自动创建
+            compression: 压缩格式，"gzip" 或 "xz"
+            segment_records: 每个分段文件最多写入的响应数
+            clock: 时钟函数，记录轮次和请求的时间
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression 必须是 {' 或 '.join(COMPRESSIONS)}")
+        if segment_records <= 0:
+            raise ValueError("segment_records 必须是正整数")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compression = compression
+        self.segment_records = segment_records
+        self.clock = clock
+        # 文件名以启动时间开头，多次录制到同一目录时按时间顺序排列
+        self._prefix = time.strftime("%Y%m%d-%H%M%S", time.localtime(clock()))
+        self._segment = 0
+        self._file = None
+        self._file_records = 0
+        self._cycle = 0
+        self._records = 0
+        self._lock = threading.Lock()
+
+    def _open_next(self) -> None:
+        """关闭当前分段并打开新的分段，调用方需持有锁"""
+        if self._file is not None:
+            self._file.close()
+        self._segment += 1
+        suffix, opener = COMPRESSIONS[self.compression]
+        path = os.path.join(
+            self.directory, f"{self._prefix}-{self._segment:05d}{suffix}"
+        )
+        self._file = opener(path, "wt", encoding="utf-8")
+        self._file_records = 0
+
+    def _write(self, record: dict) -> None:
+        """写入一条记录，调用方需持有锁"""
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def start_cycle(self, route_keys: List[str]) -> None:
+        """记录新一轮查询的开始，并把上一轮的记录刷新到磁盘
+
+        Args:
+            route_keys: 本轮查询的航线标识
+        """
+        with self._lock:
+            if self._file is None or self._file_records >= self.segment_records:
+                self._open_next()
+            else:
+                # gzip 可以同步刷新，异常退出后已写入的轮次仍然可以读取
+                self._file.flush()
+            self._cycle += 1
+            self._write(
+                {
+                    "type": "cycle",
+                    "cycle": self._cycle,
+                    "t": self.clock(),
+                    "routes": route_keys,
+                }
+            )
+
+    def record(
+        self,
+        params: Dict[str, str],
+        started_at: float,
+        elapsed: float,
+        data: Optional[dict] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """记录一次请求的结果
+
+        Args:
+            params: 请求参数
+            started_at: 请求开始的时间戳
+            elapsed: 请求耗时（秒）
+            data: 接口返回数据，请求失败时为 None
+            error: 请求失败时的异常
+        """
+        record = {
+            "type": "response",
+            "cycle": self._cycle,
+            "t": started_at,
+            "elapsed": round(elapsed, 6),
+            "params": params,
+        }
+        if error is not None:
+            record["error"] = {"type": type(error).__name__, "message": str(error)}
+            if isinstance(error, CircuitOpenError):
+                record["error"]["retry_after"] = error.retry_after
+        else:
+            record["data"] = data
+        with self._lock:
+            if self._file is None:
+                self._open_next()
+            self._write(record)
+            self._file_records += 1
+            self._records += 1
+
+    def wrap(
+        self, fetch_func: Callable[[dict, bool], dict]
+    ) -> Callable[[dict, bool], dict]:
+        """包装抓取函数，记录每次调用的参数、耗时和结果
+
+        Args:
+            fetch_func: 签名为 fetch_func(config, direct) 的抓取函数
+
+        Returns:
+            Callable[[dict, bool], dict]: 签名相同的抓取函数
+        """
+
+        def fetch(config: dict, direct: bool = True) -> dict:
+            params = build_params(config, direct)
+            started_at = self.clock()
+            start = time.perf_counter()
+            try:
+                data = fetch_func(config, direct)
+            except Exception as e:
+                self.record(params, started_at, time.perf_counter() - start, error=e)
+                raise
+            self.record(params, started_at, time.perf_counter() - start, data=data)
+            return data
+
+        return fetch
+
+    def stats(self) -> Dict[str, int]:
+        """已录制的轮数、响应数和分段文件数"""
+        with self._lock:
+            return {
+                "cycles": self._cycle,
+                "responses": self._records,
+                "segments": self._segment,
+            }
+
+    def close(self) -> None:
+        """关闭当前分段文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReplayedError(requests.exceptions.RequestException):
+    """录制中没有该请求的响应，或录制的异常类型无法还原"""
+
+
+# 可以按类型名还原的异常：接口层会抛出的 ValueError 和 requests 的全部请求异常
+_ERROR_TYPES: Dict[str, type] = {
+    cls.__name__: cls
+    for cls in (
+        ValueError,
+        RateLimitedError,
+        CircuitOpenError,
+        *(
+            value
+            for value in vars(requests.exceptions).values()
+            if inspect.isclass(value)
+            and issubclass(value, requests.exceptions.RequestException)
+        ),
+    )
+}
+
+
+def rebuild_error(error: dict) -> Exception:
+    """按录制的类型名和消息还原异常
+
+    Args:
+        error: 录制的 {"type": ..., "message": ...}
+
+    Returns:
+        Exception: 与录制时同一类的异常，未知类型返回 ReplayedError
+    """
+    name, message = error["type"], error["message"]
+    cls = _ERROR_TYPES.get(name)
+    if cls is None:
+        return ReplayedError(f"{name}: {message}")
+    try:
+        exc = cls(message)
+    except TypeError:
+        # 构造参数不同的异常（如 JSONDecodeError、CircuitOpenError）直接设置消息
+        exc = cls.__new__(cls)
+        exc.args = (message,)
+        if isinstance(exc, requests.exceptions.RequestException):
+            exc.response = exc.request = None
+    if isinstance(exc, CircuitOpenError):
+        exc.retry_after = error.get("retry_after", 0.0)
+    return exc
+
+
+class ResponseReplayer:
+    """按录制的顺序逐轮回放接口响应
+
+    用法：
+        for route_keys in replayer.cycles():
+            ...  # 本轮中 replayer.fetch(config, direct) 返回录制的响应，
+                 # replayer.cycle_time 是本轮录制时的开始时间
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        speed: float = DEFAULT_SPEED,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            directory: 录制目录
+            speed: 回放倍速，0 表示轮次之间不等待
+            sleep: 轮次之间的等待函数
+        """
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"录制目录不存在: {directory}")
+        if speed < 0:
+            raise ValueError("speed 不能为负数")
+        self.directory = directory
+        self.speed = speed
+        self.sleep = sleep
+        self.cycle_time: Optional[float] = None  # 当前轮次录制时的开始时间
+        self._current: Dict[ParamsKey, dict] = {}
+        self._late: Dict[ParamsKey, dict] = {}
+        self._latest: Dict[ParamsKey, dict] = {}
+        self._missing = 0
+
+    def start_time(self) -> Optional[float]:
+        """第一轮录制时的开始时间，录制为空时返回 None"""
+        for record in read_records(self.directory):
+            if record.get("type") == "cycle":
+                return record["t"]
+        return None
+
+    def cycles(self) -> Iterator[List[str]]:
+        """逐轮加载录制的响应，按倍速等待后返回该轮查询的航线标识"""
+        records = read_records(self.directory)
+        pending: Optional[dict] = None
+        last_started: Optional[float] = None
+        while True:
+            marker = pending
+            pending = None
+            responses: Dict[ParamsKey, dict] = {}
+            late: Dict[ParamsKey, dict] = {}
+            for record in records:
+                if record.get("type") == "cycle":
+                    if marker is None:
+                        marker = record
+                        continue
+                    pending = record
+                    break
+                if marker is None:
+                    continue
+                key = _params_key(record["params"])
+                if key in responses:
+                    # 同一参数的后续响应来自缓存的后台刷新，从下一轮开始生效
+                    late[key] = record
+                else:
+                    responses[key] = record
+            if marker is None:
+                return
+
+            if last_started is not None and self.speed:
+                self.sleep(max(0.0, marker["t"] - last_started) / self.speed)
+            last_started = marker["t"]
+
+            # 录制时命中缓存的请求没有响应记录，回放时沿用该参数最近一次的数据
+            for key, record in self._current.items():
+                if "data" in record:
+                    self._latest[key] = record
+            for key, record in self._late.items():
+                if "data" in record:
+                    self._latest[key] = record
+            self._current = responses
+            self._late = late
+            self.cycle_time = marker["t"]
+            yield marker["routes"]
+            if pending is None:
+                return
+
+    def fetch(self, config: dict, direct: bool = True) -> dict:
+        """返回本轮录制的响应，签名与 fetch_flight_prices 相同
+
+        Raises:
+            Exception: 录制时抛出的异常（按类型还原，如 RateLimitedError、HTTPError）
+            ReplayedError: 录制中没有该请求，或录制的异常类型无法还原
+        """
+        key = _params_key(build_params(config, direct))
+        record = self._current.get(key) or self._latest.get(key)
+        if record is None:
+            self._missing += 1
+            raise ReplayedError(f"录制中没有该请求的响应: {dict(key)}")
+        if "error" in record:
+            raise rebuild_error(record["error"])
+        return record["data"]
+
+    def stats(self) -> Dict[str, int]:
+        """回放中找不到录制响应的请求数"""
+        return {"missing": self._missing}
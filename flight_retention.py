@@ -0,0 +1,86 @@
+"""价格历史的分级保留策略
+
+明细 → 小时汇总 → 日汇总：
+- 超过 raw_days 的明细汇总为每小时的 (最低, 最高, 首个, 最后, 次数) 后删除；
+- 超过 hourly_days 的小时汇总再合并为日汇总后删除，日汇总长期保留；
+- 已经过去的出发日期不再需要明细，直接并入日汇总并清理。
+每次 step() 只处理有限的一批记录，在每轮查询之后调用，不会阻塞监控循环。
+"""
+
+import logging
+import time
+from typing import Callable
+
+from flight_store import PriceStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RAW_DAYS = 14  # 明细保留天数
+DEFAULT_HOURLY_DAYS = 90  # 小时汇总保留天数
+DEFAULT_BATCH_SIZE = 2000  # 每次 step 每个层级最多处理的记录数
+
+
+class RetentionManager:
+    """按保留策略逐批汇总和清理 PriceStore 中的历史数据"""
+
+    def __init__(
+        self,
+        store: PriceStore,
+        raw_days: float = DEFAULT_RAW_DAYS,
+        hourly_days: float = DEFAULT_HOURLY_DAYS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            store: 价格历史存储
+            raw_days: 明细保留天数
+            hourly_days: 小时汇总保留天数，必须比 raw_days 至少多一天
+            batch_size: 每次 step 每个层级最多处理的记录数
+            clock: 时钟函数
+        """
+        if raw_days <= 0:
+            raise ValueError("raw_days 必须大于0")
+        if hourly_days < raw_days + 1:
+            raise ValueError("hourly_days 必须比 raw_days 至少多一天")
+        self.store = store
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.batch_size = batch_size
+        self.clock = clock
+
+    def step(self) -> int:
+        """执行一批汇总和清理
+
+        Returns:
+            int: 本次处理的记录数，为 0 表示暂时没有需要处理的数据
+        """
+        now = self.clock()
+        today = time.strftime("%Y%m%d", time.localtime(now))
+        pruned = self.store.prune_dates(today, self.batch_size)
+        raw = self.store.rollup_observations(
+            now - self.raw_days * 86400, self.batch_size
+        )
+        hourly = self.store.rollup_hourly(
+            now - self.hourly_days * 86400, self.batch_size
+        )
+        processed = pruned + raw + hourly
+        if processed:
+            logger.info(
+                f"历史数据整理: 过期日期 {pruned} 条，明细汇总 {raw} 条，"
+                f"小时汇总合并 {hourly} 条"
+            )
+        return processed
+
+    def run_until_idle(self) -> int:
+        """一直执行到没有需要处理的数据，用于离线整理
+
+        Returns:
+            int: 处理的记录总数
+        """
+        total = 0
+        while True:
+            processed = self.step()
+            if not processed:
+                return total
+            total += processed
@@ -0,0 +1,202 @@
+"""基于最小堆的到期时间调度器
+
+每个监控项（航线、日期等）有各自的查询间隔，调度器按绝对截止时间排列：
+- 下一次截止时间 = 上一次截止时间 + 间隔，不受抓取和发邮件耗时影响，不会漂移；
+- 可选的抖动会给每个监控项一个固定的相位偏移，把同一间隔的请求分散开；
+- 添加、删除、取出到期项的开销均为 O(log n)，可支撑上千个监控项。
+"""
+
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+_REMOVED = object()  # 已删除条目的占位标记
+
+
+class _Watch:
+    __slots__ = ("key", "interval", "base", "phase", "due", "entry", "retry")
+
+    def __init__(self, key: Hashable, interval: float, base: float, phase: float):
+        self.key = key
+        self.interval = interval
+        self.base = base  # 对齐后的名义截止时间
+        self.phase = phase  # 抖动产生的固定相位偏移
+        self.due = base + phase
+        self.entry: Optional[list] = None
+        self.retry = False  # 当前的 due 是一次性的重试，取出时不推进 base
+
+
+class WatchScheduler:
+    """按下一次到期时间排序的监控项调度器（线程安全）"""
+
+    def __init__(
+        self,
+        jitter: float = 0.0,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            jitter: 抖动比例（0~1），相位偏移在 [0, jitter * interval) 中随机选取
+            clock: 时钟函数，返回当前时间（秒）
+            rng: 随机数生成器，便于测试时固定结果
+        """
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter 必须在 [0, 1) 范围内")
+        self.jitter = jitter
+        self.clock = clock
+        self._rng = rng or random.Random()
+        self._heap: List[list] = []
+        self._watches: Dict[Hashable, _Watch] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._watches
+
+    def add(
+        self, key: Hashable, interval: float, start_at: Optional[float] = None
+    ) -> None:
+        """添加或更新一个监控项
+
+        Args:
+            key: 监控项标识
+            interval: 查询间隔（秒）
+            start_at: 首次截止时间，默认立即到期
+        """
+        if interval <= 0:
+            raise ValueError("interval 必须大于0")
+        base = self.clock() if start_at is None else start_at
+        phase = self._rng.uniform(0, self.jitter * interval) if self.jitter else 0.0
+        with self._lock:
+            self._discard(key)
+            watch = _Watch(key, interval, base, phase)
+            self._watches[key] = watch
+            self._push(watch)
+
+    def remove(self, key: Hashable) -> bool:
+        """删除一个监控项
+
+        Returns:
+            bool: 监控项是否存在
+        """
+        with self._lock:
+            return self._discard(key)
+
+    def set_interval(self, key: Hashable, interval: float) -> None:
+        """修改监控项的查询间隔
+
+        新间隔从上一次截止时间起算，因此在 pop_due 之后调用即可立即生效。
+
+        Args:
+            key: 监控项标识
+            interval: 新的查询间隔（秒）
+        """
+        if interval <= 0:
+            raise ValueError("interval 必须大于0")
+        with self._lock:
+            watch = self._watches[key]
+            if interval == watch.interval:
+                return
+            previous = watch.base - watch.interval
+            if self.jitter:
+                watch.phase = watch.phase / watch.interval * interval
+            watch.interval = interval
+            watch.base = max(previous + interval, self.clock() - watch.phase)
+            watch.due = watch.base + watch.phase
+            self._push(watch)
+
+    def retry_in(self, key: Hashable, delay: float) -> None:
+        """让监控项在 delay 秒后重试一次，不改变其原有的截止时间对齐
+
+        失败的那次查询被取出时 base 已经推进了一个间隔，重试被取出时不再推进，
+        下一次常规查询仍在原来的截止时间。
+
+        Args:
+            key: 监控项标识
+            delay: 重试延迟（秒）
+        """
+        with self._lock:
+            watch = self._watches[key]
+            watch.due = self.clock() + delay
+            watch.retry = True
+            self._push(watch)
+
+    def next_due(self) -> Optional[float]:
+        """最早的到期时间，没有监控项时返回 None"""
+        with self._lock:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self) -> Optional[float]:
+        """距离最早的到期时间还有多少秒（已到期时为 0）"""
+        due = self.next_due()
+        if due is None:
+            return None
+        return max(0.0, due - self.clock())
+
+    def pop_due(self) -> List[Hashable]:
+        """取出所有已到期的监控项，并按绝对截止时间安排下一次
+
+        错过多个周期的监控项只会被取出一次，下一次截止时间直接跳到未来。
+
+        Returns:
+            List[Hashable]: 已到期的监控项标识，按到期时间先后排序
+        """
+        now = self.clock()
+        due_keys = []
+        with self._lock:
+            while self._heap:
+                due, _, key = self._heap[0]
+                if key is _REMOVED:
+                    heapq.heappop(self._heap)
+                    continue
+                if due > now:
+                    break
+                heapq.heappop(self._heap)
+                watch = self._watches[key]
+                watch.entry = None
+                due_keys.append(key)
+
+                # 按间隔推进名义截止时间，保证下一次在当前时间之后；
+                # 重试的那一周期已经在失败时推进过
+                if watch.retry:
+                    watch.retry = False
+                else:
+                    watch.base += watch.interval
+                if watch.base + watch.phase <= now:
+                    missed = math.floor(
+                        (now - watch.base - watch.phase) / watch.interval
+                    )
+                    watch.base += (missed + 1) * watch.interval
+                watch.due = watch.base + watch.phase
+                self._push(watch)
+        return due_keys
+
+    def _push(self, watch: _Watch) -> None:
+        """将监控项按 due 放入堆中，调用方需持有锁"""
+        if watch.entry is not None:
+            watch.entry[2] = _REMOVED
+        watch.entry = [watch.due, next(self._counter), watch.key]
+        heapq.heappush(self._heap, watch.entry)
+
+    def _discard(self, key: Hashable) -> bool:
+        """惰性删除，调用方需持有锁"""
+        watch = self._watches.pop(key, None)
+        if watch is None:
+            return False
+        if watch.entry is not None:
+            watch.entry[2] = _REMOVED
+        return True
+
+    def _prune(self) -> None:
+        """弹出堆顶已删除的条目，调用方需持有锁"""
+        while self._heap and self._heap[0][2] is _REMOVED:
+            heapq.heappop(self._heap)
@@ -0,0 +1,254 @@
+"""每个价格序列的增量统计和统计类提醒规则
+
+每个 (航线, 日期, 是否直飞) 保存一份常数大小的流式状态，每次更新 O(1)，
+检查规则时不需要重新扫描历史：
+- 最低价、最高价、最新价格和观察次数；
+- 按时间衰减的指数加权移动平均（EWMA）；
+- 指数衰减的对数分桶分位数草图，近似最近 N 天的价格分布，相对误差约 2%。
+
+基于这些统计的提醒规则：
+- "low"：创该日期的历史新低；
+- "percentile"：低于最近 N 天价格的 p 分位；
+- "ewma"：比 N 天 EWMA 低 x%。
+分位数和 EWMA 规则只在条件从不满足变为满足时提醒一次，避免价格持续偏低时反复提醒。
+"""
+
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+DAY = 86400
+GAMMA = 1.02  # 分位数草图相邻分桶的价格比例
+LOG_GAMMA = math.log(GAMMA)
+RESCALE_EXPONENT = 20.0  # 权重指数超过该值时整体缩放，避免浮点溢出
+PRUNE_RATIO = 1e-9  # 缩放时丢弃相对权重低于该值的分桶
+
+DEFAULT_PERCENTILE_DAYS = 14
+DEFAULT_EWMA_DAYS = 7
+DEFAULT_MIN_SAMPLES = 20  # 观察次数达到该值后才检查分位数和 EWMA 规则
+
+
+class QuantileSketch:
+    """指数衰减的对数分桶分位数草图
+
+    价格按 GAMMA 的幂分桶，新观察的权重随时间指数增长（前向衰减），
+    等价于旧观察按 horizon 的时间常数衰减。分桶数只取决于价格范围，与观察次数无关。
+    """
+
+    __slots__ = ("horizon", "origin", "total", "buckets")
+
+    def __init__(self, horizon: float):
+        """
+        Args:
+            horizon: 衰减时间常数（秒）
+        """
+        self.horizon = horizon
+        self.origin: Optional[float] = None
+        self.total = 0.0
+        self.buckets: Dict[int, float] = {}
+
+    def add(self, value: int, timestamp: float) -> None:
+        """加入一个观察"""
+        if self.origin is None:
+            self.origin = timestamp
+        exponent = (timestamp - self.origin) / self.horizon
+        if exponent > RESCALE_EXPONENT:
+            self._rescale(timestamp)
+            exponent = 0.0
+        weight = math.exp(exponent)
+        key = math.floor(math.log(value) / LOG_GAMMA)
+        self.buckets[key] = self.buckets.get(key, 0.0) + weight
+        self.total += weight
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q 分位所在分桶的下界，没有观察时返回 None
+
+        返回下界而不是分桶中点，价格低于返回值时一定落在更低的分桶中。
+
+        Args:
+            q: 0 到 1 之间的分位
+        """
+        if not self.buckets:
+            return None
+        rank = q * self.total
+        cumulative = 0.0
+        for key in sorted(self.buckets):
+            cumulative += self.buckets[key]
+            if cumulative >= rank:
+                break
+        return GAMMA**key
+
+    def _rescale(self, timestamp: float) -> None:
+        factor = math.exp(-(timestamp - self.origin) / self.horizon)
+        floor = PRUNE_RATIO * self.total * factor
+        self.buckets = {
+            key: weight * factor
+            for key, weight in self.buckets.items()
+            if weight * factor > floor
+        }
+        self.total = sum(self.buckets.values())
+        self.origin = timestamp
+
+
+class SeriesStats:
+    """一个价格序列的流式统计"""
+
+    __slots__ = (
+        "count",
+        "low",
+        "high",
+        "last",
+        "ewma",
+        "updated_at",
+        "sketch",
+        "below_percentile",
+        "below_ewma",
+    )
+
+    def __init__(self, percentile_horizon: float):
+        self.count = 0
+        self.low = 0
+        self.high = 0
+        self.last = 0
+        self.ewma = 0.0
+        self.updated_at = 0.0
+        self.sketch = QuantileSketch(percentile_horizon)
+        self.below_percentile = False  # 上一次是否低于分位数
+        self.below_ewma = False  # 上一次是否低于 EWMA 折扣线
+
+    def update(self, price: int, timestamp: float, ewma_horizon: float) -> None:
+        """加入一个观察
+
+        Args:
+            price: 价格
+            timestamp: 观察时间戳
+            ewma_horizon: EWMA 的时间常数（秒）
+        """
+        if self.count == 0:
+            self.low = self.high = price
+            self.ewma = float(price)
+        else:
+            self.low = min(self.low, price)
+            self.high = max(self.high, price)
+            elapsed = max(0.0, timestamp - self.updated_at)
+            alpha = 1.0 - math.exp(-elapsed / ewma_horizon)
+            self.ewma += alpha * (price - self.ewma)
+        self.count += 1
+        self.last = price
+        self.updated_at = timestamp
+        self.sketch.add(price, timestamp)
+
+
+class RuleHit(NamedTuple):
+    """一次统计规则命中"""
+
+    position: int  # 在输入中的位置
+    kind: str  # 规则类型："low"、"percentile" 或 "ewma"
+    reference: int  # 对比的参考价格：此前最低价、分位数或 EWMA
+
+
+class StatsRules:
+    """按监控编号保存各序列的统计，并检查统计类提醒规则"""
+
+    def __init__(
+        self,
+        all_time_low: bool = False,
+        percentile: Optional[float] = None,
+        percentile_days: float = DEFAULT_PERCENTILE_DAYS,
+        ewma_discount: Optional[float] = None,
+        ewma_days: float = DEFAULT_EWMA_DAYS,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+    ):
+        """
+        Args:
+            all_time_low: 是否在创历史新低时提醒
+            percentile: 低于该分位（0-100）时提醒，None 表示不检查
+            percentile_days: 分位数统计的时间范围（天）
+            ewma_discount: 比 EWMA 低该百分比时提醒，None 表示不检查
+            ewma_days: EWMA 的时间常数（天）
+            min_samples: 观察次数达到该值后才检查分位数和 EWMA 规则
+        """
+        if percentile is not None and not 0 < percentile < 100:
+            raise ValueError("percentile 必须在 0 到 100 之间")
+        if ewma_discount is not None and not 0 < ewma_discount < 100:
+            raise ValueError("ewma_discount 必须在 0 到 100 之间")
+        self.all_time_low = all_time_low
+        self.percentile = percentile
+        self.percentile_days = percentile_days
+        self.ewma_discount = ewma_discount
+        self.ewma_days = ewma_days
+        self.min_samples = min_samples
+        self._percentile_horizon = percentile_days * DAY
+        self._ewma_horizon = ewma_days * DAY
+        self._stats: List[Optional[SeriesStats]] = []
+
+    def get(self, watch_id: int) -> Optional[SeriesStats]:
+        """序列的统计，尚未观察过时返回 None"""
+        if watch_id < len(self._stats):
+            return self._stats[watch_id]
+        return None
+
+    def forget(self, watch_id: int) -> None:
+        """清除一个序列的统计，监控编号被释放时调用"""
+        if watch_id < len(self._stats):
+            self._stats[watch_id] = None
+
+    def observe(
+        self, watch_ids: Sequence[int], prices: Sequence[int], timestamp: float
+    ) -> List[RuleHit]:
+        """用一轮价格检查规则并更新统计
+
+        规则在加入本次价格之前检查，即与此前的统计对比。
+
+        Args:
+            watch_ids: 监控编号
+            prices: 与 watch_ids 一一对应的当前价格，0 表示没有价格
+            timestamp: 本轮价格的获取时间
+
+        Returns:
+            List[RuleHit]: 命中的规则，顺序与输入一致
+        """
+        hits = []
+        stats_list = self._stats
+        for position, (watch_id, price) in enumerate(zip(watch_ids, prices)):
+            if not price:
+                continue
+            if watch_id >= len(stats_list):
+                stats_list.extend([None] * (watch_id + 1 - len(stats_list)))
+            stats = stats_list[watch_id]
+            if stats is None:
+                stats = stats_list[watch_id] = SeriesStats(self._percentile_horizon)
+            elif stats.count:
+                if self.all_time_low and price < stats.low:
+                    hits.append(RuleHit(position, "low", stats.low))
+                if stats.count >= self.min_samples:
+                    if self.percentile is not None:
+                        threshold = stats.sketch.quantile(self.percentile / 100)
+                        below = price < threshold
+                        if below and not stats.below_percentile:
+                            reference = round(threshold)
+                            hits.append(RuleHit(position, "percentile", reference))
+                        stats.below_percentile = below
+                    if self.ewma_discount is not None:
+                        below = price <= stats.ewma * (1 - self.ewma_discount / 100)
+                        if below and not stats.below_ewma:
+                            hits.append(RuleHit(position, "ewma", round(stats.ewma)))
+                        stats.below_ewma = below
+            stats.update(price, timestamp, self._ewma_horizon)
+        return hits
+
+
+def rules_from_config(rules: dict) -> StatsRules:
+    """按 config.json 中 alertRules 的格式创建规则
+
+    Args:
+        rules: 包含 allTimeLow、percentile、percentileDays、ewmaDiscount、
+               ewmaDays、minSamples 的字典，缺少的项使用默认值
+    """
+    return StatsRules(
+        all_time_low=rules.get("allTimeLow", False),
+        percentile=rules.get("percentile"),
+        percentile_days=rules.get("percentileDays", DEFAULT_PERCENTILE_DAYS),
+        ewma_discount=rules.get("ewmaDiscount"),
+        ewma_days=rules.get("ewmaDays", DEFAULT_EWMA_DAYS),
+        min_samples=rules.get("minSamples", DEFAULT_MIN_SAMPLES),
+    )
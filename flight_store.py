@@ -0,0 +1,397 @@
+"""基于 SQLite（WAL 模式）的价格时间序列存储
+
+每次查询到的价格记录为一行 (航线, 出发日期, 是否直飞, 价格, 抓取时间)：
+- 每轮查询的所有观察在一个事务内批量写入；
+- (route, date, direct, fetched_at) 联合索引支撑按序列查询历史；
+- latest_prices 表随写入同步更新，"每个日期的最新价格" 无需扫描历史；
+- hourly_prices / daily_prices 保存按小时、按天汇总的 (最低, 最高, 首个, 最后, 次数)，
+  由 flight_retention 把过期的明细逐批汇总进来。
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (航线标识, 出发日期, 是否直飞, 价格, 抓取时间戳)
+Observation = Tuple[str, str, bool, int, float]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    route TEXT NOT NULL,
+    date TEXT NOT NULL,
+    direct INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_observations_series
+    ON observations (route, date, direct, fetched_at);
+CREATE INDEX IF NOT EXISTS idx_observations_fetched_at
+    ON observations (fetched_at);
+CREATE TABLE IF NOT EXISTS latest_prices (
+    route TEXT NOT NULL,
+    date TEXT NOT NULL,
+    direct INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (route, date, direct)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_TABLES = ("hourly_prices", "daily_prices")
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    route TEXT NOT NULL,
+    date TEXT NOT NULL,
+    direct INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    min_price INTEGER NOT NULL,
+    max_price INTEGER NOT NULL,
+    first_price INTEGER NOT NULL,
+    first_at REAL NOT NULL,
+    last_price INTEGER NOT NULL,
+    last_at REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (route, date, direct, bucket)
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket);
+"""
+
+# 合并同一时间段的汇总：最低/最高取极值，首个/最后按时间取，次数相加
+ROLLUP_UPSERT = (
+    "INSERT INTO {table} (route, date, direct, bucket, min_price, max_price, "
+    "first_price, first_at, last_price, last_at, count) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (route, date, direct, bucket) DO UPDATE SET "
+    "min_price = min(min_price, excluded.min_price), "
+    "max_price = max(max_price, excluded.max_price), "
+    "first_price = CASE WHEN excluded.first_at < first_at "
+    "THEN excluded.first_price ELSE first_price END, "
+    "first_at = min(first_at, excluded.first_at), "
+    "last_price = CASE WHEN excluded.last_at >= last_at "
+    "THEN excluded.last_price ELSE last_price END, "
+    "last_at = max(last_at, excluded.last_at), "
+    "count = count + excluded.count"
+)
+
+ROLLUP_COLUMNS = (
+    "route, date, direct, min_price, max_price, "
+    "first_price, first_at, last_price, last_at, count"
+)
+
+# 以汇总的形式读取明细：每条观察相当于只有一次的汇总
+RAW_AS_ROLLUP = (
+    "route, date, direct, price, price, price, fetched_at, price, fetched_at, 1"
+)
+
+
+def hour_bucket(ts: float) -> int:
+    """时间戳所在小时的起始时间戳"""
+    return int(ts // 3600 * 3600)
+
+
+def day_bucket(ts: float) -> int:
+    """时间戳所在本地日期零点的时间戳"""
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day.timestamp())
+
+
+def _fold(rows: Iterable[tuple], bucket_of: Callable[[float], int]) -> List[tuple]:
+    """把汇总行按 (航线, 日期, 是否直飞, 时间段) 合并
+
+    Args:
+        rows: 按 ROLLUP_COLUMNS 排列的行
+        bucket_of: 由首个观察时间计算时间段的函数
+
+    Returns:
+        List[tuple]: 可直接用于 ROLLUP_UPSERT 的参数
+    """
+    folded: Dict[tuple, list] = {}
+    for route, date, direct, lo, hi, first, first_at, last, last_at, count in rows:
+        key = (route, date, direct, bucket_of(first_at))
+        agg = folded.get(key)
+        if agg is None:
+            folded[key] = [lo, hi, first, first_at, last, last_at, count]
+            continue
+        agg[0] = min(agg[0], lo)
+        agg[1] = max(agg[1], hi)
+        if first_at < agg[3]:
+            agg[2], agg[3] = first, first_at
+        if last_at >= agg[5]:
+            agg[4], agg[5] = last, last_at
+        agg[6] += count
+    return [key + tuple(agg) for key, agg in folded.items()]
+
+
+class PriceStore:
+    """价格观察记录的持久化存储（线程安全）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        for table in ROLLUP_TABLES:
+            self._conn.executescript(ROLLUP_SCHEMA.format(table=table))
+        self._lock = threading.Lock()
+
+    def record_cycle(self, observations: Iterable[Observation]) -> int:
+        """在一个事务内写入一轮查询的所有观察
+
+        Args:
+            observations: 观察记录列表
+
+        Returns:
+            int: 写入的记录数
+        """
+        rows = [
+            (route, date, int(direct), price, fetched_at)
+            for route, date, direct, price, fetched_at in observations
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO observations (route, date, direct, price, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO latest_prices (route, date, direct, price, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (route, date, direct) DO UPDATE SET "
+                "price = excluded.price, fetched_at = excluded.fetched_at "
+                "WHERE excluded.fetched_at >= latest_prices.fetched_at",
+                rows,
+            )
+        return len(rows)
+
+    def series(
+        self,
+        route: str,
+        date: str,
+        direct: Optional[bool] = None,
+        since: Optional[float] = None,
+    ) -> List[Tuple[float, bool, int]]:
+        """查询一个 (航线, 日期) 的所有观察
+
+        Args:
+            route: 航线标识
+            date: 出发日期
+            direct: 只查询直飞（True）或非直飞（False），None 表示都查询
+            since: 只返回该时间戳之后的观察
+
+        Returns:
+            List[Tuple[float, bool, int]]: 按时间排序的 (抓取时间, 是否直飞, 价格)
+        """
+        sql = (
+            "SELECT fetched_at, direct, price FROM observations "
+            "WHERE route = ? AND date = ?"
+        )
+        args: list = [route, date]
+        if direct is not None:
+            sql += " AND direct = ?"
+            args.append(int(direct))
+        if since is not None:
+            sql += " AND fetched_at >= ?"
+            args.append(since)
+        sql += " ORDER BY fetched_at"
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [(fetched_at, bool(d), price) for fetched_at, d, price in rows]
+
+    def latest_prices(self, route: str) -> Dict[Tuple[str, bool], Tuple[int, float]]:
+        """查询一条航线每个日期的最新价格
+
+        Args:
+            route: 航线标识
+
+        Returns:
+            Dict: (出发日期, 是否直飞) 到 (价格, 抓取时间) 的映射
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, direct, price, fetched_at FROM latest_prices "
+                "WHERE route = ?",
+                (route,),
+            ).fetchall()
+        return {
+            (date, bool(direct)): (price, fetched_at)
+            for date, direct, price, fetched_at in rows
+        }
+
+    def rollups(
+        self, route: str, date: str, table: str = "daily_prices"
+    ) -> List[Tuple[int, bool, int, int, int, int, int]]:
+        """查询一个 (航线, 日期) 的汇总数据
+
+        Args:
+            route: 航线标识
+            date: 出发日期
+            table: hourly_prices 或 daily_prices
+
+        Returns:
+            List[Tuple]: 按时间段排序的 (时间段起点, 是否直飞, 最低, 最高, 首个, 最后, 次数)
+        """
+        if table not in ROLLUP_TABLES:
+            raise ValueError(f"未知的汇总表: {table}")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bucket, direct, min_price, max_price, first_price, "
+                f"last_price, count FROM {table} WHERE route = ? AND date = ? "
+                "ORDER BY bucket, direct",
+                (route, date),
+            ).fetchall()
+        return [(bucket, bool(direct), *rest) for bucket, direct, *rest in rows]
+
+    def rollup_observations(self, before: float, limit: int) -> int:
+        """把 before 之前的一批明细汇总到 hourly_prices 并删除
+
+        Args:
+            before: 截止时间戳
+            limit: 本批最多处理的记录数
+
+        Returns:
+            int: 处理的明细记录数
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT id, {RAW_AS_ROLLUP} FROM observations "
+                "WHERE fetched_at < ? ORDER BY fetched_at LIMIT ?",
+                (before, limit),
+            ).fetchall()
+            if not rows:
+                return 0
+            self._conn.executemany(
+                ROLLUP_UPSERT.format(table="hourly_prices"),
+                _fold((row[1:] for row in rows), hour_bucket),
+            )
+            self._conn.executemany(
+                "DELETE FROM observations WHERE id = ?", ((row[0],) for row in rows)
+            )
+        return len(rows)
+
+    def rollup_hourly(self, before: float, limit: int) -> int:
+        """把 before 之前的一批小时汇总合并到 daily_prices 并删除
+
+        Args:
+            before: 截止时间戳，只处理整个小时都在其之前的汇总
+            limit: 本批最多处理的汇总行数
+
+        Returns:
+            int: 处理的汇总行数
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT bucket, {ROLLUP_COLUMNS} FROM hourly_prices "
+                "WHERE bucket < ? ORDER BY bucket LIMIT ?",
+                (before - 3600, limit),
+            ).fetchall()
+            if not rows:
+                return 0
+            self._conn.executemany(
+                ROLLUP_UPSERT.format(table="daily_prices"),
+                _fold((row[1:] for row in rows), day_bucket),
+            )
+            self._conn.executemany(
+                "DELETE FROM hourly_prices "
+                "WHERE route = ? AND date = ? AND direct = ? AND bucket = ?",
+                ((route, date, direct, bucket) for bucket, route, date, direct, *_ in rows),
+            )
+        return len(rows)
+
+    def prune_dates(self, before_date: str, limit: int) -> int:
+        """清理已经过去的出发日期：明细和小时汇总并入 daily_prices 后删除
+
+        Args:
+            before_date: 早于该日期（YYYYMMDD）的出发日期视为过期
+            limit: 本批最多处理的明细记录数
+
+        Returns:
+            int: 处理的记录数（明细与小时汇总之和）
+        """
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "SELECT DISTINCT route, date FROM latest_prices WHERE date < ? "
+                "UNION SELECT DISTINCT route, date FROM hourly_prices WHERE date < ?",
+                (before_date, before_date),
+            ).fetchall()
+            processed = 0
+            for route, date in expired:
+                if processed >= limit:
+                    break
+                raw = self._conn.execute(
+                    f"SELECT id, {RAW_AS_ROLLUP} FROM observations "
+                    "WHERE route = ? AND date = ? LIMIT ?",
+                    (route, date, limit - processed),
+                ).fetchall()
+                self._conn.executemany(
+                    ROLLUP_UPSERT.format(table="daily_prices"),
+                    _fold((row[1:] for row in raw), day_bucket),
+                )
+                self._conn.executemany(
+                    "DELETE FROM observations WHERE id = ?", ((row[0],) for row in raw)
+                )
+                processed += len(raw)
+                if processed >= limit:
+                    break
+
+                hourly = self._conn.execute(
+                    f"SELECT {ROLLUP_COLUMNS} FROM hourly_prices "
+                    "WHERE route = ? AND date = ?",
+                    (route, date),
+                ).fetchall()
+                self._conn.executemany(
+                    ROLLUP_UPSERT.format(table="daily_prices"),
+                    _fold(hourly, day_bucket),
+                )
+                for table in ("hourly_prices", "latest_prices"):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE route = ? AND date = ?",
+                        (route, date),
+                    )
+                processed += len(hourly)
+        return processed
+
+    def route_observations(self, route: str) -> List[Observation]:
+        """查询一条航线的所有明细观察
+
+        Args:
+            route: 航线标识
+
+        Returns:
+            List[Observation]: 按 (日期, 是否直飞, 抓取时间) 排序的观察
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, direct, price, fetched_at FROM observations "
+                "WHERE route = ? ORDER BY date, direct, fetched_at",
+                (route,),
+            ).fetchall()
+        return [
+            (route, date, bool(direct), price, fetched_at)
+            for date, direct, price, fetched_at in rows
+        ]
+
+    def routes(self) -> List[str]:
+        """所有有记录的航线标识"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT route FROM latest_prices ORDER BY route"
+            ).fetchall()
+        return [route for (route,) in rows]
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,166 @@
+"""目标价格订阅索引
+
+用户可以订阅 "某航线某日期的价格降到 ¥900 以下" 这样的绝对目标价格，同一个
+(航线, 日期, 是否直飞) 可以有许多不同目标价格的订阅。每个格子的目标价格保存在
+有序数组中，新价格到来时用二分查找定位被触发的订阅，开销为 O(log n + k)，
+与订阅总数无关：
+- 价格从 last 降到 price：触发目标价格在 [price, last) 内的 "低于" 订阅；
+- 价格从 last 涨到 price：触发目标价格在 (last, price] 内的 "高于" 订阅；
+- 第一次获取价格时，已经满足条件的订阅全部触发。
+
+订阅只在价格穿过目标价格时触发一次，价格回到另一侧后自动重新生效。
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Subscription(NamedTuple):
+    """一个目标价格订阅"""
+
+    sub_id: int  # 订阅编号
+    watch_id: int  # 价格格子的监控编号
+    target: int  # 目标价格
+    below: bool  # True 表示低于目标价格时提醒，False 表示高于时提醒
+    name: str  # 订阅者名称，可以为空
+
+
+class _Book:
+    """一个格子的订阅：按目标价格排序的数组和对应的订阅编号"""
+
+    __slots__ = ("below_targets", "below_ids", "above_targets", "above_ids", "last")
+
+    def __init__(self):
+        self.below_targets: List[int] = []
+        self.below_ids: List[int] = []
+        self.above_targets: List[int] = []
+        self.above_ids: List[int] = []
+        self.last: Optional[int] = None  # 上一次的价格
+
+    def arrays(self, below: bool) -> Tuple[List[int], List[int]]:
+        if below:
+            return self.below_targets, self.below_ids
+        return self.above_targets, self.above_ids
+
+    def __bool__(self) -> bool:
+        return bool(self.below_ids or self.above_ids)
+
+
+class SubscriptionIndex:
+    """按监控编号索引的目标价格订阅（线程安全）"""
+
+    def __init__(self):
+        self._books: Dict[int, _Book] = {}
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(
+        self, watch_id: int, target: int, below: bool = True, name: str = ""
+    ) -> int:
+        """添加订阅
+
+        Args:
+            watch_id: 价格格子的监控编号
+            target: 目标价格
+            below: True 表示价格降到目标价格及以下时提醒，False 表示涨到及以上时提醒
+            name: 订阅者名称
+
+        Returns:
+            int: 订阅编号
+        """
+        if target <= 0:
+            raise ValueError("目标价格必须大于0")
+        with self._lock:
+            sub_id = self._next_id
+            self._next_id += 1
+            self._subscriptions[sub_id] = Subscription(
+                sub_id, watch_id, target, below, name
+            )
+            book = self._books.setdefault(watch_id, _Book())
+            targets, ids = book.arrays(below)
+            index = bisect_right(targets, target)
+            targets.insert(index, target)
+            ids.insert(index, sub_id)
+            return sub_id
+
+    def unsubscribe(self, sub_id: int) -> bool:
+        """取消订阅
+
+        Returns:
+            bool: 订阅是否存在
+        """
+        with self._lock:
+            subscription = self._subscriptions.pop(sub_id, None)
+            if subscription is None:
+                return False
+            book = self._books[subscription.watch_id]
+            targets, ids = book.arrays(subscription.below)
+            index = bisect_left(targets, subscription.target)
+            while ids[index] != sub_id:
+                index += 1
+            del targets[index], ids[index]
+            if not book:
+                del self._books[subscription.watch_id]
+            return True
+
+    def forget(self, watch_id: int) -> int:
+        """删除一个格子的所有订阅，监控编号被释放时调用
+
+        Returns:
+            int: 删除的订阅数
+        """
+        with self._lock:
+            book = self._books.pop(watch_id, None)
+            if book is None:
+                return 0
+            sub_ids = book.below_ids + book.above_ids
+            for sub_id in sub_ids:
+                del self._subscriptions[sub_id]
+            return len(sub_ids)
+
+    def get(self, sub_id: int) -> Optional[Subscription]:
+        """按编号查找订阅"""
+        return self._subscriptions.get(sub_id)
+
+    def evaluate(
+        self, watch_ids: Sequence[int], prices: Sequence[int]
+    ) -> List[Tuple[int, List[Subscription]]]:
+        """用一轮价格检查订阅，记录每个格子的最新价格
+
+        Args:
+            watch_ids: 监控编号
+            prices: 与 watch_ids 一一对应的当前价格，0 表示没有价格
+
+        Returns:
+            List[Tuple[int, List[Subscription]]]: (输入中的位置, 被触发的订阅)，
+                只包含有订阅被触发的格子，顺序与输入一致
+        """
+        triggered = []
+        with self._lock:
+            books = self._books
+            for position, (watch_id, price) in enumerate(zip(watch_ids, prices)):
+                book = books.get(watch_id)
+                if book is None or not price:
+                    continue
+                last = book.last
+                book.last = price
+                if last == price:
+                    continue
+                ids: List[int] = []
+                if book.below_ids and (last is None or price < last):
+                    targets = book.below_targets
+                    high = len(targets) if last is None else bisect_left(targets, last)
+                    ids += book.below_ids[bisect_left(targets, price) : high]
+                if book.above_ids and (last is None or price > last):
+                    targets = book.above_targets
+                    low = 0 if last is None else bisect_right(targets, last)
+                    ids += book.above_ids[low : bisect_right(targets, price)]
+                if ids:
+                    subscriptions = self._subscriptions
+                    triggered.append((position, [subscriptions[i] for i in ids]))
+        return triggered
@@ -0,0 +1,220 @@
+"""携程 lowestPrice 接口的共享传输层
+
+所有入口（命令行、GUI、GitHub Actions）共用一个带连接池的 requests.Session：
+TCP/TLS 连接在多次查询之间保持复用，并可以在下一轮查询开始前提前建立连接。
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flight_engine import normalize_flight_way
+from flight_limiter import get_breaker, get_limiter
+
+logger = logging.getLogger(__name__)
+
+# 常量定义
+BASE_URL = "https://flights.ctrip.com/itinerary/api/12808/lowestPrice?"
+REQUEST_TIMEOUT = 10  # 请求超时时间（秒）
+DEFAULT_POOL_SIZE = 10  # 每个主机保持的最大连接数
+WARMUP_LEAD = 5  # 提前多少秒预热连接
+WARMUP_TIMEOUT = 5  # 预热请求超时时间（秒）
+
+# 请求头，模拟浏览器以避免被拦截
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Referer": "https://flights.ctrip.com/online/list/oneway",
+    "Accept": "application/json, text/plain, */*",
+}
+
+
+class RateLimitedError(ValueError):
+    """接口返回 status == 2（请求过于频繁）"""
+
+
+def build_params(config: dict, direct: bool = True) -> Dict[str, str]:
+    """构建 lowestPrice 接口的请求参数
+
+    Args:
+        config: 配置信息（需包含 flightWay、placeFrom、placeTo）
+        direct: 是否只查询直飞航班
+
+    Returns:
+        Dict[str, str]: 请求参数
+    """
+    params = {
+        "flightWay": normalize_flight_way(config["flightWay"]),
+        "dcity": config["placeFrom"].upper(),
+        "acity": config["placeTo"].upper(),
+        "army": "false",
+        "classType": "ALL",
+        "quantity": "1",
+    }
+    if direct:
+        params["direct"] = "true"
+    return params
+
+
+class CtripTransport:
+    """持有连接池的 HTTP 传输层，线程安全，可被多个抓取线程共享"""
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        headers: Optional[Dict[str, str]] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = REQUEST_TIMEOUT,
+        keep_alive: bool = True,
+    ):
+        """
+        Args:
+            base_url: 接口地址
+            headers: 请求头，默认使用 HEADERS
+            pool_size: 连接池大小，应不小于并发请求数
+            timeout: 默认请求超时时间（秒）
+            keep_alive: 是否保持长连接
+        """
+        if pool_size <= 0:
+            raise ValueError("pool_size 必须是正整数")
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        parts = urlsplit(base_url)
+        self.origin = f"{parts.scheme}://{parts.netloc}/"
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=False
+        )
+        self.session.mount(f"{parts.scheme}://", adapter)
+        self.session.headers.update(headers or HEADERS)
+        self.session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def get(self, params: Dict[str, str], timeout: Optional[float] = None) -> dict:
+        """请求 lowestPrice 接口并返回解析后的 JSON
+
+        Args:
+            params: 请求参数
+            timeout: 本次请求超时时间，默认使用实例配置
+
+        Returns:
+            dict: 接口返回数据
+
+        Raises:
+            requests.exceptions.RequestException: 网络请求失败
+            RateLimitedError: 接口返回 status == 2（ValueError 的子类）
+            ValueError: 接口返回非 JSON 内容
+            flight_limiter.CircuitOpenError: 接口处于熔断状态
+        """
+        # 同一接口地址的所有请求共用熔断器和令牌桶
+        breaker = get_breaker(self.base_url)
+        breaker.before_request()
+        get_limiter(self.base_url).acquire()
+
+        try:
+            response = self.session.get(
+                self.base_url, params=params, timeout=timeout or self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            if data.get("status") == 2:
+                raise RateLimitedError(
+                    f"API返回错误状态: {data.get('msg', '未知错误')}"
+                )
+        except (requests.exceptions.RequestException, ValueError):
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        return data
+
+    def warm_up(self, connections: int = 1) -> int:
+        """预先建立到接口主机的连接，放入连接池供下一轮查询复用
+
+        Args:
+            connections: 需要预热的连接数（不超过连接池大小）
+
+        Returns:
+            int: 成功预热的连接数
+        """
+        connections = max(1, min(connections, self.pool_size))
+        succeeded = []
+
+        def _connect():
+            try:
+                self.session.head(self.origin, timeout=WARMUP_TIMEOUT)
+                succeeded.append(True)
+            except requests.exceptions.RequestException as e:
+                logger.debug(f"连接预热失败: {e}")
+
+        # 并发发起请求，才能在连接池里留下多条连接
+        threads = [threading.Thread(target=_connect) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.debug(f"连接预热完成: {len(succeeded)}/{connections}")
+        return len(succeeded)
+
+    def schedule_warm_up(self, delay: float, connections: int = 1) -> None:
+        """在 delay 秒后于后台预热连接，通常安排在下一轮查询前 WARMUP_LEAD 秒
+
+        Args:
+            delay: 延迟秒数
+            connections: 需要预热的连接数
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(
+                max(0.0, delay), self.warm_up, kwargs={"connections": connections}
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def close(self) -> None:
+        """取消预热任务并关闭连接池
+
+        共享实例关闭后从注册表中移除，之后的 get_shared_transport 会创建新实例，
+        不会拿到已经关闭的连接池。
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with _shared_lock:
+            if _shared_transports.get(self.base_url) is self:
+                del _shared_transports[self.base_url]
+        self.session.close()
+
+
+_shared_transports: Dict[str, CtripTransport] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport(base_url: str = BASE_URL, **kwargs) -> CtripTransport:
+    """获取进程内共享的传输层实例，同一个接口地址只创建一次
+
+    Args:
+        base_url: 接口地址
+        **kwargs: 首次创建时传给 CtripTransport 的参数
+
+    Returns:
+        CtripTransport: 共享实例
+    """
+    with _shared_lock:
+        transport = _shared_transports.get(base_url)
+        if transport is None:
+            transport = CtripTransport(base_url, **kwargs)
+            _shared_transports[base_url] = transport
+        return transport
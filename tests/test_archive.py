@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from flight_archive import (
+    FD_HEADROOM,
+    INITIAL_CAPACITY,
+    PriceArchive,
+    SeriesReader,
+    _SeriesWriter,
+)
+
+BASE = 1_700_000_000
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = _SeriesWriter(str(tmp_path / "series.col"), BASE)
+    yield writer
+    writer.close()
+
+
+def read_runs(path):
+    with SeriesReader(path) as reader:
+        return list(reader.runs_iter())
+
+
+def test_equal_prices_merge_into_one_run(writer):
+    for offset, price in ((0, 500), (60, 500), (120, 500), (180, 450), (240, 500)):
+        assert writer.append(BASE + offset, price)
+    writer.flush()
+    assert read_runs(writer.path) == [
+        (BASE, BASE + 120, 500, 3),
+        (BASE + 180, BASE + 180, 450, 1),
+        (BASE + 240, BASE + 240, 500, 1),
+    ]
+
+
+def test_out_of_order_and_out_of_range_ignored(writer):
+    assert writer.append(BASE + 100, 500)
+    assert not writer.append(BASE + 50, 400)
+    assert not writer.append(BASE - 1, 400)
+    assert not writer.append(BASE + 2**32, 400)
+    assert writer.runs == 1
+
+
+def test_growth_keeps_existing_runs(writer):
+    count = INITIAL_CAPACITY * 2 + 5
+    for index in range(count):
+        writer.append(BASE + index, 100 + index)
+    assert writer.capacity == INITIAL_CAPACITY * 4
+    writer.flush()
+
+    with SeriesReader(writer.path) as reader:
+        assert len(reader) == count
+        assert list(reader.prices) == [100 + index for index in range(count)]
+        assert reader.observation_count() == count
+
+
+def test_reopened_writer_continues_last_run(tmp_path):
+    path = str(tmp_path / "series.col")
+    first = _SeriesWriter(path, BASE)
+    first.append(BASE, 500)
+    first.close()
+
+    second = _SeriesWriter(path, BASE + 999)
+    assert second.base_ts == BASE
+    second.append(BASE + 60, 500)
+    second.close()
+    assert read_runs(path) == [(BASE, BASE + 60, 500, 2)]
+
+
+def test_archive_limits_open_writers(tmp_path):
+    archive = PriceArchive(str(tmp_path), max_writers=2)
+    for day in range(5):
+        archive.append("SHA-JIQ", f"2026110{day}", True, 500, BASE)
+    assert len(archive._writers) == 2
+
+    # 已关闭的序列再次写入时重新打开并继续合并
+    archive.append("SHA-JIQ", "20261100", True, 500, BASE + 60)
+    with archive.open_series("SHA-JIQ", "20261100", True) as reader:
+        assert list(reader.runs_iter()) == [(BASE, BASE + 60, 500, 2)]
+    archive.close()
+    assert len(archive.keys()) == 5
+
+
+def test_writer_cap_limited_by_open_file_limit(monkeypatch, tmp_path):
+    resource = pytest.importorskip("resource")
+    monkeypatch.setattr(resource, "getrlimit", lambda _: (1024, 4096))
+    archive = PriceArchive(str(tmp_path), max_writers=100_000)
+    assert archive.max_writers == 1024 - FD_HEADROOM
+    archive.close()
+
+
+def test_import_history_json_replays_journal(tmp_path):
+    history = tmp_path / "price_history.json"
+    history.write_text(
+        json.dumps({"target_prices": {"20991020": 500}, "no_target_prices": {}}),
+        encoding="utf-8",
+    )
+    (tmp_path / "price_history.journal").write_text(
+        f'[{BASE + 60},"target_prices","20991020",450]\n'
+        f'[{BASE + 120},"no_target_prices","20991020",300]\n'
+        '[1,"target_prices",',
+        encoding="utf-8",
+    )
+    archive = PriceArchive(str(tmp_path / "archive"))
+    assert archive.import_history_json(str(history), "SHA-JIQ") == 3
+
+    # 快照早于日志中的第一条变化
+    with archive.open_series("SHA-JIQ", "20991020", True) as reader:
+        assert list(reader.runs_iter()) == [
+            (BASE + 60, BASE + 60, 500, 1),
+            (BASE + 60, BASE + 60, 450, 1),
+        ]
+    with archive.open_series("SHA-JIQ", "20991020", False) as reader:
+        assert list(reader.runs_iter()) == [(BASE + 120, BASE + 120, 300, 1)]
+    archive.close()
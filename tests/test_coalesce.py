@@ -0,0 +1,81 @@
+from flight_clock import VirtualClock
+from flight_coalesce import AlertCoalescer
+from flight_events import PriceAlert
+
+
+def format_message(date, direct, price, baseline):
+    return f"{date} ¥{baseline} → ¥{price}"
+
+
+def make_coalescer(**kwargs):
+    clock = VirtualClock(0.0)
+    return AlertCoalescer(format_message, clock=clock.time, **kwargs), clock
+
+
+def step(price, baseline, date="20261020"):
+    return PriceAlert("SHA-JIQ-Oneway", date, True, price, baseline, f"¥{price}")
+
+
+def test_flap_within_window_is_suppressed():
+    coalescer, clock = make_coalescer(window=300)
+    coalescer.add([step(450, 500)], price_step=50)
+    clock.sleep(100)
+    coalescer.add([step(500, 450)], price_step=50)
+    assert coalescer.flush() == []
+    clock.sleep(200)
+    assert coalescer.flush() == []
+    stats = coalescer.stats()
+    assert stats["flaps"] == 2
+    assert stats["emitted"] == 0
+    assert stats["pending"] == 0
+
+
+def test_net_change_emitted_once():
+    coalescer, clock = make_coalescer(window=300)
+    coalescer.add([step(450, 500)], price_step=50)
+    coalescer.add([step(400, 450)], price_step=50)
+    clock.sleep(300)
+    [alert] = coalescer.flush()
+    assert (alert.price, alert.baseline) == (400, 500)
+    assert alert.message == "20261020 ¥500 → ¥400"
+    assert coalescer.stats()["coalesced"] == 1
+
+
+def test_single_alert_passes_through_unchanged():
+    coalescer, clock = make_coalescer(window=300)
+    alert = step(450, 500)
+    coalescer.add([alert], price_step=50)
+    clock.sleep(300)
+    assert coalescer.flush() == [alert]
+
+
+def test_first_price_is_never_a_flap():
+    coalescer, clock = make_coalescer(window=300)
+    coalescer.add([step(500, 0), step(510, 500)], price_step=50)
+    clock.sleep(300)
+    [alert] = coalescer.flush()
+    assert (alert.price, alert.baseline) == (510, 0)
+
+
+def test_target_alerts_not_treated_as_flaps():
+    coalescer, clock = make_coalescer(window=300)
+    alert = step(470, 480)._replace(kind="target")
+    coalescer.add([alert], price_step=50)
+    clock.sleep(300)
+    assert coalescer.flush() == [alert]
+
+
+def test_hourly_cap_defers_and_keeps_merging():
+    coalescer, clock = make_coalescer(window=0, max_per_hour=1)
+    coalescer.add(
+        [step(450, 500), step(700, 800, date="20261021")], price_step=50
+    )
+    assert [alert.date for alert in coalescer.flush()] == ["20261020"]
+    assert coalescer.stats()["capped"] == 1
+    assert coalescer.seconds_until_flush() == 3600
+
+    # 推迟期间的后续变化继续合并到同一条提醒
+    coalescer.add([step(600, 700, date="20261021")], price_step=50)
+    clock.sleep(3600)
+    [alert] = coalescer.flush()
+    assert (alert.date, alert.price, alert.baseline) == ("20261021", 600, 800)
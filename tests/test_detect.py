@@ -0,0 +1,105 @@
+import pytest
+
+import flight_detect
+from flight_detect import CalendarChange, Change, ChangeDetector, detect_calendar
+
+BACKENDS = [
+    False,
+    pytest.param(
+        True,
+        marks=pytest.mark.skipif(flight_detect.np is None, reason="需要 numpy"),
+    ),
+]
+
+
+@pytest.fixture(params=BACKENDS, ids=["python", "numpy"])
+def detector(request):
+    return ChangeDetector(use_numpy=request.param)
+
+
+def test_first_price_always_reported(detector):
+    a = detector.watch(("R", "20261020", True), 50)
+    b = detector.watch(("R", "20261020", False), 50)
+    assert detector.detect([a, b], [500, 0]) == [Change(a, 500, 0)]
+    assert detector.get_baseline(("R", "20261020", True)) == 500
+    assert detector.get_baseline(("R", "20261020", False)) == 0
+
+
+def test_only_changes_reaching_step_are_reported(detector):
+    a = detector.watch(("R", "20261020", True), 50)
+    detector.detect([a], [500])
+    assert detector.detect([a], [549]) == []
+    assert detector.detect([a], [450]) == [Change(a, 450, 500)]
+    # 未达到阈值的价格不会移动基准价格
+    assert detector.detect([a], [420]) == []
+    assert detector.get_baseline(("R", "20261020", True)) == 450
+
+
+def test_watch_updates_step_and_keeps_id(detector):
+    a = detector.watch(("R", "20261020", True), 50)
+    detector.detect([a], [500])
+    assert detector.watch(("R", "20261020", True), 10) == a
+    assert detector.detect([a], [510]) == [Change(a, 510, 500)]
+
+
+def test_forget_releases_id_for_reuse(detector):
+    a = detector.watch(("R", "20261020", True), 50)
+    detector.detect([a], [500])
+    assert detector.forget(("R", "20261020", True)) == a
+    assert detector.forget(("R", "20261020", True)) is None
+    assert len(detector) == 0
+
+    b = detector.watch(("R", "20261021", True), 50)
+    assert b == a
+    assert detector.series(b) == ("R", "20261021", True)
+    # 重新分配的编号从零基准开始，不继承之前的价格
+    assert detector.detect([b], [900]) == [Change(b, 900, 0)]
+
+
+def test_grows_past_initial_capacity(detector):
+    count = flight_detect.INITIAL_CAPACITY + 10
+    ids = [detector.watch(("R", str(i), True), 50) for i in range(count)]
+    changes = detector.detect(ids, [100 + i for i in range(count)])
+    assert len(changes) == count
+    assert detector.baselines()[("R", str(count - 1), True)] == 100 + count - 1
+
+
+def test_set_baseline_restores_price(detector):
+    series = ("R", "20261020", True)
+    assert not detector.set_baseline(series, 500)
+    a = detector.watch(series, 50)
+    assert detector.set_baseline(series, 500)
+    assert detector.detect([a], [520]) == []
+
+
+def test_backends_agree():
+    if flight_detect.np is None:
+        pytest.skip("需要 numpy")
+    rounds = [[500, 0, 300], [520, 700, 200], [440, 760, 0], [445, 0, 260]]
+    results = []
+    for use_numpy in (False, True):
+        detector = ChangeDetector(use_numpy=use_numpy)
+        ids = [detector.watch(("R", str(i), True), 50) for i in range(3)]
+        results.append([detector.detect(ids, prices) for prices in rounds])
+    assert results[0] == results[1]
+
+
+def test_length_mismatch_rejected(detector):
+    with pytest.raises(ValueError):
+        detector.detect([0, 1], [100])
+
+
+def test_detect_calendar_orders_by_date_then_direct(detector):
+    dates = ["20261020", "20261021"]
+    changes = detect_calendar(
+        detector, "R", dates, {"20261020": 500}, {"20261020": 400, "20261021": 300}, 50
+    )
+    assert changes == [
+        CalendarChange("20261020", True, 500, 0),
+        CalendarChange("20261020", False, 400, 0),
+        CalendarChange("20261021", False, 300, 0),
+    ]
+    # 缺失的价格不提醒，也不清空已有的基准价格
+    changes = detect_calendar(detector, "R", dates, {}, {"20261020": 340}, 50)
+    assert changes == [CalendarChange("20261020", False, 340, 400)]
+    assert detector.get_baseline(("R", "20261020", True)) == 500
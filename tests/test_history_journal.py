@@ -0,0 +1,77 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "GitHub",
+    "flight_alert_action.py",
+)
+
+
+@pytest.fixture
+def action(tmp_path, monkeypatch):
+    """加载 GitHub Actions 脚本，历史文件写在临时目录下"""
+    spec = importlib.util.spec_from_file_location("flight_alert_action", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.chdir(tmp_path)
+    return module
+
+
+def history(target=None, no_target=None):
+    return {
+        "target_prices": dict(target or {}),
+        "no_target_prices": dict(no_target or {}),
+    }
+
+
+def test_changes_round_trip_through_journal(action):
+    baseline = action.load_history()
+    assert baseline == history()
+
+    current = history({"20991020": 500}, {"20991020": 420})
+    action.save_history(current, baseline)
+    assert action.load_history() == current
+
+    updated = history({"20991020": 450}, {"20991020": 420})
+    action.save_history(updated, current)
+    assert action.load_history() == updated
+    # 只追加有变化的价格
+    with open(action.JOURNAL_FILE, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_no_changes_leave_journal_untouched(action):
+    current = history({"20991020": 500})
+    action.save_history(current, current)
+    assert not os.path.exists(action.JOURNAL_FILE)
+
+
+def test_torn_last_line_is_skipped_and_repaired(action):
+    action.save_history(history({"20991020": 500}), history())
+    with open(action.JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write('[1,"target_prices","20991021",')
+    assert action.load_history() == history({"20991020": 500})
+
+    action.save_history(history({"20991020": 480}), history({"20991020": 500}))
+    assert action.load_history() == history({"20991020": 480})
+
+
+def test_compact_writes_snapshot_and_prunes_past_dates(action):
+    action.save_history(history({"20000101": 300, "20991020": 500}), history())
+    action.compact_history(action.load_history(), "Asia/Shanghai")
+
+    assert os.path.getsize(action.JOURNAL_FILE) == 0
+    with open(action.HISTORY_FILE, encoding="utf-8") as f:
+        assert json.load(f) == history({"20991020": 500})
+    assert action.load_history() == history({"20991020": 500})
+
+
+def test_compact_triggered_by_threshold(action, monkeypatch):
+    monkeypatch.setattr(action, "COMPACT_THRESHOLD", 2)
+    action.save_history(history({"20991020": 500, "20991021": 600}), history())
+    assert os.path.getsize(action.JOURNAL_FILE) == 0
+    assert action.load_history() == history({"20991020": 500, "20991021": 600})
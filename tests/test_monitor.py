@@ -0,0 +1,93 @@
+import logging
+
+from flight_alert import FlightMonitor
+from flight_cache import STALE_KEY
+from flight_clock import VirtualClock
+from flight_retention import DEFAULT_HOURLY_DAYS, DEFAULT_RAW_DAYS
+
+DATES = ["20991020", "20991021"]
+
+
+def calendar(prices):
+    return {"status": 0, "data": {"oneWayPrice": [dict(zip(DATES, prices))]}}
+
+
+def make_monitor(**config):
+    clock = VirtualClock(1_700_000_000.0)
+    monitor = FlightMonitor(
+        {
+            "dateToGo": DATES,
+            "flightWay": "Oneway",
+            "sleepTime": 600,
+            "priceStep": 50,
+            "routes": [
+                {"placeFrom": "SHA", "placeTo": "JIQ"},
+                {"placeFrom": "PEK", "placeTo": "CAN"},
+            ],
+            **config,
+        },
+        clock=clock.time,
+        sleep=clock.sleep,
+    )
+    return monitor, clock
+
+
+def serve(monitor, prices):
+    """用固定的价格日历代替并发抓取，prices 为 {(航线, 是否直飞): [各日期价格]}"""
+    monitor.engine.fetch_all = lambda due: (
+        {key: calendar(values) for key, values in prices.items()},
+        {},
+    )
+
+
+def test_every_route_compared_and_stored_with_history_db(tmp_path):
+    monitor, _ = make_monitor(historyDb=str(tmp_path / "history.db"))
+    try:
+        routes = list(monitor.routes.values())
+        serve(
+            monitor,
+            {
+                (route_key, direct): [500, 600]
+                for route_key in monitor.routes
+                for direct in (True, False)
+            },
+        )
+        alerts, ok_routes = monitor.run_cycle(routes)
+        assert sorted(ok_routes) == sorted(monitor.routes)
+        assert len(alerts) == 8
+        for route_key in monitor.routes:
+            assert len(monitor.store.latest_prices(route_key)) == 4
+    finally:
+        monitor.close()
+
+
+def test_stale_cache_data_is_shown_but_not_compared(tmp_path, caplog):
+    monitor, _ = make_monitor(historyDb=str(tmp_path / "history.db"))
+    try:
+        routes = list(monitor.routes.values())
+        monitor.engine.fetch_all = lambda due: (
+            {
+                (route_key, direct): {**calendar([500, 600]), STALE_KEY: True}
+                for route_key in monitor.routes
+                for direct in (True, False)
+            },
+            {},
+        )
+        caplog.set_level(logging.INFO)
+        alerts, ok_routes = monitor.run_cycle(routes)
+        assert (alerts, ok_routes) == ([], [])
+        assert monitor.store.routes() == []
+        assert "2099-10-20 - 直飞: ¥500, 非直飞: ¥500（缓存）" in caplog.messages
+    finally:
+        monitor.close()
+
+
+def test_retention_enabled_with_history_db_by_default(tmp_path):
+    monitor, _ = make_monitor()
+    assert monitor.retention is None
+    monitor, _ = make_monitor(historyDb=str(tmp_path / "history.db"))
+    try:
+        assert monitor.retention.raw_days == DEFAULT_RAW_DAYS
+        assert monitor.retention.hourly_days == DEFAULT_HOURLY_DAYS
+    finally:
+        monitor.close()
@@ -0,0 +1,68 @@
+import smtplib
+
+import pytest
+
+import flight_mailer
+from flight_notifiers import EmailNotifier
+
+CONFIG = {
+    "email_sender": "sender@example.com",
+    "email_password": "secret",
+    "email_receiver": "receiver@example.com",
+    "smtp_server": "smtp.example.invalid",
+    "smtp_port": 465,
+}
+
+
+class FakeSocket:
+    def __init__(self, timeout):
+        self.timeouts = [timeout]
+
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+
+class FakeSMTP:
+    """记录超时设置的 SMTP_SSL 替身"""
+
+    connections = []
+
+    def __init__(self, server, port, timeout):
+        self.sock = FakeSocket(timeout)
+        self.sent = 0
+        FakeSMTP.connections.append(self)
+
+    def login(self, sender, password):
+        pass
+
+    def noop(self):
+        return (250, b"OK")
+
+    def sendmail(self, sender, recipients, raw):
+        self.sent += 1
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_smtp(monkeypatch):
+    FakeSMTP.connections = []
+    monkeypatch.setattr(smtplib, "SMTP_SSL", FakeSMTP)
+    yield
+    flight_mailer.close_shared_mailers()
+
+
+def test_email_uses_channel_timeout():
+    EmailNotifier(CONFIG, timeout=3.0, retries=0).send("标题", "正文")
+    [connection] = FakeSMTP.connections
+    assert connection.sock.timeouts[0] == 3.0
+    assert connection.sent == 1
+
+
+def test_reused_session_takes_each_channel_timeout():
+    EmailNotifier(CONFIG, timeout=3.0, retries=0).send("标题", "正文")
+    EmailNotifier(CONFIG, timeout=7.0, retries=0).send("标题", "正文")
+    [connection] = FakeSMTP.connections
+    assert connection.sock.timeouts[-1] == 7.0
+    assert connection.sent == 2
@@ -0,0 +1,83 @@
+import pytest
+
+from flight_clock import VirtualClock
+from flight_events import PriceAlert
+from flight_outbox import Outbox
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(1_000_000.0)
+
+
+@pytest.fixture
+def outbox(tmp_path, clock):
+    outbox = Outbox(str(tmp_path / "outbox.db"), clock=clock.time)
+    yield outbox
+    outbox.close()
+
+
+def step(price, baseline, date="20261020"):
+    return PriceAlert("SHA-JIQ-Oneway", date, True, price, baseline, f"¥{price}")
+
+
+def test_duplicate_alert_stored_once(outbox):
+    assert outbox.enqueue([step(450, 500)]) == 1
+    assert outbox.enqueue([step(450, 500)]) == 0
+    assert outbox.pending_count() == 1
+
+
+def test_repeated_real_moves_are_not_deduped(outbox):
+    # A→B→A→B：两次 A→B 是不同的价格变化
+    moves = [step(450, 500), step(500, 450), step(450, 500), step(500, 450)]
+    for alert in moves:
+        assert outbox.enqueue([alert]) == 1
+    assert outbox.pending_count() == 4
+
+
+def test_target_alerts_deduped_without_generation(outbox):
+    alert = step(450, 480)._replace(kind="target")
+    assert outbox.enqueue([alert]) == 1
+    assert outbox.enqueue([alert]) == 0
+
+
+def test_dedupe_window_expires(tmp_path, clock):
+    outbox = Outbox(str(tmp_path / "outbox.db"), dedupe_window=60, clock=clock.time)
+    alert = step(450, 500)._replace(kind="target")
+    assert outbox.enqueue([alert]) == 1
+    clock.sleep(61)
+    assert outbox.enqueue([alert]) == 1
+    outbox.close()
+
+
+def test_baselines_restored_after_reopen(tmp_path, clock):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, clock=clock.time)
+    outbox.enqueue([step(500, 0), step(450, 500), step(800, 0, date="20261021")])
+    # 目标价格提醒不改变基准价格
+    outbox.enqueue([step(300, 400)._replace(kind="target")])
+    outbox.close()
+
+    reopened = Outbox(path, clock=clock.time)
+    assert reopened.baselines() == {
+        ("SHA-JIQ-Oneway", "20261020", True): 450,
+        ("SHA-JIQ-Oneway", "20261021", True): 800,
+    }
+    assert reopened.pending_count() == 4
+    reopened.close()
+
+
+def test_claim_ack_and_retry(outbox, clock):
+    outbox.enqueue([step(450, 500), step(800, 0, date="20261021")])
+    claimed = outbox.claim()
+    assert [alert.price for _, alert in claimed] == [450, 800]
+    # 租约期内不会被再次取出
+    assert outbox.claim() == []
+
+    first, second = (entry_id for entry_id, _ in claimed)
+    outbox.ack([first])
+    outbox.fail([second], "timeout")
+    assert outbox.pending_count() == 1
+    assert outbox.seconds_until_due() == outbox.base_delay
+    clock.sleep(outbox.base_delay)
+    assert [entry_id for entry_id, _ in outbox.claim()] == [second]
@@ -0,0 +1,60 @@
+import pytest
+
+from flight_outlier import OutlierFilter
+
+
+def feed(outlier, prices, watch_id=0):
+    """逐轮送入一个序列的价格，返回每轮过滤后的价格"""
+    return [outlier.filter([watch_id], [price])[0][0] for price in prices]
+
+
+def test_transient_spike_is_dropped():
+    outlier = OutlierFilter()
+    assert feed(outlier, [500, 510, 505, 1, 508]) == [500, 510, 505, 0, 508]
+    assert outlier.stats() == {"held": 1, "confirmed": 0, "rejected": 1}
+
+
+def test_confirmed_level_shift_passes_through():
+    outlier = OutlierFilter()
+    assert feed(outlier, [500, 510, 505, 900, 905, 910]) == [
+        500,
+        510,
+        505,
+        0,
+        905,
+        910,
+    ]
+    assert outlier.stats()["confirmed"] == 1
+
+
+def test_small_moves_are_not_suspicious():
+    outlier = OutlierFilter()
+    prices = [500, 500, 500, 500, 560, 600]
+    assert feed(outlier, prices) == prices
+
+
+def test_spike_followed_by_another_spike_is_held_again():
+    outlier = OutlierFilter()
+    assert feed(outlier, [500, 505, 510, 1, 9999]) == [500, 505, 510, 0, 0]
+    assert outlier.stats() == {"held": 2, "confirmed": 0, "rejected": 1}
+
+
+def test_series_are_independent_and_missing_prices_skipped():
+    outlier = OutlierFilter()
+    for prices in ([500, 300], [505, 305], [510, 0], [1, 310]):
+        filtered, held = outlier.filter([0, 1], prices)
+    assert filtered == [0, 310]
+    assert held == [0]
+
+
+def test_forget_clears_window():
+    outlier = OutlierFilter()
+    feed(outlier, [500, 505, 510])
+    outlier.forget(0)
+    # 窗口清空后重新积累样本，不会把新序列的价格当作异常
+    assert feed(outlier, [9000, 9100, 9050]) == [9000, 9100, 9050]
+
+
+def test_window_must_hold_min_samples():
+    with pytest.raises(ValueError):
+        OutlierFilter(window=2)
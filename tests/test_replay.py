@@ -0,0 +1,94 @@
+import pytest
+
+from flight_alert import FlightMonitor, get_route_key, replay_config
+from flight_clock import VirtualClock
+from flight_replay import ReplayedError, ResponseRecorder, ResponseReplayer
+from flight_transport import RateLimitedError
+
+ROUTE = {"placeFrom": "SHA", "placeTo": "JIQ", "flightWay": "Oneway"}
+START = 1_700_000_000.0
+
+
+def calendar(price):
+    return {"status": 0, "data": {"oneWayPrice": [{"20991020": price}]}}
+
+
+def record(directory, rounds):
+    """在虚拟时钟下录制几轮查询，rounds 为每轮的价格或要抛出的异常"""
+    clock = VirtualClock(START)
+    recorder = ResponseRecorder(str(directory), clock=clock.time)
+    for outcome in rounds:
+        recorder.start_cycle([get_route_key(ROUTE)])
+
+        def fetch(config, direct=True):
+            if isinstance(outcome, Exception):
+                raise outcome
+            return calendar(outcome)
+
+        for direct in (True, False):
+            try:
+                recorder.wrap(fetch)(ROUTE, direct)
+            except Exception:
+                pass
+        clock.sleep(600)
+    recorder.close()
+
+
+def test_recorded_error_type_is_restored(tmp_path):
+    record(tmp_path, [RateLimitedError("限流")])
+    replayer = ResponseReplayer(str(tmp_path), speed=0)
+    for _ in replayer.cycles():
+        with pytest.raises(RateLimitedError):
+            replayer.fetch(ROUTE)
+    with pytest.raises(ReplayedError):
+        replayer.fetch({**ROUTE, "placeTo": "PEK"})
+
+
+def test_replay_runs_on_recorded_time(tmp_path):
+    record(tmp_path / "rec", [500, 400])
+    replayer = ResponseReplayer(str(tmp_path / "rec"), speed=0)
+    assert replayer.start_time() == START
+
+    clock = VirtualClock(replayer.start_time())
+    monitor = FlightMonitor(
+        {
+            "dateToGo": ["20991020"],
+            "sleepTime": 600,
+            "priceStep": 50,
+            "historyDb": str(tmp_path / "history.db"),
+            **ROUTE,
+        },
+        replayer=replayer,
+        clock=clock.time,
+        sleep=clock.sleep,
+    )
+    try:
+        monitor.replay()
+        assert clock.time() == START + 600
+        observations = monitor.store.route_observations(get_route_key(ROUTE))
+        assert sorted({fetched_at for *_, fetched_at in observations}) == [
+            START,
+            START + 600,
+        ]
+    finally:
+        monitor.close()
+
+
+def test_replay_config_drops_channels_and_persistence():
+    config = {
+        "email_sender": "a@example.com",
+        "SCKEY": "token",
+        "webhookUrl": "http://example.invalid",
+        "historyDb": "history.db",
+        "outboxDb": "outbox.db",
+        "archiveDir": "archive",
+        "priceStep": 50,
+    }
+    assert replay_config(config) == {"priceStep": 50}
+    assert replay_config(config, notify=True, persist=True) == config
+    assert set(replay_config(config, persist=True)) == {
+        "historyDb",
+        "outboxDb",
+        "archiveDir",
+        "priceStep",
+    }
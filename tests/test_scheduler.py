@@ -0,0 +1,64 @@
+from flight_clock import VirtualClock
+from flight_scheduler import WatchScheduler
+
+
+def make_scheduler():
+    clock = VirtualClock(0.0)
+    return WatchScheduler(clock=clock.time), clock
+
+
+def test_retry_keeps_next_regular_poll():
+    scheduler, clock = make_scheduler()
+    scheduler.add("a", 600)
+    assert scheduler.pop_due() == ["a"]
+
+    scheduler.retry_in("a", 30)
+    assert scheduler.next_due() == 30
+    clock.sleep(30)
+    assert scheduler.pop_due() == ["a"]
+    assert scheduler.next_due() == 600
+
+
+def test_repeated_retries_keep_alignment():
+    scheduler, clock = make_scheduler()
+    scheduler.add("a", 600)
+    scheduler.pop_due()
+    for _ in range(3):
+        scheduler.retry_in("a", 30)
+        clock.sleep(30)
+        assert scheduler.pop_due() == ["a"]
+    assert scheduler.next_due() == 600
+
+
+def test_retry_past_next_slot_skips_missed_period():
+    scheduler, clock = make_scheduler()
+    scheduler.add("a", 600)
+    scheduler.pop_due()
+    scheduler.retry_in("a", 700)
+    clock.sleep(700)
+    assert scheduler.pop_due() == ["a"]
+    assert scheduler.next_due() == 1200
+
+
+def test_deferral_does_not_delay_other_watches():
+    scheduler, clock = make_scheduler()
+    scheduler.add("a", 600)
+    scheduler.add("b", 300)
+    assert sorted(scheduler.pop_due()) == ["a", "b"]
+    # 预算不足时推迟 a，b 按原节奏到期
+    scheduler.retry_in("a", 120)
+    clock.sleep(120)
+    assert scheduler.pop_due() == ["a"]
+    clock.sleep(180)
+    assert scheduler.pop_due() == ["b"]
+    clock.sleep(300)
+    assert sorted(scheduler.pop_due()) == ["a", "b"]
+
+
+def test_missed_periods_popped_once():
+    scheduler, clock = make_scheduler()
+    scheduler.add("a", 600)
+    scheduler.pop_due()
+    clock.sleep(2000)
+    assert scheduler.pop_due() == ["a"]
+    assert scheduler.next_due() == 2400
@@ -0,0 +1,18 @@
+from flight_transport import CtripTransport, get_shared_transport
+
+
+def test_closed_shared_transport_is_replaced():
+    transport = get_shared_transport("http://example.invalid/api")
+    assert get_shared_transport("http://example.invalid/api") is transport
+
+    transport.close()
+    replacement = get_shared_transport("http://example.invalid/api")
+    assert replacement is not transport
+    replacement.close()
+
+
+def test_closing_private_transport_keeps_shared_one():
+    shared = get_shared_transport("http://example.invalid/other")
+    CtripTransport("http://example.invalid/other").close()
+    assert get_shared_transport("http://example.invalid/other") is shared
+    shared.close()